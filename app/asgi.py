@@ -10,6 +10,7 @@ from fastapi.staticfiles import StaticFiles
 from loguru import logger
 
 from app.config import config
+from app.controllers.media import MediaStaticFiles
 from app.models.exception import HttpException
 from app.router import root_api_router
 from app.utils import utils
@@ -65,7 +66,7 @@ app.add_middleware(
 
 task_dir = utils.task_dir()
 app.mount(
-    "/tasks", StaticFiles(directory=task_dir, html=True, follow_symlink=True), name=""
+    "/tasks", MediaStaticFiles(directory=task_dir, html=True, follow_symlink=True), name=""
 )
 
 public_dir = utils.public_dir()
@@ -80,3 +81,8 @@ def shutdown_event():
 @app.on_event("startup")
 def startup_event():
     logger.info("startup event")
+    # with a worker fleet, tasks lost with their worker are requeued by the fleet
+    if config.app.get("resume_interrupted_tasks", False) and not config.app.get("redis_worker_fleet", False):
+        from app.controllers.v1 import video
+
+        video.resume_interrupted_tasks()
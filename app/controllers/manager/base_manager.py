@@ -1,47 +1,147 @@
 import threading
-from typing import Any, Callable, Dict
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
 import traceback
 
 from loguru import logger
 
+from app.config import config
+from app.controllers.manager.worker_pool import WorkerPool
 # Late import to avoid circulars at module import time
 from app.models import const
 from app.services import state as sm
 
+# Task lanes, most urgent first. Queued tasks run in lane order, except that
+# every task_aging_seconds spent waiting moves a task up one lane, so batch
+# work is never starved. interactive_slots of the concurrent slots only run
+# interactive lanes, so a preview does not wait for a long render to end.
+LANE_PREVIEW = "preview"
+LANE_RENDER = "render"
+LANE_VIDEO = "video"
+LANE_BATCH = "batch"
+LANES = [LANE_PREVIEW, LANE_RENDER, LANE_VIDEO, LANE_BATCH]
+INTERACTIVE_LANES = {LANE_PREVIEW}
+
+
+def lane_rank(task: Dict, now: float) -> float:
+    """Scheduling rank of a queued task, lower runs first."""
+    lane = task.get("lane", LANE_VIDEO)
+    rank = LANES.index(lane) if lane in LANES else len(LANES)
+    try:
+        aging = float(config.app.get("task_aging_seconds", 120) or 0)
+    except Exception:
+        aging = 120.0
+    if aging > 0:
+        rank -= (now - task.get("enqueued_at", now)) / aging
+    return rank
+
+
+def schedule_order(tasks: List[Dict]) -> List[Dict]:
+    """Queued tasks in the order they will run, oldest first within a rank."""
+    now = time.time()
+    return sorted(tasks, key=lambda t: (lane_rank(t, now), t.get("enqueued_at", now)))
+
+
+def reserved_slots(max_concurrent_tasks: int) -> int:
+    """Slots only interactive lanes may use; at least one slot stays open to the rest."""
+    try:
+        reserved = int(config.app.get("interactive_slots", 1) or 0)
+    except Exception:
+        reserved = 1
+    return max(0, min(reserved, max_concurrent_tasks - 1))
+
+
+def position_updates(tasks: List[Dict], reported: Dict[str, int] = None) -> List[Tuple[str, Dict]]:
+    """(task_id, fields) setting the lane and 1-based queue position of each scheduled task.
+
+    reported maps task ids to the positions already recorded, which are
+    skipped; it is updated with the new ones.
+    """
+    updates = []
+    for position, task in enumerate(tasks, start=1):
+        task_id = task.get("kwargs", {}).get("task_id")
+        if not task_id or (reported is not None and reported.get(task["id"]) == position):
+            continue
+        updates.append((task_id, {"lane": task.get("lane", LANE_VIDEO), "queue_position": position}))
+        if reported is not None:
+            reported[task["id"]] = position
+    return updates
+
+
+def report_positions(tasks: List[Dict], reported: Dict[str, int] = None):
+    """Record lane and queue position in the state of each scheduled task, see position_updates."""
+    for task_id, fields in position_updates(tasks, reported):
+        sm.state.update_task_fields(task_id, **fields)
+
 
 class TaskManager:
-    def __init__(self, max_concurrent_tasks: int):
+    # True when tasks run on other nodes and add_task only enqueues them
+    distributed = False
+
+    def __init__(self, max_concurrent_tasks: int, executor: str = "thread"):
         self.max_concurrent_tasks = max_concurrent_tasks
         self.current_tasks = 0
+        self.interactive_tasks = 0
         self.lock = threading.Lock()
         self.queue = self.create_queue()
+        # tasks a caller waits for through run(), never handed to another process
+        self.attached = []
+        self.positions = {}
+        # (task_id, fields, task to start or None) waiting for _flush
+        self._pending = []
+        self._flush_lock = threading.Lock()
+        # "process" runs each task in one of max_concurrent_tasks warm worker
+        # processes; the thread started per task only waits for its worker
+        self.pool = WorkerPool(max_concurrent_tasks) if executor == "process" else None
 
     def create_queue(self):
         raise NotImplementedError()
 
-    def add_task(self, func: Callable, *args: Any, **kwargs: Any):
+    def add_task(self, func: Callable, *args: Any, lane: str = LANE_VIDEO, **kwargs: Any):
+        """Queue func(*args, **kwargs) in lane; it starts as soon as the lane gets a slot."""
+        task = self._task(func, args, kwargs, lane)
+        with self.lock:
+            logger.info(f"enqueue task: {func.__name__}, lane: {lane}, current_tasks: {self.current_tasks}")
+            self.enqueue(task)
+        self.check_queue()
+
+    def run(self, func: Callable, *args: Any, lane: str = LANE_VIDEO, **kwargs: Any):
+        """Like add_task, but wait for the task and return its result or raise its error."""
+        task = self._task(func, args, kwargs, lane)
+        task["future"] = Future()
         with self.lock:
-            if self.current_tasks < self.max_concurrent_tasks:
-                print(f"add task: {func.__name__}, current_tasks: {self.current_tasks}")
-                self.execute_task(func, *args, **kwargs)
-            else:
-                print(
-                    f"enqueue task: {func.__name__}, current_tasks: {self.current_tasks}"
-                )
-                self.enqueue({"func": func, "args": args, "kwargs": kwargs})
-
-    def execute_task(self, func: Callable, *args: Any, **kwargs: Any):
+            self.attached.append(task)
+        self.check_queue()
+        return task["future"].result()
+
+    @staticmethod
+    def _task(func: Callable, args, kwargs, lane: str) -> Dict:
+        return {
+            "id": uuid.uuid4().hex,
+            "func": func,
+            "args": args,
+            "kwargs": kwargs,
+            "lane": lane,
+            "enqueued_at": time.time(),
+        }
+
+    def execute_task(self, task: Dict):
+        func = task["func"]
+        if self.pool:
+            func = self.pool.wrap(func)
         thread = threading.Thread(
-            target=self.run_task, args=(func, *args), kwargs=kwargs
+            target=self.run_task, args=(task, func, *task.get("args", ())), kwargs=task.get("kwargs", {})
         )
         thread.start()
 
-    def run_task(self, func: Callable, *args: Any, **kwargs: Any):
+    def run_task(self, task: Dict, func: Callable, *args: Any, **kwargs: Any):
+        result, error = None, None
         try:
-            with self.lock:
-                self.current_tasks += 1
-            func(*args, **kwargs)  # call the function here, passing *args and **kwargs.
+            result = func(*args, **kwargs)  # call the function here, passing *args and **kwargs.
         except Exception as e:
+            error = e
             # Ensure failures are reflected in task state so UI can react
             task_id = kwargs.get("task_id") if isinstance(kwargs, dict) else None
             tb = traceback.format_exc()
@@ -57,29 +157,93 @@ class TaskManager:
                 except Exception as inner:
                     logger.error(f"Failed to update task state for {task_id}: {inner}")
         finally:
-            self.task_done()
+            self.task_done(task)
+            # the waiting caller resumes once the slot is free again
+            future = task.get("future")
+            if future and error:
+                future.set_exception(error)
+            elif future:
+                future.set_result(result)
+
+    def _has_slot(self, lane: str) -> bool:
+        if self.current_tasks >= self.max_concurrent_tasks:
+            return False
+        if lane in INTERACTIVE_LANES:
+            return True
+        other_tasks = self.current_tasks - self.interactive_tasks
+        return other_tasks < self.max_concurrent_tasks - reserved_slots(self.max_concurrent_tasks)
 
     def check_queue(self):
+        """Start queued tasks in schedule order while slots are free.
+
+        Slots are taken under self.lock, but the state writes and task starts
+        that follow run after it is released (see _flush), so a slow state
+        backend does not hold up other enqueues and completions.
+        """
         with self.lock:
-            if (
-                self.current_tasks < self.max_concurrent_tasks
-                and not self.is_queue_empty()
-            ):
-                task_info = self.dequeue()
-                func = task_info["func"]
-                args = task_info.get("args", ())
-                kwargs = task_info.get("kwargs", {})
-                self.execute_task(func, *args, **kwargs)
-
-    def task_done(self):
+            waiting = schedule_order(self.attached + self.queued())
+            started = []
+            for task in waiting:
+                if self.current_tasks >= self.max_concurrent_tasks:
+                    break
+                if not self._has_slot(task["lane"]):
+                    continue
+                if task in self.attached:
+                    self.attached.remove(task)
+                elif not self.claim(task):
+                    # taken by another API process sharing the queue
+                    started.append(task)
+                    continue
+                self.current_tasks += 1
+                if task["lane"] in INTERACTIVE_LANES:
+                    self.interactive_tasks += 1
+                started.append(task)
+                fields = {"state": const.TASK_STATE_PROCESSING, "progress": 0, "lane": task["lane"], "queue_position": 0}
+                self._pending.append((task.get("kwargs", {}).get("task_id"), fields, task))
+            waiting = [t for t in waiting if t not in started]
+            self.positions = {t["id"]: self.positions[t["id"]] for t in waiting if t["id"] in self.positions}
+            self._pending += [(task_id, fields, None) for task_id, fields in position_updates(waiting, self.positions)]
+        self._flush()
+
+    def _flush(self):
+        """Write pending task states and start pending tasks, in the order they were queued.
+
+        One thread flushes at a time, so a later position never lands before
+        an earlier one; when this returns, everything queued before the call
+        has been written.
+        """
+        with self._flush_lock:
+            while True:
+                with self.lock:
+                    pending, self._pending = self._pending, []
+                if not pending:
+                    return
+                for task_id, fields, task in pending:
+                    if task_id:
+                        try:
+                            sm.state.update_task_fields(task_id, **fields)
+                        except Exception as e:
+                            logger.error(f"failed to update task state for {task_id}: {str(e)}")
+                    # the state is written first, so the task's own updates come after it
+                    if task:
+                        self.execute_task(task)
+
+    def task_done(self, task: Dict):
         with self.lock:
             self.current_tasks -= 1
+            if task["lane"] in INTERACTIVE_LANES:
+                self.interactive_tasks -= 1
         self.check_queue()
 
     def enqueue(self, task: Dict):
         raise NotImplementedError()
 
-    def dequeue(self):
+    def queued(self) -> List[Dict]:
+        """Tasks waiting in the queue, in any order."""
+        raise NotImplementedError()
+
+    def claim(self, task: Dict) -> bool:
+        """Take task out of the queue; False when it is no longer there."""
         raise NotImplementedError()
 
     def is_queue_empty(self):
@@ -1,18 +1,23 @@
-from queue import Queue
-from typing import Dict
+from typing import Dict, List
 
 from app.controllers.manager.base_manager import TaskManager
 
 
 class InMemoryTaskManager(TaskManager):
     def create_queue(self):
-        return Queue()
+        return []
 
     def enqueue(self, task: Dict):
-        self.queue.put(task)
+        self.queue.append(task)
 
-    def dequeue(self):
-        return self.queue.get()
+    def queued(self) -> List[Dict]:
+        return list(self.queue)
+
+    def claim(self, task: Dict) -> bool:
+        if task not in self.queue:
+            return False
+        self.queue.remove(task)
+        return True
 
     def is_queue_empty(self):
-        return self.queue.empty()
+        return not self.queue
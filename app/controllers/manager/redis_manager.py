@@ -1,56 +1,390 @@
+"""Redis task queue, shared by API replicas and standalone worker nodes.
+
+Jobs are JSON documents ({"id", "func", "args", "kwargs", "lane",
+"enqueued_at"}), one list per lane (task_queue:lane:<lane>, newest at the
+head, so each list is in age order). Without redis_worker_fleet, API
+processes sharing the queue run its jobs as their own slots free up. With
+redis_worker_fleet, API processes only enqueue and `python worker.py`
+nodes (see RedisWorker) run every job:
+
+- a worker takes the first job in schedule order (lane, then age, see
+  base_manager) by atomically moving it to task_queue:processing, so a job
+  is never lost between being taken and being finished. Within a lane the
+  oldest job always ranks first, so only the tail of each lane list is
+  read: reserving costs one read per lane whatever the queue length (LMOVE,
+  Redis 6.2 or later)
+- an idle worker slot taking a single lane blocks on that lane's list;
+  other slots block on the task_queue:signal:<lane> lists of the lanes they
+  take, which every enqueue pushes to, so no slot consumes the wake-up of a
+  job it would not run
+- queue positions are reported by each worker's housekeeping thread every
+  task_heartbeat_interval, as that reads every queued job
+- while running it, the worker heartbeats into task_queue:workers and
+  extends the job's lease in task_queue:leases
+- a job whose lease runs out (its worker died) goes back to the queue with
+  its original lane and age, at most task_max_attempts times before its
+  task is failed
+- a finished job is acknowledged by removing it from the processing list
+"""
+
 import json
-from typing import Dict
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List
 
 import redis
+from loguru import logger
+from pydantic import BaseModel
 
-from app.controllers.manager.base_manager import TaskManager
-from app.models.schema import VideoParams
+from app.config import config
+from app.controllers.manager.base_manager import (
+    INTERACTIVE_LANES,
+    LANE_VIDEO,
+    LANES,
+    TaskManager,
+    report_positions,
+    reserved_slots,
+    schedule_order,
+)
+from app.models import const, schema
+from app.services import state as sm
 from app.services import task as tm
 
 FUNC_MAP = {
     "start": tm.start,
-    # 'start_test': tm.start_test
+    "render_segments": tm.render_segments,
 }
 
 
+def encode_value(value: Any):
+    """JSON-safe form of task arguments; pydantic models keep their type."""
+    if isinstance(value, BaseModel):
+        return {"__model__": type(value).__name__, "data": value.model_dump(mode="json")}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    return value
+
+
+def decode_value(value: Any):
+    if isinstance(value, dict):
+        if "__model__" in value:
+            return getattr(schema, value["__model__"])(**value["data"])
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    return value
+
+
+def encode_job(task: Dict) -> str:
+    return json.dumps(
+        {
+            "id": task.get("id") or uuid.uuid4().hex,
+            "func": task["func"].__name__,
+            "args": encode_value(list(task.get("args", ()))),
+            "kwargs": encode_value(task.get("kwargs", {})),
+            "lane": task.get("lane", LANE_VIDEO),
+            "enqueued_at": task.get("enqueued_at") or time.time(),
+        }
+    )
+
+
+def decode_job(raw) -> Dict:
+    job = json.loads(raw)
+    return {
+        "id": job.get("id", ""),
+        "func": FUNC_MAP[job["func"]],
+        "args": tuple(decode_value(job.get("args", []))),
+        "kwargs": decode_value(job.get("kwargs", {})),
+        "lane": job.get("lane", LANE_VIDEO),
+        "enqueued_at": job.get("enqueued_at", 0),
+        # the queued form, to remove this exact entry from the lists
+        "raw": raw,
+    }
+
+
+def lane_queue(queue: str, lane: str) -> str:
+    """The list of the jobs queued in lane, oldest at the tail."""
+    return f"{queue}:lane:{lane if lane in LANES else LANE_VIDEO}"
+
+
+def lane_signal(queue: str, lane: str) -> str:
+    return f"{queue}:signal:{lane if lane in LANES else LANE_VIDEO}"
+
+
+def queued_jobs(client: redis.Redis, queue: str) -> List[Dict]:
+    """Every queued job, reading each lane list in full."""
+    jobs = []
+    for lane in LANES:
+        for raw in client.lrange(lane_queue(queue, lane), 0, -1):
+            try:
+                jobs.append(decode_job(raw))
+            except Exception as e:
+                logger.warning(f"skipping malformed job {raw!r}: {str(e)}")
+    return jobs
+
+
+def redis_url() -> str:
+    host = config.app.get("redis_host", "localhost")
+    port = config.app.get("redis_port", 6379)
+    db = config.app.get("redis_db", 0)
+    password = config.app.get("redis_password", None)
+    return f"redis://:{password}@{host}:{port}/{db}"
+
+
 class RedisTaskManager(TaskManager):
-    def __init__(self, max_concurrent_tasks: int, redis_url: str):
+    def __init__(self, max_concurrent_tasks: int, redis_url: str, executor: str = "thread", fleet: bool = False):
         self.redis_client = redis.Redis.from_url(redis_url)
-        super().__init__(max_concurrent_tasks)
+        # with a worker fleet this process only enqueues
+        self.distributed = fleet
+        super().__init__(max_concurrent_tasks, executor if not fleet else "thread")
 
     def create_queue(self):
         return "task_queue"
 
+    def add_task(self, func: Callable, *args: Any, lane: str = LANE_VIDEO, **kwargs: Any):
+        if not self.distributed:
+            return super().add_task(func, *args, lane=lane, **kwargs)
+        logger.info(f"enqueue task for the worker fleet: {func.__name__}, lane: {lane}")
+        self.enqueue(self._task(func, args, kwargs, lane))
+        report_positions(schedule_order(self.queued()))
+
     def enqueue(self, task: Dict):
-        task_with_serializable_params = task.copy()
-
-        if "params" in task["kwargs"] and isinstance(
-            task["kwargs"]["params"], VideoParams
-        ):
-            task_with_serializable_params["kwargs"]["params"] = task["kwargs"][
-                "params"
-            ].dict()
-
-        # 将函数对象转换为其名称
-        task_with_serializable_params["func"] = task["func"].__name__
-        self.redis_client.rpush(self.queue, json.dumps(task_with_serializable_params))
-
-    def dequeue(self):
-        task_json = self.redis_client.lpop(self.queue)
-        if task_json:
-            task_info = json.loads(task_json)
-            # 将函数名称转换回函数对象
-            task_info["func"] = FUNC_MAP[task_info["func"]]
-
-            if "params" in task_info["kwargs"] and isinstance(
-                task_info["kwargs"]["params"], dict
-            ):
-                task_info["kwargs"]["params"] = VideoParams(
-                    **task_info["kwargs"]["params"]
-                )
-
-            return task_info
-        return None
+        lane = task.get("lane", LANE_VIDEO)
+        signal_list = lane_signal(self.queue, lane)
+        pipe = self.redis_client.pipeline()
+        pipe.lpush(lane_queue(self.queue, lane), encode_job(task))
+        # wakes a worker waiting for this lane, see RedisWorker.reserve
+        pipe.lpush(signal_list, 1)
+        pipe.ltrim(signal_list, 0, 99)
+        pipe.execute()
+
+    def queued(self) -> List[Dict]:
+        return queued_jobs(self.redis_client, self.queue)
+
+    def claim(self, task: Dict) -> bool:
+        return bool(self.redis_client.lrem(lane_queue(self.queue, task["lane"]), 1, task["raw"]))
 
     def is_queue_empty(self):
-        return self.redis_client.llen(self.queue) == 0
+        pipe = self.redis_client.pipeline()
+        for lane in LANES:
+            pipe.llen(lane_queue(self.queue, lane))
+        return not any(pipe.execute())
+
+
+class RedisWorker:
+    """A worker node running queued jobs, max_concurrent_tasks at a time."""
+
+    def __init__(self, redis_url: str, concurrency: int, executor: str = "thread", queue: str = "task_queue"):
+        self.redis_client = redis.Redis.from_url(redis_url)
+        self.queue = queue
+        self.processing = f"{queue}:processing"
+        self.leases = f"{queue}:leases"
+        self.attempts = f"{queue}:attempts"
+        self.workers = f"{queue}:workers"
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = max(1, concurrency)
+        self.visibility_timeout = float(config.app.get("task_visibility_timeout", 60))
+        self.heartbeat_interval = float(config.app.get("task_heartbeat_interval", 10))
+        self.max_attempts = int(config.app.get("task_max_attempts", 3))
+        self.pool = None
+        if executor == "process":
+            from app.controllers.manager.worker_pool import WorkerPool
+
+            self.pool = WorkerPool(self.concurrency)
+        self._running = {}
+        # queue positions already recorded, see report_queue
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def reserve(self, lanes=None, timeout: int = 5):
+        """Lease the next job in schedule order, waiting up to timeout seconds for one.
+
+        lanes restricts the lanes taken. Returns (raw, job) or None.
+
+        Only the oldest job of each lane is read, so a call costs one read per
+        lane plus the move, however many jobs are queued.
+        """
+        lanes = [lane for lane in LANES if lanes is None or lane in lanes]
+        pipe = self.redis_client.pipeline()
+        for lane in lanes:
+            pipe.lindex(lane_queue(self.queue, lane), -1)
+        heads = []
+        for lane, raw in zip(lanes, pipe.execute()):
+            if raw is None:
+                continue
+            try:
+                heads.append(decode_job(raw))
+            except Exception as e:
+                # it would stop its lane for good
+                logger.error(f"dropping malformed job {raw!r}: {str(e)}")
+                self.redis_client.lrem(lane_queue(self.queue, lane), 1, raw)
+        for head in schedule_order(heads):
+            # another worker may have taken this head, the lane's next job is
+            # then the oldest left
+            raw = self.redis_client.lmove(lane_queue(self.queue, head["lane"]), self.processing, "RIGHT", "LEFT")
+            if raw is not None:
+                return self._lease(raw)
+        if len(lanes) == 1:
+            raw = self.redis_client.blmove(lane_queue(self.queue, lanes[0]), self.processing, timeout, "RIGHT", "LEFT")
+            return self._lease(raw) if raw is not None else None
+        self.redis_client.blpop([lane_signal(self.queue, lane) for lane in lanes], timeout)
+        return None
+
+    def _lease(self, raw):
+        try:
+            job = decode_job(raw)
+        except Exception as e:
+            logger.error(f"dropping malformed job {raw!r}: {str(e)}")
+            self.redis_client.lrem(self.processing, 1, raw)
+            return None
+        self.redis_client.hset(self.leases, job["id"], time.time() + self.visibility_timeout)
+        return raw, job
+
+    def ack(self, raw, job_id: str):
+        pipe = self.redis_client.pipeline()
+        pipe.lrem(self.processing, 1, raw)
+        pipe.hdel(self.leases, job_id)
+        pipe.hdel(self.attempts, job_id)
+        pipe.execute()
+
+    def heartbeat(self):
+        now = time.time()
+        with self._lock:
+            running = dict(self._running)
+        pipe = self.redis_client.pipeline()
+        for job_id in running:
+            pipe.hset(self.leases, job_id, now + self.visibility_timeout)
+        pipe.hset(
+            self.workers,
+            self.worker_id,
+            json.dumps({"at": now, "concurrency": self.concurrency, "jobs": running}),
+        )
+        pipe.execute()
+
+    def report_queue(self):
+        """Record the queue position of every waiting job; reads the whole queue."""
+        waiting = schedule_order(queued_jobs(self.redis_client, self.queue))
+        self._positions = {t["id"]: self._positions[t["id"]] for t in waiting if t["id"] in self._positions}
+        report_positions(waiting, self._positions)
+
+    def requeue_expired(self):
+        """Put jobs whose worker stopped heartbeating back in the queue."""
+        now = time.time()
+        for raw in self.redis_client.lrange(self.processing, 0, -1):
+            try:
+                job = json.loads(raw)
+            except Exception:
+                continue
+            job_id = job.get("id", "")
+            deadline = self.redis_client.hget(self.leases, job_id)
+            if deadline is None:
+                # just taken by a worker that has not written its lease yet
+                self.redis_client.hsetnx(self.leases, job_id, now + self.visibility_timeout)
+                continue
+            if float(deadline) > now:
+                continue
+            # only the worker that removes it requeues it
+            if not self.redis_client.lrem(self.processing, 1, raw):
+                continue
+            self.redis_client.hdel(self.leases, job_id)
+            attempts = self.redis_client.hincrby(self.attempts, job_id)
+            task_id = (job.get("kwargs") or {}).get("task_id", "")
+            if attempts >= self.max_attempts:
+                logger.error(f"job {job_id} of task {task_id} lost its worker {attempts} times, giving up")
+                self.redis_client.hdel(self.attempts, job_id)
+                if task_id:
+                    sm.state.update_task(
+                        task_id, state=const.TASK_STATE_FAILED, progress=100, error="task worker lost"
+                    )
+                continue
+            logger.warning(f"job {job_id} of task {task_id} lost its worker, requeueing")
+            # it keeps its lane and enqueue time, and goes back to the old end
+            # of its lane, so it is scheduled where it was
+            lane = job.get("lane", LANE_VIDEO)
+            self.redis_client.rpush(lane_queue(self.queue, lane), raw)
+            self.redis_client.lpush(lane_signal(self.queue, lane), 1)
+        # forget workers that stopped heartbeating long ago
+        for worker_id, beat in self.redis_client.hgetall(self.workers).items():
+            try:
+                if json.loads(beat)["at"] < now - 10 * self.visibility_timeout:
+                    self.redis_client.hdel(self.workers, worker_id)
+            except Exception:
+                continue
+
+    def run_job(self, job: Dict):
+        func, args, kwargs = job["func"], job["args"], job["kwargs"]
+        task_id = kwargs.get("task_id", "")
+        try:
+            if self.pool:
+                self.pool.run(func, *args, **kwargs)
+            else:
+                func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"task {func.__name__} crashed: {e}\n{traceback.format_exc()}")
+            if task_id:
+                sm.state.update_task(task_id, state=const.TASK_STATE_FAILED, progress=100, error=str(e))
+
+    def _slot(self, lanes=None):
+        while not self._stop.is_set():
+            try:
+                reserved = self.reserve(lanes)
+            except redis.RedisError as e:
+                logger.error(f"failed to reserve a job: {str(e)}")
+                self._stop.wait(self.heartbeat_interval)
+                continue
+            if not reserved:
+                continue
+            raw, job = reserved
+            logger.info(f"running job {job['id']}: {job['func'].__name__} {job['kwargs'].get('task_id', '')}")
+            with self._lock:
+                self._running[job["id"]] = job["kwargs"].get("task_id", "")
+            try:
+                self.run_job(job)
+            finally:
+                with self._lock:
+                    self._running.pop(job["id"], None)
+                self.ack(raw, job["id"])
+
+    def _housekeeping(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                self.requeue_expired()
+                self.report_queue()
+            except redis.RedisError as e:
+                logger.error(f"worker heartbeat failed: {str(e)}")
+
+    def stop(self, *_):
+        logger.info("stopping worker, running jobs will finish first")
+        self._stop.set()
+
+    def run(self):
+        """Run until SIGINT/SIGTERM, then let the running jobs finish."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+        logger.info(f"worker {self.worker_id} started, {self.concurrency} slots on {self.queue}")
+        self.heartbeat()
+        self.requeue_expired()
+        threads = [threading.Thread(target=self._housekeeping, daemon=True)]
+        # the first interactive_slots slots only take interactive lanes
+        reserved = reserved_slots(self.concurrency)
+        threads += [
+            threading.Thread(target=self._slot, args=(INTERACTIVE_LANES if i < reserved else None,), name=f"slot-{i}")
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads[1:]:
+            thread.join()
+        self.redis_client.hdel(self.workers, self.worker_id)
+        if self.pool:
+            self.pool.shutdown()
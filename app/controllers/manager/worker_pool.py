@@ -0,0 +1,201 @@
+"""Warm worker processes that run tasks outside the API process.
+
+Each worker is a spawned process that imports the task pipeline (moviepy,
+edge_tts, faster-whisper) once at start, then runs one task at a time sent
+over its pipe, so renders neither share the API server's GIL nor leak
+readers and frames into its address space. A worker is replaced by a fresh
+one after task_worker_max_tasks tasks or once its resident memory exceeds
+task_worker_max_rss_mb.
+
+With the in-memory state backend, task state updates made in a worker are
+sent back over the pipe and applied to the API process's state; with Redis
+workers write the shared state directly.
+"""
+
+import atexit
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from typing import Any, Callable
+
+from loguru import logger
+
+from app.config import config
+from app.models import const
+from app.services import state as sm
+
+_ctx = multiprocessing.get_context("spawn")
+
+
+def _rss_mb() -> float:
+    """Resident memory of this process in MB, 0 where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except Exception:
+        pass
+    try:
+        import resource
+
+        # peak rather than current RSS, in KB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if peak > 1 << 32 else peak / 1024
+    except Exception:
+        return 0.0
+
+
+class _ForwardingState(sm.MemoryState):
+    """Worker-side memory state that also sends every update to the API process."""
+
+    def __init__(self, conn, lock: threading.Lock):
+        super().__init__()
+        self._conn = conn
+        # shared with _worker_main, whose result message must not interleave
+        self._lock = lock
+
+    def update_task(self, task_id: str, state: int = const.TASK_STATE_PROCESSING, progress: int = 0, **kwargs):
+        super().update_task(task_id, state, progress, **kwargs)
+        # tasks update state from helper threads too (render progress)
+        with self._lock:
+            self._conn.send(("state", task_id, state, progress, kwargs))
+
+
+def _worker_main(conn, max_tasks: int, max_rss_mb: float):
+    # warm up: the task pipeline pulls in moviepy, edge_tts and faster-whisper
+    import app.services.task  # noqa: F401
+
+    # every message on conn is sent under this lock
+    send_lock = threading.Lock()
+    if isinstance(sm.state, sm.MemoryState):
+        sm.state = _ForwardingState(conn, send_lock)
+
+    done = 0
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        func, args, kwargs = job
+        error, result = "", None
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"task {getattr(func, '__name__', func)} failed: {e}\n{traceback.format_exc()}")
+            error = str(e) or type(e).__name__
+        done += 1
+        rss = _rss_mb()
+        recycle = (max_tasks > 0 and done >= max_tasks) or (max_rss_mb > 0 and rss > max_rss_mb)
+        if recycle:
+            logger.info(f"recycling task worker {os.getpid()} after {done} tasks, rss {rss:.0f} MB")
+        # a helper thread the task left behind may still be sending state
+        with send_lock:
+            conn.send(("done", error, recycle, result))
+        if recycle:
+            break
+    conn.close()
+
+
+class _Worker:
+    def __init__(self, max_tasks: int, max_rss_mb: float):
+        self.conn, child_conn = _ctx.Pipe()
+        # not a daemon: tasks start their own render worker pools
+        self.process = _ctx.Process(
+            target=_worker_main, args=(child_conn, max_tasks, max_rss_mb), name="task-worker"
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, timeout: float = 5):
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class WorkerPool:
+    """A fixed number of warm task worker processes, each running one task at a time."""
+
+    def __init__(self, workers: int):
+        try:
+            self.max_tasks = int(config.app.get("task_worker_max_tasks", 20) or 0)
+            self.max_rss_mb = float(config.app.get("task_worker_max_rss_mb", 2048) or 0)
+        except Exception:
+            self.max_tasks, self.max_rss_mb = 20, 2048.0
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(max(1, workers)):
+            self._idle.put(self._spawn())
+        atexit.register(self.shutdown)
+        logger.info(f"started {max(1, workers)} task worker processes")
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self.max_tasks, self.max_rss_mb)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop()
+
+    def run(self, func: Callable, *args: Any, **kwargs: Any):
+        """Run func(*args, **kwargs) in the next idle worker and return its result.
+
+        Raises RuntimeError when the task fails, its worker dies or the pool
+        is shut down while waiting for an idle worker.
+        """
+        while True:
+            if self._closed:
+                raise RuntimeError("task worker pool is shut down")
+            try:
+                # wakes up now and then to notice a shutdown
+                worker = self._idle.get(timeout=1)
+                break
+            except queue.Empty:
+                continue
+        recycle = True
+        try:
+            worker.conn.send((func, args, kwargs))
+            while True:
+                message = worker.conn.recv()
+                if message[0] == "state":
+                    _, task_id, state, progress, state_kwargs = message
+                    sm.state.update_task(task_id, state=state, progress=progress, **state_kwargs)
+                    continue
+                _, error, recycle, result = message
+                if error:
+                    raise RuntimeError(error)
+                return result
+        except (EOFError, OSError):
+            raise RuntimeError(f"task worker {worker.process.pid} exited unexpectedly")
+        finally:
+            if recycle or not worker.process.is_alive():
+                self._retire(worker)
+                if not self._closed:
+                    worker = self._spawn()
+            if not self._closed:
+                self._idle.put(worker)
+
+    def wrap(self, func: Callable) -> Callable:
+        """func, run in a worker process instead of the calling thread."""
+        return functools.update_wrapper(functools.partial(self.run, func), func)
+
+    def shutdown(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,116 @@
+"""HTTP responses for rendered media files.
+
+Serves /v1/stream, /v1/download and the /tasks static mount. On top of
+starlette's FileResponse (byte ranges, multi-range, If-Range and 416) this
+answers conditional requests with 304 Not Modified. Whole-file bodies are
+handed to the server through the ASGI pathsend extension when it offers it,
+so the server can sendfile them from the page cache. Everything else is read
+in large chunks on a worker thread, never on the event loop.
+"""
+
+import mimetypes
+import os
+import stat
+from email.utils import parsedate
+from secrets import token_hex
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# HLS packages (see app/services/packaging.py)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+
+PATHSEND = "http.response.pathsend"
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response_headers.get("etag")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag is not None and ("*" in tags or etag in tags)
+
+    if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+    last_modified = parsedate(response_headers.get("last-modified", ""))
+    return bool(if_modified_since and last_modified and if_modified_since >= last_modified)
+
+
+class MediaFileResponse(FileResponse):
+    chunk_size = 1024 * 1024
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.stat_result is None:
+            try:
+                stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            if not stat.S_ISREG(stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.stat_result = stat_result
+            self.set_stat_headers(stat_result)
+
+        if str(self.path).endswith(".m3u8"):
+            # live playlists grow while a render runs, players must revalidate them
+            self.headers.setdefault("cache-control", "no-cache")
+
+        if (
+            self.status_code == 200
+            and scope["method"].upper() in ("GET", "HEAD")
+            and is_not_modified(self.headers, Headers(scope=scope))
+        ):
+            return await NotModifiedResponse(self.headers)(scope, receive, send)
+
+        self._pathsend = PATHSEND in (scope.get("extensions") or {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if send_header_only or not self._pathsend:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": PATHSEND, "path": os.path.abspath(self.path)})
+
+    async def _handle_multiple_ranges(
+        self, send: Send, ranges: list[tuple[int, int]], file_size: int, send_header_only: bool
+    ) -> None:
+        # starlette announces the multipart type in Content-Range instead of
+        # Content-Type; parts are also delimited with CRLF as RFC 9110 requires
+        boundary = token_hex(13)
+        content_type = self.headers["content-type"]
+
+        def part_header(start: int, end: int) -> bytes:
+            return (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+
+        closing = f"--{boundary}--\r\n".encode("latin-1")
+        content_length = sum(len(part_header(start, end)) + end - start + 2 for start, end in ranges) + len(closing)
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for start, end in ranges:
+                await send({"type": "http.response.body", "body": part_header(start, end), "more_body": True})
+                await file.seek(start)
+                while start < end:
+                    chunk = await file.read(min(self.chunk_size, end - start))
+                    if not chunk:
+                        break
+                    start += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+
+class MediaStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200):
+        return MediaFileResponse(full_path, status_code=status_code, stat_result=stat_result)
@@ -21,6 +21,7 @@ ALLOWED_FIELDS: Dict[str, List[str]] = {
         "subtitle_provider",
         "endpoint",
         "max_concurrent_tasks",
+        "render_workers",
         # LLM providers - keys/base/model
         "pollinations_api_key",
         "pollinations_base_url",
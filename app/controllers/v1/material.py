@@ -7,6 +7,7 @@ from app.config import config
 from app.controllers.v1.base import new_router
 from app.models.schema import VideoAspect, MaterialInfo
 from app.services import material as material_service
+from app.services import probe
 from app.utils import utils
 import os
 import glob
@@ -57,20 +58,16 @@ def list_materials(
         end = min(start + page_size, total)
         page_files = files[start:end]
 
+        # best-effort duration probe for videos, served from the probe cache in one lookup
+        infos = probe.probe_many(
+            [f for f in page_files if os.path.splitext(f)[1].lower() not in image_exts]
+        )
         items = []
         for f in page_files:
             item = {"name": os.path.basename(f), "size": os.path.getsize(f), "file": f}
-            # best-effort duration probe for videos
-            try:
-                ext = os.path.splitext(f)[1].lower()
-                if ext not in image_exts:
-                    from moviepy.video.io.VideoFileClip import VideoFileClip
-
-                    clip = VideoFileClip(f)
-                    item["duration"] = float(clip.duration)
-                    clip.close()
-            except Exception:
-                pass
+            info = infos.get(f)
+            if info:
+                item["duration"] = float(info["duration"])
             items.append(item)
 
         return utils.get_response(200, {"files": items, "total": total, "page": page, "page_size": page_size})
@@ -113,14 +110,9 @@ def upload_material(
 
         res = {"file": save_path, "name": os.path.basename(save_path), "size": os.path.getsize(save_path)}
         # probe duration best-effort
-        try:
-            from moviepy.video.io.VideoFileClip import VideoFileClip
-
-            clip = VideoFileClip(save_path)
-            res["duration"] = float(clip.duration)
-            clip.close()
-        except Exception:
-            pass
+        info = probe.probe(save_path)
+        if info:
+            res["duration"] = float(info["duration"])
         return utils.get_response(200, res)
     except Exception as e:
         logger.error(f"upload material failed: {str(e)}")
@@ -169,14 +161,9 @@ def download_material(request: Request, body: dict):
             return utils.get_response(400, message=f"{request_id}: download failed")
 
         res = {"file": saved, "name": os.path.basename(saved), "size": os.path.getsize(saved)}
-        try:
-            from moviepy.video.io.VideoFileClip import VideoFileClip
-
-            clip = VideoFileClip(saved)
-            res["duration"] = float(clip.duration)
-            clip.close()
-        except Exception:
-            pass
+        info = probe.probe(saved)
+        if info:
+            res["duration"] = float(info["duration"])
         return utils.get_response(200, res)
     except Exception as e:
         logger.error(f"download material failed: {str(e)}")
@@ -1,19 +1,21 @@
 import glob
 import os
-import pathlib
 import shutil
 from typing import Union
 
 from fastapi import BackgroundTasks, Depends, Path, Request, UploadFile
 from fastapi.params import File
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse
 from loguru import logger
 
 from app.config import config
 from app.controllers import base
+from app.controllers.media import MediaFileResponse
 from app.controllers.manager.memory_manager import InMemoryTaskManager
+from app.controllers.manager import base_manager, redis_manager
 from app.controllers.manager.redis_manager import RedisTaskManager
 from app.controllers.v1.base import new_router
+from app.models import const
 from app.models.exception import HttpException
 from app.models.schema import (
     AudioRequest,
@@ -32,6 +34,7 @@ from app.models.schema import (
 )
 from app.services import state as sm
 from app.services import task as tm
+from app.services import task_manifest, thumbnails
 from app.utils import utils
 from fastapi.responses import FileResponse
 
@@ -40,20 +43,21 @@ from fastapi.responses import FileResponse
 router = new_router()
 
 _enable_redis = config.app.get("enable_redis", False)
-_redis_host = config.app.get("redis_host", "localhost")
-_redis_port = config.app.get("redis_port", 6379)
-_redis_db = config.app.get("redis_db", 0)
-_redis_password = config.app.get("redis_password", None)
 _max_concurrent_tasks = config.app.get("max_concurrent_tasks", 5)
+_task_executor = config.app.get("task_executor", "thread")
 
-redis_url = f"redis://:{_redis_password}@{_redis_host}:{_redis_port}/{_redis_db}"
 # 根据配置选择合适的任务管理器
 if _enable_redis:
     task_manager = RedisTaskManager(
-        max_concurrent_tasks=_max_concurrent_tasks, redis_url=redis_url
+        max_concurrent_tasks=_max_concurrent_tasks,
+        redis_url=redis_manager.redis_url(),
+        executor=_task_executor,
+        fleet=config.app.get("redis_worker_fleet", False),
     )
 else:
-    task_manager = InMemoryTaskManager(max_concurrent_tasks=_max_concurrent_tasks)
+    task_manager = InMemoryTaskManager(
+        max_concurrent_tasks=_max_concurrent_tasks, executor=_task_executor
+    )
 
 
 @router.post("/videos", response_model=TaskResponse, summary="Generate a short video")
@@ -202,23 +206,42 @@ def list_segment_thumbs_endpoint(request: Request, task_id: str = Path(...)):
     request_id = base.get_task_id(request)
     try:
         segments = video_service.load_segments(task_id)
+        thumbs = thumbnails.generate_thumbnails(task_id, segments)
         result = []
         for s in segments:
             seg_id = s.segment_id if hasattr(s, 'segment_id') else s.get('segment_id')
             if not seg_id:
                 continue
-            try:
-                _ = video_service.get_segment_thumbnail(task_id, seg_id)
-                # public path under /tasks
-                public_path = f"{endpoint}/tasks/{task_id}/thumbs/{seg_id}.jpg"
-                result.append({"segment_id": seg_id, "thumb": public_path})
-            except Exception:
-                result.append({"segment_id": seg_id, "thumb": ""})
+            # public path under /tasks
+            public_path = f"{endpoint}/tasks/{task_id}/thumbs/{seg_id}.jpg" if seg_id in thumbs else ""
+            result.append({"segment_id": seg_id, "thumb": public_path})
         return utils.get_response(200, {"task_id": task_id, "thumbs": result})
     except Exception as e:
         raise HttpException(task_id=task_id, status_code=404, message=f"{request_id}: {str(e)}")
 
 
+@router.get(
+    "/tasks/{task_id}/segments/sprite",
+    summary="Get the timeline sprite sheet of all segment thumbnails and its tile index",
+)
+def get_segment_sprite_endpoint(request: Request, task_id: str = Path(...)):
+    from app.services import video as video_service
+    endpoint = config.app.get("endpoint", "")
+    if not endpoint:
+        endpoint = str(request.base_url)
+    endpoint = endpoint.rstrip("/")
+
+    request_id = base.get_task_id(request)
+    try:
+        index = video_service.ensure_thumbs(task_id)
+        if not index:
+            raise FileNotFoundError("sprite sheet not available")
+        data = dict(index, task_id=task_id, url=f"{endpoint}/tasks/{task_id}/thumbs/{index['sprite']}")
+        return utils.get_response(200, data)
+    except Exception as e:
+        raise HttpException(task_id=task_id, status_code=404, message=f"{request_id}: {str(e)}")
+
+
 @router.post(
     "/segments/save",
     response_model=SegmentsPlanResponse,
@@ -265,8 +288,6 @@ def save_segments_endpoint(request: Request, body: SegmentsRenderRequest):
     summary="Render video from provided segments plan",
 )
 def render_segments_endpoint(request: Request, body: SegmentsRenderRequest):
-    from app.services import video as video_service
-
     request_id = base.get_task_id(request)
     task_id = body.task_id
     try:
@@ -304,44 +325,6 @@ def render_segments_endpoint(request: Request, body: SegmentsRenderRequest):
                 video_clip_duration=task_state.get("params", {}).get("video_clip_duration", 5),
             )
 
-        # ensure subtitle exists when enabled
-        try:
-            import os
-            from app.services import subtitle as subtitle_service
-            # resolve boolean safely
-            sub_enabled = True
-            try:
-                sub_enabled = bool(getattr(params, 'subtitle_enabled', True))
-            except Exception:
-                sub_enabled = True
-            if sub_enabled and (not subtitle_path or not os.path.exists(subtitle_path)) and audio_file:
-                # try to get script content from state or script.json
-                script_text = task_state.get('script', '')
-                if not script_text:
-                    try:
-                        import json
-                        script_file = os.path.join(utils.task_dir(task_id), 'script.json')
-                        if os.path.exists(script_file):
-                            with open(script_file, 'r', encoding='utf-8') as fd:
-                                s = json.load(fd)
-                                script_text = s.get('script', '')
-                    except Exception:
-                        script_text = ''
-                # generate via whisper then correct if script available
-                _subtitle_path = os.path.join(utils.task_dir(task_id), 'subtitle.srt')
-                subtitle_service.create(audio_file=audio_file, subtitle_file=_subtitle_path)
-                if script_text:
-                    try:
-                        subtitle_service.correct(subtitle_file=_subtitle_path, video_script=script_text)
-                    except Exception:
-                        pass
-                # update local var and state snapshot
-                subtitle_path = _subtitle_path
-                sm.state.update_task(task_id, subtitle_path=subtitle_path)
-        except Exception:
-            # best-effort fallback; ignore subtitle generation failure
-            pass
-
         preview_mode = False
         try:
             preview_mode = bool(getattr(body, 'preview', False))
@@ -358,15 +341,28 @@ def render_segments_endpoint(request: Request, body: SegmentsRenderRequest):
         except Exception:
             pass
 
-        combined, final = video_service.render_from_segments(
-            task_id=task_id,
-            segments=body.segments,
-            params=params,
-            audio_file=audio_file,
-            subtitle_path=subtitle_path,
-            preview=preview_mode,
-            preview_label=preview_label,
-        )
+        render_kwargs = {
+            "task_id": task_id,
+            "segments": body.segments,
+            "params": params,
+            "audio_file": audio_file,
+            "subtitle_path": subtitle_path,
+            "preview": preview_mode,
+            "preview_label": preview_label,
+            "script": task_state.get("script", ""),
+        }
+        # previews from the editor jump ahead of full renders
+        lane = base_manager.LANE_PREVIEW if preview_mode else base_manager.LANE_RENDER
+        if task_manager.distributed:
+            # a worker node renders it, poll /tasks/{task_id} for the videos
+            task_manager.add_task(tm.render_segments, lane=lane, **render_kwargs)
+            result = {}
+        else:
+            result = task_manager.run(tm.render_segments, lane=lane, **render_kwargs)
+        combined = result.get("combined_video", "")
+        final = result.get("final_video", "")
+        finals = result.get("final_videos", {})
+        playlists = result.get("playlists", {})
 
         endpoint = config.app.get("endpoint", "")
         if not endpoint:
@@ -383,17 +379,38 @@ def render_segments_endpoint(request: Request, body: SegmentsRenderRequest):
                 _uri_path = file
             return _uri_path
 
-        sm.state.update_task(task_id, state=1, progress=100, videos=[final] if final else [], combined_videos=[combined] if combined else [])
         data = {
             "task_id": task_id,
             "combined_video": to_uri(combined),
             "final_video": to_uri(final),
         }
+        if finals:
+            data["final_videos"] = {aspect: to_uri(f) for aspect, f in finals.items()}
+        if playlists.get(final):
+            data["playlist"] = to_uri(playlists[final])
         return utils.get_response(200, data)
     except Exception as e:
         raise HttpException(task_id=task_id, status_code=400, message=f"{request_id}: {str(e)}")
 
 
+def _enqueue_task(task_id: str, params, stop_at: str):
+    sm.state.update_task(task_id)
+    # several variants in one request queue behind single videos
+    lane = base_manager.LANE_BATCH if getattr(params, "video_count", 1) > 1 else base_manager.LANE_VIDEO
+    task_manager.add_task(tm.start, task_id=task_id, params=params, stop_at=stop_at, lane=lane)
+
+
+def resume_interrupted_tasks():
+    """Queue again the tasks a previous run of the server left unfinished."""
+    for task_id in task_manifest.interrupted():
+        manifest = task_manifest.load(task_id)
+        params = task_manifest.params(manifest)
+        if not params:
+            continue
+        logger.info(f"resuming interrupted task: {task_id}")
+        _enqueue_task(task_id, params, manifest.get("stop_at", "video"))
+
+
 def create_task(
     request: Request,
     body: Union[TaskVideoRequest, SubtitleRequest, AudioRequest],
@@ -407,8 +424,7 @@ def create_task(
             "request_id": request_id,
             "params": body.model_dump(),
         }
-        sm.state.update_task(task_id)
-        task_manager.add_task(tm.start, task_id=task_id, params=body, stop_at=stop_at)
+        _enqueue_task(task_id, body, stop_at)
         logger.success(f"Task created: {utils.to_json(task)}")
         return utils.get_response(200, task)
     except ValueError as e:
@@ -488,6 +504,10 @@ def get_task(
             for v in combined_videos:
                 urls.append(file_to_uri(v))
             task["combined_videos"] = urls
+        if "playlists" in task:
+            task["playlists"] = [file_to_uri(v) for v in task["playlists"]]
+        if "live_playlists" in task:
+            task["live_playlists"] = [file_to_uri(v) for v in task["live_playlists"]]
         return utils.get_response(200, task)
 
     raise HttpException(
@@ -495,6 +515,27 @@ def get_task(
     )
 
 
+@router.post(
+    "/tasks/{task_id}/resume",
+    response_model=TaskResponse,
+    summary="Resume a task from the stages it had completed",
+)
+def resume_task(request: Request, task_id: str = Path(..., description="Task ID")):
+    request_id = base.get_task_id(request)
+    manifest = task_manifest.load(task_id)
+    params = task_manifest.params(manifest) if manifest else None
+    if not params:
+        raise HttpException(
+            task_id=task_id, status_code=404, message=f"{request_id}: no checkpoints found for task"
+        )
+
+    # stages whose checkpoint is still valid are restored, the rest run again
+    _enqueue_task(task_id, params, manifest.get("stop_at", "video"))
+    task = {"task_id": task_id, "request_id": request_id}
+    logger.success(f"Task resumed: {utils.to_json(task)}")
+    return utils.get_response(200, task)
+
+
 @router.delete(
     "/tasks/{task_id}",
     response_model=TaskDeletionResponse,
@@ -562,65 +603,35 @@ def upload_bgm_file(request: Request, file: UploadFile = File(...)):
     )
 
 
-@router.get("/stream/{file_path:path}")
-async def stream_video(request: Request, file_path: str):
-    tasks_dir = utils.task_dir()
-    video_path = os.path.join(tasks_dir, file_path)
-    range_header = request.headers.get("Range")
-    video_size = os.path.getsize(video_path)
-    start, end = 0, video_size - 1
-
-    length = video_size
-    if range_header:
-        range_ = range_header.split("bytes=")[1]
-        start, end = [int(part) if part else None for part in range_.split("-")]
-        if start is None:
-            start = video_size - end
-            end = video_size - 1
-        if end is None:
-            end = video_size - 1
-        length = end - start + 1
-
-    def file_iterator(file_path, offset=0, bytes_to_read=None):
-        with open(file_path, "rb") as f:
-            f.seek(offset, os.SEEK_SET)
-            remaining = bytes_to_read or video_size
-            while remaining > 0:
-                bytes_to_read = min(4096, remaining)
-                data = f.read(bytes_to_read)
-                if not data:
-                    break
-                remaining -= len(data)
-                yield data
-
-    response = StreamingResponse(
-        file_iterator(video_path, start, length), media_type="video/mp4"
-    )
-    response.headers["Content-Range"] = f"bytes {start}-{end}/{video_size}"
-    response.headers["Accept-Ranges"] = "bytes"
-    response.headers["Content-Length"] = str(length)
-    response.status_code = 206  # Partial Content
+def _task_file(request: Request, file_path: str) -> str:
+    """Resolve a path under the tasks directory, 404 for anything outside it or missing."""
+    tasks_dir = os.path.realpath(utils.task_dir())
+    full_path = os.path.realpath(os.path.join(tasks_dir, file_path))
+    if os.path.commonpath([tasks_dir, full_path]) != tasks_dir or not os.path.isfile(full_path):
+        request_id = base.get_task_id(request)
+        raise HttpException(task_id="", status_code=404, message=f"{request_id}: file not found: {file_path}")
+    return full_path
 
-    return response
+
+@router.api_route("/stream/{file_path:path}", methods=["GET", "HEAD"])
+async def stream_video(request: Request, file_path: str):
+    """
+    stream video with byte ranges and conditional requests
+    :param request: Request request
+    :param file_path: video file path, eg: /cd1727ed-3473-42a2-a7da-4faafafec72b/final-1.mp4
+    :return: 200 with the whole file, 206 for ranges, 304 when unchanged, 416 for unsatisfiable ranges
+    """
+    video_path = _task_file(request, file_path)
+    return MediaFileResponse(video_path)
 
 
-@router.get("/download/{file_path:path}")
-async def download_video(_: Request, file_path: str):
+@router.api_route("/download/{file_path:path}", methods=["GET", "HEAD"])
+async def download_video(request: Request, file_path: str):
     """
     download video
-    :param _: Request request
+    :param request: Request request
     :param file_path: video file path, eg: /cd1727ed-3473-42a2-a7da-4faafafec72b/final-1.mp4
     :return: video file
     """
-    tasks_dir = utils.task_dir()
-    video_path = os.path.join(tasks_dir, file_path)
-    file_path = pathlib.Path(video_path)
-    filename = file_path.stem
-    extension = file_path.suffix
-    headers = {"Content-Disposition": f"attachment; filename={filename}{extension}"}
-    return FileResponse(
-        path=video_path,
-        headers=headers,
-        filename=f"{filename}{extension}",
-        media_type=f"video/{extension[1:]}",
-    )
+    video_path = _task_file(request, file_path)
+    return MediaFileResponse(video_path, filename=os.path.basename(video_path))
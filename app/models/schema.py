@@ -1,6 +1,6 @@
 import warnings
 from enum import Enum
-from typing import Any, List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 import pydantic
 from pydantic import BaseModel
@@ -75,6 +75,9 @@ class VideoParams(BaseModel):
     video_script: str = ""  # Script used to generate the video
     video_terms: Optional[str | list] = None  # Keywords used to generate the video
     video_aspect: Optional[VideoAspect] = VideoAspect.portrait.value
+    # extra aspects rendered from the same script, audio, subtitles and materials,
+    # each written to final-<aspect>.mp4 (e.g. final-16x9.mp4)
+    video_aspects: Optional[List[VideoAspect]] = None
     video_concat_mode: Optional[VideoConcatMode] = VideoConcatMode.random.value
     video_transition_mode: Optional[VideoTransitionMode] = None
     video_clip_duration: Optional[int] = 5
@@ -111,6 +114,13 @@ class VideoParams(BaseModel):
     stroke_width: float = 1.5
     n_threads: Optional[int] = 2
     paragraph_number: Optional[int] = 1
+    # render engine: "moviepy" (bake + merge + compose) or "ffmpeg" (single-pass filtergraph)
+    render_engine: Optional[str] = "moviepy"
+    # subtitle burn-in: "moviepy" (composite text clips per frame) or "ass" (libass while encoding)
+    subtitle_render_mode: Optional[str] = "moviepy"
+    # also publish the final encode as a live HLS playlist (live/<video>/index.m3u8) while it renders;
+    # implies render_engine = "ffmpeg"
+    progressive_output: Optional[bool] = False
 
 
 class SegmentItem(BaseModel):
@@ -215,6 +225,10 @@ class SegmentsRenderResponse(BaseModel):
         task_id: str
         combined_video: str
         final_video: str
+        # every rendered aspect when params.video_aspects is set
+        final_videos: Optional[Dict[str, str]] = None
+        # HLS master playlist of final_video when output_hls is enabled
+        playlist: Optional[str] = None
 
     data: Data
 
@@ -409,6 +423,9 @@ class TaskQueryResponse(BaseResponse):
                     "combined_videos": [
                         "http://127.0.0.1:8080/tasks/6c85c8cc-a77a-42b9-bc30-947815aa0558/combined-1.mp4"
                     ],
+                    "playlists": [
+                        "http://127.0.0.1:8080/tasks/6c85c8cc-a77a-42b9-bc30-947815aa0558/hls/final-1/master.m3u8"
+                    ],
                 },
             },
         }
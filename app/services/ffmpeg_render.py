@@ -0,0 +1,452 @@
+"""Single-pass ffmpeg render engine for segment plans.
+
+The moviepy engine decodes and re-encodes every frame several times: once
+per baked segment, once for the merge and once more in generate_video for
+subtitles and BGM. This engine compiles the whole segment list into one
+ffmpeg filtergraph (trim/setpts/scale/pad per segment, fades, concat, audio
+mix and subtitle burn-in), so each frame is decoded once and encoded once.
+
+Select it per request with VideoParams.render_engine = "ffmpeg". With
+VideoParams.progressive_output the same encode is also written as a live
+HLS playlist of fMP4 fragments, which players can follow while the render
+is still running; it implies this engine.
+"""
+
+import os
+import random
+import shutil
+from typing import Dict, List
+
+from loguru import logger
+
+from app.config import config
+
+from app.models.schema import SegmentItem, VideoAspect, VideoParams, VideoTransitionMode
+from app.services import proxy, video
+from app.services.utils import ffmpeg_utils
+
+ENGINE_MOVIEPY = "moviepy"
+ENGINE_FFMPEG = "ffmpeg"
+
+# a read of a source continues across a gap of up to this many seconds
+# rather than opening the source again
+_MAX_READ_GAP = 5.0
+
+LIVE_DIR = "live"
+LIVE_PLAYLIST = "index.m3u8"
+
+
+def use_ffmpeg_engine(params: VideoParams) -> bool:
+    if getattr(params, "progressive_output", False):
+        # only the single-pass engine writes the final encode as it goes
+        return True
+    engine = (getattr(params, "render_engine", None) or ENGINE_MOVIEPY).strip().lower()
+    return engine == ENGINE_FFMPEG
+
+
+def _clamp_speed(s: SegmentItem) -> float:
+    try:
+        spd = float(s.speed or 1.0)
+    except Exception:
+        spd = 1.0
+    return min(1.25, max(0.75, spd))
+
+
+def _fit_filters(s: SegmentItem, width: int, height: int) -> List[str]:
+    fit = getattr(s, "fit", None) or "contain"
+    if fit == "cover":
+        return [
+            f"scale={width}:{height}:force_original_aspect_ratio=increase",
+            f"crop={width}:{height}",
+        ]
+    if fit == "center":
+        # keep source pixels 1:1, crop whatever overflows the canvas
+        return [
+            f"crop='min(iw,{width})':'min(ih,{height})'",
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black",
+        ]
+    return [
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease",
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black",
+    ]
+
+
+def _transition_filters(s: SegmentItem, params: VideoParams, duration: float) -> List[str]:
+    trans = None
+    try:
+        if s.transition:
+            trans = VideoTransitionMode(s.transition)
+        elif params.video_transition_mode:
+            trans = VideoTransitionMode(params.video_transition_mode)
+    except Exception:
+        trans = None
+    if trans is None or trans.value == VideoTransitionMode.none.value:
+        return []
+
+    try:
+        t = float(s.transition_duration or 1.0)
+    except Exception:
+        t = 1.0
+    t = min(2.0, max(0.2, t), duration)
+
+    mode = trans.value
+    if mode == VideoTransitionMode.shuffle.value:
+        mode = random.choice(
+            [VideoTransitionMode.fade_in.value, VideoTransitionMode.fade_out.value]
+        )
+    # slide and mask transitions are approximated with fades in this engine
+    if mode in (VideoTransitionMode.fade_out.value, VideoTransitionMode.slide_out.value):
+        return [f"fade=t=out:st={max(0.0, duration - t):.3f}:d={t:.3f}"]
+    return [f"fade=t=in:st=0:d={t:.3f}"]
+
+
+def _source_window(s: SegmentItem):
+    """(start, length) of the source a segment reads."""
+    src_len = max(0.04, float(s.end) - float(s.start))
+    duration = float(s.duration)
+    # read just enough source to fill the declared duration at this speed
+    if duration > 0:
+        src_len = min(src_len, duration * _clamp_speed(s) + 0.1)
+    return float(s.start), src_len
+
+
+def _plan_reads(ordered: List[SegmentItem]) -> List[Dict]:
+    """Group segments into forward reads of their source, one ffmpeg input each.
+
+    A segment joins an earlier read of its material when its window starts at
+    or after the end of that read (within _MAX_READ_GAP seconds), so the read
+    decodes every frame once and the segments sharing it (through split) take
+    their frames in timeline order. A segment that rewinds into a source
+    gets a read of its own: sharing a decoder there would make ffmpeg queue
+    every raw frame between the two windows until the concat reached the
+    later segment. With sequential concat each material is decoded once; with
+    random order or looped materials, once per forward pass.
+    """
+    reads = []
+    for i, s in enumerate(ordered):
+        start, src_len = _source_window(s)
+        candidates = [
+            r
+            for r in reads
+            if r["material"] == s.material and r["end"] <= start + 1e-3 and start - r["end"] <= _MAX_READ_GAP
+        ]
+        if candidates:
+            read = max(candidates, key=lambda r: r["end"])
+            read["end"] = start + src_len
+            read["segments"].append(i)
+        else:
+            reads.append({"material": s.material, "start": start, "end": start + src_len, "segments": [i]})
+    return reads
+
+
+def build_command(
+    segments: List[SegmentItem],
+    params: VideoParams,
+    output_file: str,
+    audio_file: str = "",
+    subtitle_path: str = "",
+    video_only: bool = False,
+    task_id: str = "",
+    preview: bool = False,
+    progressive: bool = False,
+) -> List[str]:
+    """Compile the segment plan into ffmpeg arguments (without the binary).
+
+    preview encodes at the proxy resolution, frame rate and encoder settings.
+    progressive also writes the encode to live_playlist(output_file).
+    """
+    return build_fanout_command(
+        segments,
+        params,
+        {VideoAspect(params.video_aspect).value: output_file},
+        audio_file=audio_file,
+        subtitle_path=subtitle_path,
+        video_only=video_only,
+        task_id=task_id,
+        preview=preview,
+        progressive=progressive,
+    )
+
+
+def build_fanout_command(
+    segments: List[SegmentItem],
+    params: VideoParams,
+    outputs: Dict[str, str],
+    audio_file: str = "",
+    subtitle_path: str = "",
+    video_only: bool = False,
+    task_id: str = "",
+    preview: bool = False,
+    progressive: bool = False,
+) -> List[str]:
+    """Compile the segment plan into one ffmpeg command writing every aspect in outputs.
+
+    outputs maps a VideoAspect value to its output file. Sources are read as
+    planned by _plan_reads; each segment is trimmed from its read and retimed
+    once, then split into per-aspect fit branches. Every aspect gets its own
+    concat, subtitles and encoder while the audio mix is built once and shared.
+    """
+    targets = [(VideoAspect(aspect), output_file) for aspect, output_file in outputs.items()]
+    out_fps = video.fps
+    encoder_args = []
+    if preview:
+        preview_settings = proxy.settings()
+        out_fps = preview_settings["fps"]
+        encoder_args = ["-preset", preview_settings["preset"], *proxy.encoder_params()]
+    sizes = [proxy.resolution(aspect) if preview else aspect.to_resolution() for aspect, _ in targets]
+    ordered = sorted(segments, key=lambda x: x.order)
+
+    reads = _plan_reads(ordered)
+    inputs = []
+    chains = []
+    sources = {}
+    for j, read in enumerate(reads):
+        window = read["end"] - read["start"]
+        inputs += ["-ss", f"{read['start']:.3f}", "-t", f"{window:.3f}", "-i", read["material"]]
+        users = read["segments"]
+        if len(users) == 1:
+            sources[users[0]] = f"[{j}:v:0]"
+        else:
+            chains.append(f"[{j}:v:0]split={len(users)}{''.join(f'[r{j}_{i}]' for i in users)}")
+            sources.update({i: f"[r{j}_{i}]" for i in users})
+
+    labels = [[] for _ in targets]
+    total = 0.0
+    for i, s in enumerate(ordered):
+        spd = _clamp_speed(s)
+        offset, src_len = _source_window(s)
+        offset -= next(r["start"] for r in reads if i in r["segments"])
+        out_len = min(float(s.duration), src_len / spd) if float(s.duration) > 0 else src_len / spd
+        filters = [
+            f"trim=start={offset:.3f}:duration={src_len:.3f}",
+            f"setpts=(PTS-STARTPTS)/{spd:.4f}",
+            f"fps={out_fps}",
+        ]
+        filters += _transition_filters(s, params, out_len)
+        filters += [f"trim=duration={out_len:.3f}", "setpts=PTS-STARTPTS"]
+        branches = [
+            ",".join([*_fit_filters(s, width, height), "setsar=1", "format=yuv420p"])
+            for width, height in sizes
+        ]
+        if len(targets) == 1:
+            chains.append(f"{sources[i]}{','.join(filters)},{branches[0]}[v{i}_0]")
+        else:
+            splits = "".join(f"[s{i}_{k}]" for k in range(len(targets)))
+            chains.append(f"{sources[i]}{','.join(filters)},split={len(targets)}{splits}")
+            chains += [f"[s{i}_{k}]{branch}[v{i}_{k}]" for k, branch in enumerate(branches)]
+        for k in range(len(targets)):
+            labels[k].append(f"[v{i}_{k}]")
+        total += out_len
+
+    video_labels = []
+    events = []
+    if not video_only and params.subtitle_enabled:
+        # same timeline, per-segment offsets/styles and overrides as the moviepy engine
+        events = video.subtitle_events(
+            subtitle_path, params, segments=ordered, task_id=task_id, duration=total
+        )
+    for k, (aspect, output_file) in enumerate(targets):
+        chains.append(f"{''.join(labels[k])}concat=n={len(labels[k])}:v=1:a=0[vcat{k}]")
+        video_label = f"[vcat{k}]"
+        if events:
+            # subtitle layout (PlayRes, margins) follows each output's aspect
+            aspect_params = params.model_copy(update={"video_aspect": aspect})
+            ass_file = video.write_subtitle_ass(events, aspect_params, f"{output_file}.ass")
+            if ass_file:
+                chains.append(f"{video_label}{video.subtitles_filter(ass_file)}[vsub{k}]")
+                video_label = f"[vsub{k}]"
+        video_labels.append(video_label)
+
+    audio_labels = []
+    audio_args = []
+    if not video_only and audio_file:
+        voice_idx = len(reads)
+        inputs += ["-i", audio_file]
+        voice_volume = 1.0 if params.voice_volume is None else float(params.voice_volume)
+        audio_chains = [f"[{voice_idx}:a:0]volume={voice_volume}[voice]"]
+        audio_label = "[voice]"
+
+        bgm_file = video.get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
+        if bgm_file:
+            bgm_idx = voice_idx + 1
+            inputs += ["-stream_loop", "-1", "-i", bgm_file]
+            bgm_volume = float(params.bgm_volume or 0.0)
+            if bool(getattr(params, "bgm_ducking", False)):
+                bgm_volume *= 0.6
+            bgm_filters = [f"atrim=duration={total:.3f}", f"volume={bgm_volume}"]
+            fi = float(getattr(params, "bgm_fade_in_sec", 0.0) or 0.0)
+            fo = float(getattr(params, "bgm_fade_out_sec", 3.0) or 0.0)
+            if fi > 0:
+                bgm_filters.append(f"afade=t=in:st=0:d={fi:.3f}")
+            if fo > 0:
+                bgm_filters.append(f"afade=t=out:st={max(0.0, total - fo):.3f}:d={fo:.3f}")
+            audio_chains.append(f"[{bgm_idx}:a:0]{','.join(bgm_filters)}[bgm]")
+            audio_chains.append("[voice][bgm]amix=inputs=2:duration=first:normalize=0[aout]")
+            audio_label = "[aout]"
+        if len(targets) == 1:
+            audio_labels = [audio_label]
+        else:
+            audio_labels = [f"[a{k}]" for k in range(len(targets))]
+            audio_chains.append(f"{audio_label}asplit={len(targets)}{''.join(audio_labels)}")
+        chains += audio_chains
+        audio_args = ["-c:a", video.audio_codec]
+
+    output_args = []
+    for k, (_, output_file) in enumerate(targets):
+        output_args += ["-map", video_labels[k]]
+        if audio_labels:
+            output_args += ["-map", audio_labels[k]]
+        output_args += [
+            "-t",
+            f"{total:.3f}",
+            "-c:v",
+            video.video_codec,
+            *encoder_args,
+            "-pix_fmt",
+            "yuv420p",
+            "-r",
+            str(out_fps),
+            *audio_args,
+        ]
+        if progressive:
+            output_args += _live_output_args(output_file, out_fps)
+        else:
+            output_args += ["-movflags", "+faststart", output_file]
+
+    return [*inputs, "-filter_complex", ";".join(chains), *output_args]
+
+
+def live_playlist(output_file: str) -> str:
+    """live/<video name>/index.m3u8 next to output_file, written by progressive renders."""
+    stem = os.path.splitext(os.path.basename(output_file))[0]
+    return os.path.join(os.path.dirname(output_file), LIVE_DIR, stem, LIVE_PLAYLIST)
+
+
+def _tee_escape(file_path: str, levels: int = 1) -> str:
+    """Escape a path for the tee muxer; slave option values are unescaped twice."""
+    file_path = os.path.abspath(file_path).replace("\\", "/")
+    for _ in range(levels):
+        for c in "\\:|[]":
+            file_path = file_path.replace(c, f"\\{c}")
+    return file_path
+
+
+def _live_output_args(output_file: str, out_fps: int) -> List[str]:
+    """Write one encode to output_file and to a growing HLS event playlist.
+
+    The tee muxer hands the same packets to both, so the live fragments cost
+    no extra encoding; if the live output fails the final file is still
+    written. Keyframes every live_segment_seconds let each fragment be
+    published as soon as it is complete.
+    """
+    try:
+        segment_seconds = max(1, int(config.app.get("live_segment_seconds", 2)))
+    except Exception:
+        segment_seconds = 2
+    playlist = live_playlist(output_file)
+    live_dir = os.path.dirname(playlist)
+    hls_options = ":".join(
+        [
+            "f=hls",
+            f"hls_time={segment_seconds}",
+            "hls_playlist_type=event",
+            "hls_segment_type=fmp4",
+            f"hls_segment_filename={_tee_escape(os.path.join(live_dir, 'seg-%05d.m4s'), levels=2)}",
+            "hls_fmp4_init_filename=init.mp4",
+        ]
+    )
+    return [
+        "-g",
+        str(out_fps * segment_seconds),
+        "-f",
+        "tee",
+        f"[f=mp4:movflags=+faststart]{_tee_escape(output_file)}|[{hls_options}]{_tee_escape(playlist)}",
+    ]
+
+
+def _reset_live(output_files: List[str]):
+    for output_file in output_files:
+        live_dir = os.path.dirname(live_playlist(output_file))
+        shutil.rmtree(live_dir, ignore_errors=True)
+        os.makedirs(live_dir, exist_ok=True)
+
+
+def render_segments(
+    segments: List[SegmentItem],
+    params: VideoParams,
+    output_file: str,
+    audio_file: str = "",
+    subtitle_path: str = "",
+    video_only: bool = False,
+    task_id: str = "",
+    preview: bool = False,
+    progressive: bool = False,
+) -> str:
+    """Render the segment plan straight to output_file. Returns "" on failure.
+
+    progressive publishes the encode as it goes to live_playlist(output_file).
+    """
+    segments = [s for s in segments if s.material and os.path.exists(s.material)]
+    if not segments:
+        logger.warning("ffmpeg engine: no segments with readable materials")
+        return ""
+
+    args = build_command(
+        segments,
+        params,
+        output_file,
+        audio_file=audio_file,
+        subtitle_path=subtitle_path,
+        video_only=video_only,
+        task_id=task_id,
+        preview=preview,
+        progressive=progressive,
+    )
+    if progressive:
+        _reset_live([output_file])
+    logger.info(f"ffmpeg engine: rendering {len(segments)} segments => {output_file}")
+    ok = ffmpeg_utils.run_ffmpeg(args)
+    video.delete_files(f"{output_file}.ass")
+    if not ok or not os.path.exists(output_file):
+        return ""
+    return output_file
+
+
+def render_aspects(
+    segments: List[SegmentItem],
+    params: VideoParams,
+    outputs: Dict[str, str],
+    audio_file: str = "",
+    subtitle_path: str = "",
+    task_id: str = "",
+    progressive: bool = False,
+) -> Dict[str, str]:
+    """Render the segment plan once per aspect in outputs, sharing the decode.
+
+    Every read of a source (see _plan_reads) is decoded once for all the
+    aspects: segments trimmed from it are split into per-aspect branches.
+    progressive publishes every output as it goes, see render_segments.
+    Returns {aspect: output_file} for the outputs that were written.
+    """
+    segments = [s for s in segments if s.material and os.path.exists(s.material)]
+    if not segments or not outputs:
+        logger.warning("ffmpeg engine: no segments with readable materials")
+        return {}
+
+    args = build_fanout_command(
+        segments,
+        params,
+        outputs,
+        audio_file=audio_file,
+        subtitle_path=subtitle_path,
+        task_id=task_id,
+        progressive=progressive,
+    )
+    if progressive:
+        _reset_live(list(outputs.values()))
+    logger.info(f"ffmpeg engine: rendering {len(segments)} segments => {', '.join(outputs.values())}")
+    ok = ffmpeg_utils.run_ffmpeg(args)
+    video.delete_files([f"{output_file}.ass" for output_file in outputs.values()])
+    if not ok:
+        return {}
+    return {aspect: f for aspect, f in outputs.items() if os.path.exists(f)}
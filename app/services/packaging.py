@@ -0,0 +1,189 @@
+"""Output packaging for rendered videos.
+
+Final videos are served straight from storage/tasks, so a browser has to
+reach the moov atom before playback can start. ensure_faststart moves it in
+front of the media data with a stream copy when an encoder left it at the
+end. package_hls adds an HLS rendition ladder (fMP4 segments, one media
+playlist per rung and a master playlist) next to the task's videos, so
+players can start on a small rendition and only fetch what they play.
+
+Enable it with output_hls = true; the ladder is a list of short-side sizes
+in hls_ladder.
+"""
+
+import os
+import shutil
+from typing import Dict, List
+
+from loguru import logger
+
+from app.config import config
+from app.services import probe
+from app.services.utils import ffmpeg_utils
+
+HLS_DIR = "hls"
+MASTER_PLAYLIST = "master.m3u8"
+
+
+def faststart_enabled() -> bool:
+    return bool(config.app.get("output_faststart", True))
+
+
+def hls_enabled() -> bool:
+    return bool(config.app.get("output_hls", False))
+
+
+def ensure_faststart(video_file: str) -> bool:
+    """Move the moov atom of an MP4 in front of its media data.
+
+    A no-op for files that already start fast or are not plain MP4s.
+    Returns False when the rewrite failed.
+    """
+    if probe.mp4_moov_first(video_file) is not False:
+        return True
+    temp_file = f"{video_file}.faststart.mp4"
+    ok = ffmpeg_utils.run_ffmpeg(
+        ["-i", video_file, "-map", "0", "-c", "copy", "-movflags", "+faststart", temp_file]
+    )
+    if not ok:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        logger.warning(f"failed to move the moov atom to the front: {video_file}")
+        return False
+    os.replace(temp_file, video_file)
+    return True
+
+
+def _ladder(short_side: int) -> List[int]:
+    """Rungs of hls_ladder that do not upscale the source, largest first."""
+    try:
+        rungs = sorted({int(r) for r in config.app.get("hls_ladder", [1080, 720, 480])}, reverse=True)
+    except Exception:
+        rungs = [1080, 720, 480]
+    rungs = [r for r in rungs if 0 < r <= short_side]
+    return rungs or [short_side]
+
+
+def _max_bitrate_kbps(rung: int) -> int:
+    # about 5 Mbps for 1080p, scaled by pixel count
+    return max(400, int(5000 * (rung / 1080) ** 2))
+
+
+def hls_dir(video_file: str) -> str:
+    """storage/tasks/<task_id>/hls/<video name>/ for a final video."""
+    stem = os.path.splitext(os.path.basename(video_file))[0]
+    return os.path.join(os.path.dirname(video_file), HLS_DIR, stem)
+
+
+def package_hls(video_file: str) -> str:
+    """Package video_file as an HLS ladder and return the master playlist path.
+
+    Every rung is encoded from a single decode with keyframes aligned to the
+    segment length, so players can switch renditions at any segment
+    boundary. An existing package newer than the video is reused.
+    Returns "" on failure.
+    """
+    info = probe.probe(video_file)
+    if not info or info["is_image"]:
+        logger.warning(f"cannot package unreadable video as HLS: {video_file}")
+        return ""
+
+    output_dir = hls_dir(video_file)
+    master = os.path.join(output_dir, MASTER_PLAYLIST)
+    if os.path.exists(master) and os.path.getmtime(master) >= os.path.getmtime(video_file):
+        return master
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    width, height = info["width"], info["height"]
+    portrait = height > width
+    rungs = _ladder(min(width, height))
+    try:
+        segment_seconds = max(1, int(config.app.get("hls_segment_seconds", 4)))
+    except Exception:
+        segment_seconds = 4
+    gop = max(1, round((info["fps"] or 30) * segment_seconds))
+
+    splits = "".join(f"[s{k}]" for k in range(len(rungs)))
+    chains = [f"[0:v:0]split={len(rungs)}{splits}"]
+    maps = []
+    rates = []
+    streams = []
+    for k, rung in enumerate(rungs):
+        scale = f"scale={rung}:-2" if portrait else f"scale=-2:{rung}"
+        chains.append(f"[s{k}]{scale}[v{k}]")
+        maps += ["-map", f"[v{k}]"]
+        if info["has_audio"]:
+            maps += ["-map", "0:a:0"]
+        rate = _max_bitrate_kbps(rung)
+        rates += [f"-maxrate:v:{k}", f"{rate}k", f"-bufsize:v:{k}", f"{rate * 2}k"]
+        streams.append(f"v:{k},a:{k},name:{rung}p" if info["has_audio"] else f"v:{k},name:{rung}p")
+
+    ok = ffmpeg_utils.run_ffmpeg(
+        [
+            "-i",
+            video_file,
+            "-filter_complex",
+            ";".join(chains),
+            *maps,
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-crf",
+            "23",
+            *rates,
+            "-g",
+            str(gop),
+            "-keyint_min",
+            str(gop),
+            "-sc_threshold",
+            "0",
+            "-c:a",
+            "aac",
+            "-b:a",
+            "128k",
+            "-f",
+            "hls",
+            "-hls_time",
+            str(segment_seconds),
+            "-hls_playlist_type",
+            "vod",
+            "-hls_segment_type",
+            "fmp4",
+            "-hls_segment_filename",
+            os.path.join(output_dir, "%v", "seg-%03d.m4s"),
+            "-hls_fmp4_init_filename",
+            "init.mp4",
+            "-master_pl_name",
+            MASTER_PLAYLIST,
+            "-var_stream_map",
+            " ".join(streams),
+            os.path.join(output_dir, "%v", "index.m3u8"),
+        ]
+    )
+    if not ok or not os.path.exists(master):
+        logger.error(f"failed to package video as HLS: {video_file}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return ""
+    logger.info(f"packaged {video_file} as HLS: {', '.join(f'{r}p' for r in rungs)}")
+    return master
+
+
+def package(video_files: List[str]) -> Dict[str, str]:
+    """Run the output packaging stage on final videos.
+
+    Returns {video_file: master_playlist} for the videos packaged as HLS,
+    empty when HLS packaging is disabled.
+    """
+    playlists = {}
+    for video_file in video_files:
+        if not video_file or not os.path.exists(video_file):
+            continue
+        if faststart_enabled():
+            ensure_faststart(video_file)
+        if hls_enabled():
+            master = package_hls(video_file)
+            if master:
+                playlists[video_file] = master
+    return playlists
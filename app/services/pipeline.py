@@ -0,0 +1,182 @@
+"""Task stages run as a dependency graph.
+
+A stage starts as soon as the stages it depends on have finished, so
+independent work overlaps: material search and download start once the
+search terms exist, while speech and subtitles are still being generated.
+The start offset and duration of every stage are recorded in the task state
+as stage_timings.
+
+With checkpoint, every stage given a dump function is recorded in the task
+manifest (see task_manifest) when it finishes, and restored from there
+instead of run again while its inputs and the outputs of the stages it
+depends on are unchanged.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from app.models import const
+from app.services import state as sm
+from app.services import task_manifest
+from app.utils import utils
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Any],
+        deps: Iterable[str] = (),
+        progress: int = 0,
+        inputs: Optional[Dict[str, Any]] = None,
+        dump: Optional[Callable[[Any], Any]] = None,
+        load: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.name = name
+        # called with the outputs of the finished stages, returns None when it failed
+        self.func = func
+        self.deps = list(deps)
+        # task progress once the stage is done, 0 leaves it to the stage itself
+        self.progress = progress
+        # parameters the output depends on, besides the outputs of deps
+        self.inputs = inputs or {}
+        # JSON form of the output for the checkpoint, and back; None when it
+        # can no longer be restored
+        self.dump = dump
+        self.load = load or (lambda data: data)
+
+
+def required(stages: Dict[str, Stage], targets: Iterable[str]) -> List[str]:
+    """targets and every stage they depend on, dependencies first."""
+    order = []
+
+    def visit(name):
+        if name in order:
+            return
+        for dep in stages[name].deps:
+            visit(dep)
+        order.append(name)
+
+    for target in targets:
+        visit(target)
+    return order
+
+
+def _timed(func: Callable, results: Dict[str, Any]):
+    start = time.time()
+    output = func(results)
+    return output, start, time.time()
+
+
+def _format_timings(timings: Dict[str, Dict]) -> str:
+    return ", ".join(f"{name} {t['seconds']}s" for name, t in timings.items())
+
+
+def run(
+    task_id: str, stages: List[Stage], targets: Iterable[str], checkpoint: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Run targets and the stages they depend on, each as early as possible.
+
+    Returns the output of every stage run, or None when one failed, in which
+    case the task is marked failed and no further stage starts. An exception
+    raised by a stage propagates.
+    """
+    graph = {stage.name: stage for stage in stages}
+    pending = required(graph, targets)
+    manifest = task_manifest.load(task_id) if checkpoint else {}
+    results = {}
+    timings = {}
+    running = {}
+    # fingerprints of the inputs of checkpointed stages, and of their outputs
+    fingerprints = {}
+    digests = {}
+    began = time.time()
+
+    def finished(name: str):
+        task = sm.state.get_task(task_id) or {}
+        sm.state.update_task(
+            task_id,
+            state=const.TASK_STATE_PROCESSING,
+            progress=max(graph[name].progress, task.get("progress", 0) or 0),
+            stage_timings=timings,
+        )
+
+    def restore(name: str) -> bool:
+        stage = graph[name]
+        if not checkpoint or not stage.dump:
+            return False
+        fingerprints[name] = utils.fingerprint(
+            stage=name, inputs=stage.inputs, deps={d: digests.get(d) for d in stage.deps}
+        )
+        if not all(d in digests for d in stage.deps):
+            return False
+        entry = task_manifest.restore(manifest, name, fingerprints[name])
+        if not entry:
+            return False
+        try:
+            output = stage.load(entry["output"])
+        except Exception as e:
+            logger.warning(f"task {task_id}: failed to restore stage {name}: {str(e)}")
+            return False
+        if output is None:
+            return False
+        results[name] = output
+        digests[name] = entry["digest"]
+        timings[name] = {"start": round(time.time() - began, 3), "seconds": 0, "restored": True}
+        logger.info(f"task {task_id}: stage {name} restored from its checkpoint")
+        finished(name)
+        return True
+
+    def save(name: str, output, seconds: float):
+        stage = graph[name]
+        if name not in fingerprints:
+            return
+        try:
+            entry = task_manifest.record(task_id, name, fingerprints[name], stage.dump(output), seconds)
+            digests[name] = entry["digest"]
+        except Exception as e:
+            logger.warning(f"task {task_id}: failed to checkpoint stage {name}: {str(e)}")
+
+    pool = ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix="task-stage")
+    try:
+        while pending or running:
+            # restoring a stage can make the stages after it ready in turn
+            ready = True
+            while ready:
+                ready = [n for n in pending if all(d in results for d in graph[n].deps)]
+                for name in ready:
+                    pending.remove(name)
+                    if not restore(name):
+                        running[pool.submit(_timed, graph[name].func, dict(results))] = name
+                ready = [n for n in ready if n in results]
+            if not pending and not running:
+                break
+            if not running:
+                raise ValueError(f"task stages depend on each other: {pending}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                output, start, end = future.result()
+                timings[name] = {"start": round(start - began, 3), "seconds": round(end - start, 3)}
+                if output is None:
+                    logger.error(f"task {task_id}: stage {name} failed after {end - start:.2f}s")
+                    sm.state.update_task(
+                        task_id, state=const.TASK_STATE_FAILED, progress=0, stage_timings=timings
+                    )
+                    return None
+
+                results[name] = output
+                logger.info(f"task {task_id}: stage {name} done in {end - start:.2f}s")
+                save(name, output, end - start)
+                finished(name)
+    finally:
+        # after a failure, stages already running finish before the task ends,
+        # so nothing keeps writing to its files
+        pool.shutdown(cancel_futures=True)
+
+    logger.info(f"task {task_id}: stages done in {time.time() - began:.2f}s, {_format_timings(timings)}")
+    return results
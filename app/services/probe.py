@@ -0,0 +1,430 @@
+"""Cheap, persistent media metadata probes.
+
+Opening a VideoFileClip only to read its duration or size launches a
+decoder and reads the first frame. Probes here only read container headers
+(ffprobe when installed, otherwise `ffmpeg -i`, plus a direct MP4 box parse
+for keyframes) and are cached in SQLite under storage/, keyed by path, size
+and mtime, so unchanged materials are never probed twice. The keyframe
+index of each material is cached the same way.
+
+A probe result is a dict:
+    duration, width, height (display size, rotation applied), fps, codec,
+    profile, rotation, has_audio, keyframe_interval (seconds or None),
+    is_image
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from PIL import Image
+
+from app.models import const
+from app.services.utils import ffmpeg_utils
+from app.utils import utils
+
+# bump when the shape or meaning of a probe result changes
+PROBE_VERSION = 1
+
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def db_path() -> str:
+    return os.path.join(utils.storage_dir(create=True), "probe_cache.db")
+
+
+def _connect() -> sqlite3.Connection:
+    path = db_path()
+    conn = sqlite3.connect(path, timeout=30)
+    with _init_lock:
+        if path not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for table in ("probes", "keyframes"):
+                conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                    "version INTEGER, info TEXT)"
+                )
+            conn.commit()
+            _initialized.add(path)
+    return conn
+
+
+def _ffprobe_binary() -> str:
+    found = shutil.which("ffprobe")
+    if found:
+        return found
+    # a static ffprobe shipped next to the configured ffmpeg
+    ffmpeg = ffmpeg_utils.ffmpeg_binary()
+    candidate = os.path.join(
+        os.path.dirname(ffmpeg), os.path.basename(ffmpeg).replace("ffmpeg", "ffprobe", 1)
+    )
+    if candidate != ffmpeg and os.path.isfile(candidate):
+        return candidate
+    return ""
+
+
+def _parse_rate(rate: str) -> float:
+    try:
+        num, _, den = (rate or "").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _probe_ffprobe(binary: str, file_path: str) -> dict:
+    proc = subprocess.run(
+        [
+            binary,
+            "-v", "error",
+            "-show_entries",
+            "format=duration:stream=codec_type,codec_name,profile,width,height,"
+            "avg_frame_rate,r_frame_rate:stream_tags=rotate:stream_side_data=rotation",
+            "-of", "json",
+            file_path,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        raise IOError(proc.stderr.decode("utf-8", "ignore").strip())
+    data = json.loads(proc.stdout or b"{}")
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if not video:
+        raise IOError("no video stream")
+    rotation = 0
+    try:
+        rotation = int((video.get("tags") or {}).get("rotate", 0))
+    except ValueError:
+        pass
+    for side_data in video.get("side_data_list") or []:
+        if "rotation" in side_data:
+            rotation = int(side_data["rotation"])
+    return {
+        "duration": float((data.get("format") or {}).get("duration") or 0.0),
+        "width": int(video.get("width") or 0),
+        "height": int(video.get("height") or 0),
+        "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+        "codec": video.get("codec_name"),
+        "profile": video.get("profile"),
+        "rotation": rotation,
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+def _probe_ffmpeg(file_path: str) -> dict:
+    infos = ffmpeg_parse_infos(file_path)
+    if not infos.get("video_found"):
+        raise IOError("no video stream")
+    width, height = (infos.get("video_size") or (0, 0))[:2]
+    profile = (infos.get("video_profile") or "").strip("()") or None
+    return {
+        "duration": float(infos.get("duration") or 0.0),
+        "width": int(width),
+        "height": int(height),
+        "fps": float(infos.get("video_fps") or 0.0),
+        "codec": infos.get("video_codec_name"),
+        "profile": profile,
+        "rotation": int(infos.get("video_rotation", 0) or 0),
+        "has_audio": bool(infos.get("audio_found")),
+    }
+
+
+def _iter_boxes(f, start: int, end: int):
+    """Yield (type, payload_offset, payload_end) for the boxes in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = pos + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload += 8
+        elif size == 0:
+            size = end - pos
+        if size < 8:
+            return
+        yield box_type, payload, min(pos + size, end)
+        pos += size
+
+
+def _find_box(f, start: int, end: int, box_type: bytes):
+    for t, payload, box_end in _iter_boxes(f, start, end):
+        if t == box_type:
+            return payload, box_end
+    return None
+
+
+def mp4_keyframe_times(file_path: str) -> Optional[List[float]]:
+    """Keyframe timestamps of the first video track, read from the stss/stts boxes.
+
+    Returns None when the file is not a (non-fragmented) MP4/MOV or the track
+    has no sync sample table, which means every frame is a keyframe.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            file_end = os.fstat(f.fileno()).st_size
+            moov = _find_box(f, 0, file_end, b"moov")
+            if not moov:
+                return None
+            for t, trak, trak_end in _iter_boxes(f, *moov):
+                if t != b"trak":
+                    continue
+                mdia = _find_box(f, trak, trak_end, b"mdia")
+                if not mdia:
+                    continue
+                hdlr = _find_box(f, *mdia, b"hdlr")
+                if not hdlr:
+                    continue
+                f.seek(hdlr[0] + 8)
+                if f.read(4) != b"vide":
+                    continue
+
+                mdhd = _find_box(f, *mdia, b"mdhd")
+                f.seek(mdhd[0])
+                version = f.read(1)[0]
+                f.seek(mdhd[0] + (20 if version == 1 else 12))
+                timescale = struct.unpack(">I", f.read(4))[0]
+
+                minf = _find_box(f, *mdia, b"minf")
+                stbl = _find_box(f, *minf, b"stbl") if minf else None
+                stss = _find_box(f, *stbl, b"stss") if stbl else None
+                stts = _find_box(f, *stbl, b"stts") if stbl else None
+                if not stss or not stts or not timescale:
+                    return None
+
+                f.seek(stss[0] + 4)
+                count = struct.unpack(">I", f.read(4))[0]
+                sync_samples = struct.unpack(f">{count}I", f.read(4 * count))
+
+                f.seek(stts[0] + 4)
+                entries = struct.unpack(">I", f.read(4))[0]
+                deltas = struct.unpack(f">{entries * 2}I", f.read(8 * entries))
+
+                # walk the (sample_count, sample_delta) runs to timestamp each sync sample
+                times = []
+                sample, dts, k = 1, 0, 0
+                for i in range(entries):
+                    run, delta = deltas[2 * i], deltas[2 * i + 1]
+                    while k < count and sync_samples[k] < sample + run:
+                        times.append((dts + (sync_samples[k] - sample) * delta) / timescale)
+                        k += 1
+                    sample += run
+                    dts += run * delta
+                return times
+    except Exception as e:
+        logger.debug(f"failed to read keyframes from {file_path}: {str(e)}")
+    return None
+
+
+def mp4_moov_first(file_path: str) -> Optional[bool]:
+    """Whether the moov box precedes mdat, so playback can start before the download ends.
+
+    Returns None when the file is not an MP4/MOV with both top-level boxes.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            file_end = os.fstat(f.fileno()).st_size
+            for t, _, _ in _iter_boxes(f, 0, file_end):
+                if t == b"moov":
+                    return True
+                if t == b"mdat":
+                    return False if _find_box(f, 0, file_end, b"moov") else None
+    except Exception as e:
+        logger.debug(f"failed to read the box layout of {file_path}: {str(e)}")
+    return None
+
+
+def _keyframe_interval(file_path: str, duration: float) -> Optional[float]:
+    times = mp4_keyframe_times(file_path)
+    if not times:
+        return None
+    if len(times) == 1:
+        return round(duration, 3)
+    return round((times[-1] - times[0]) / (len(times) - 1), 3)
+
+
+def _probe_file(file_path: str) -> Optional[dict]:
+    try:
+        if utils.parse_extension(file_path) in const.FILE_TYPE_IMAGES:
+            with Image.open(file_path) as img:
+                width, height = img.size
+            return {
+                "duration": 0.0,
+                "width": width,
+                "height": height,
+                "fps": 0.0,
+                "codec": None,
+                "profile": None,
+                "rotation": 0,
+                "has_audio": False,
+                "keyframe_interval": None,
+                "is_image": True,
+            }
+
+        binary = _ffprobe_binary()
+        info = _probe_ffprobe(binary, file_path) if binary else _probe_ffmpeg(file_path)
+        if abs(info["rotation"]) in (90, 270):
+            # report the display size, like VideoFileClip does
+            info["width"], info["height"] = info["height"], info["width"]
+        info["keyframe_interval"] = _keyframe_interval(file_path, info["duration"])
+        info["is_image"] = False
+        return info
+    except Exception as e:
+        logger.warning(f"failed to probe {file_path}: {str(e)}")
+        return None
+
+
+def _identity(file_path: str):
+    try:
+        st = os.stat(file_path)
+        return os.path.abspath(file_path), st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+
+def _cached_many(table: str, file_paths: Iterable[str], compute) -> dict:
+    """Look file_paths up in a cache table, computing and storing the misses.
+
+    Rows are keyed by absolute path and only used while the file size, mtime
+    and PROBE_VERSION still match. Misses are computed in parallel and
+    written back in one transaction; None results are not cached.
+    """
+    file_paths = list(dict.fromkeys(file_paths))
+    results = {p: None for p in file_paths}
+    identities = {p: _identity(p) for p in file_paths}
+    wanted = {i[0]: p for p, i in identities.items() if i}
+    if not wanted:
+        return results
+
+    cached = {}
+    try:
+        conn = _connect()
+        try:
+            keys = list(wanted)
+            for n in range(0, len(keys), 500):
+                chunk = keys[n : n + 500]
+                rows = conn.execute(
+                    f"SELECT path, size, mtime_ns, version, info FROM {table} "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for path, size, mtime_ns, version, info in rows:
+                    cached[path] = (size, mtime_ns, version, info)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"probe cache unavailable: {str(e)}")
+
+    missing = []
+    for p in file_paths:
+        identity = identities[p]
+        if not identity:
+            continue
+        row = cached.get(identity[0])
+        if row and row[:3] == (identity[1], identity[2], PROBE_VERSION):
+            results[p] = json.loads(row[3])
+        else:
+            missing.append(p)
+    if not missing:
+        return results
+
+    logger.debug(f"{table}: computing {len(missing)} of {len(file_paths)} files")
+    with ThreadPoolExecutor(max_workers=min(8, len(missing))) as pool:
+        computed = list(pool.map(compute, missing))
+
+    rows = []
+    for p, value in zip(missing, computed):
+        results[p] = value
+        if value is not None:
+            path, size, mtime_ns = identities[p]
+            rows.append((path, size, mtime_ns, PROBE_VERSION, json.dumps(value)))
+    if rows:
+        try:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)", rows)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"failed to update probe cache: {str(e)}")
+    return results
+
+
+def probe_many(file_paths: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """Probe files in bulk, returning {path: info or None}.
+
+    Cached entries are read with one query; only new or changed files are
+    probed, in parallel, and written back in one transaction.
+    """
+    return _cached_many("probes", file_paths, lambda p: _probe_file(p))
+
+
+def probe(file_path: str) -> Optional[dict]:
+    """Probe one file. Returns None when it cannot be read as media."""
+    return probe_many([file_path])[file_path]
+
+
+def _scan_keyframes(file_path: str) -> Optional[List[float]]:
+    """Keyframe times of any container by decoding keyframes only with ffmpeg."""
+    proc = subprocess.run(
+        [
+            ffmpeg_utils.ffmpeg_binary(),
+            "-hide_banner",
+            "-skip_frame", "nokey",
+            "-i", file_path,
+            "-map", "0:v:0",
+            "-vf", "showinfo",
+            "-f", "null",
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if proc.returncode != 0:
+        return None
+    times = []
+    for line in proc.stderr.decode("utf-8", "ignore").splitlines():
+        _, found, rest = line.partition(" pts_time:")
+        if found:
+            try:
+                times.append(round(float(rest.split()[0]), 6))
+            except (ValueError, IndexError):
+                continue
+    return times or None
+
+
+def _keyframe_index(file_path: str) -> Optional[List[float]]:
+    if utils.parse_extension(file_path) in const.FILE_TYPE_IMAGES:
+        return None
+    try:
+        return mp4_keyframe_times(file_path) or _scan_keyframes(file_path)
+    except Exception as e:
+        logger.warning(f"failed to index keyframes of {file_path}: {str(e)}")
+        return None
+
+
+def keyframes_many(file_paths: Iterable[str]) -> Dict[str, Optional[List[float]]]:
+    """Keyframe timestamps (seconds, ascending) per file, built once and cached.
+
+    Returns None for images and files whose keyframes cannot be read.
+    """
+    return _cached_many("keyframes", file_paths, lambda p: _keyframe_index(p))
+
+
+def keyframes(file_path: str) -> Optional[List[float]]:
+    return keyframes_many([file_path])[file_path]
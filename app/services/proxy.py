@@ -0,0 +1,169 @@
+"""Low-resolution proxy tier for preview renders.
+
+Previews do not need the full 1080p canvas: they are baked at a reduced
+size and frame rate with a fast encoder preset, from proxy copies of the
+materials. A proxy is the material scaled down to fit the preview canvas,
+at the preview frame rate, without audio and with a keyframe every second
+so segment cuts seek cheaply. Proxies keep the source timestamps, so
+segment start/end points apply to them unchanged, and they are cached under
+storage/cache_proxies keyed by the material and the proxy settings.
+"""
+
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+from app.config import config
+from app.models import const
+from app.models.schema import SegmentItem, VideoAspect
+from app.services.utils import ffmpeg_utils
+from app.utils import utils
+
+# bump when the proxy encoding changes in a way that alters its output
+PROXY_VERSION = 1
+
+
+def _config_number(key: str, default, cast=int):
+    try:
+        return cast(config.app.get(key, default))
+    except Exception:
+        return default
+
+
+def settings() -> dict:
+    """Preview render settings from config, with sane lower bounds."""
+    return {
+        "height": max(144, _config_number("preview_height", 540)),
+        "fps": max(1, _config_number("preview_fps", 15)),
+        "preset": str(config.app.get("preview_preset", "ultrafast") or "ultrafast"),
+        "crf": _config_number("preview_crf", 28),
+    }
+
+
+def resolution(aspect: VideoAspect) -> Tuple[int, int]:
+    """Preview canvas for an aspect: its short side scaled to the preview height."""
+    width, height = VideoAspect(aspect).to_resolution()
+    scale = min(1.0, settings()["height"] / min(width, height))
+    # libx264 with yuv420p needs even dimensions
+    return int(width * scale) // 2 * 2, int(height * scale) // 2 * 2
+
+
+def encoder_params() -> List[str]:
+    """Extra ffmpeg output arguments for preview encodes."""
+    return ["-crf", str(settings()["crf"])]
+
+
+def _max_size_bytes() -> int:
+    size_mb = _config_number("preview_proxy_max_size_mb", 1024, float)
+    return int(size_mb * 1024 * 1024)
+
+
+def cache_dir() -> str:
+    return utils.storage_dir("cache_proxies", create=True)
+
+
+def _proxy_key(material: str) -> str:
+    st = os.stat(material)
+    data = {
+        "version": PROXY_VERSION,
+        "path": os.path.abspath(material),
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "box": max(resolution(VideoAspect.portrait)),
+        **settings(),
+    }
+    return utils.md5(json.dumps(data, sort_keys=True))
+
+
+def _make_proxy(material: str) -> str:
+    """Return the proxy for one material, transcoding it on a cache miss.
+
+    Images and unreadable files are returned as-is, so a failed proxy only
+    costs preview speed, never the preview itself.
+    """
+    if utils.parse_extension(material) in const.FILE_TYPE_IMAGES:
+        return material
+    try:
+        key = _proxy_key(material)
+    except OSError:
+        return material
+    proxy_file = os.path.join(cache_dir(), f"{key}.mp4")
+    if os.path.exists(proxy_file) and os.path.getsize(proxy_file) > 0:
+        try:
+            os.utime(proxy_file)
+        except OSError:
+            pass
+        return proxy_file
+
+    s = settings()
+    # any canvas orientation fits in a square of the preview's long side
+    box = max(resolution(VideoAspect.portrait))
+    # unique per writer: previews of the same material may race to create it
+    temp_file = os.path.join(cache_dir(), f"{key}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp.mp4")
+    ok = ffmpeg_utils.run_ffmpeg(
+        [
+            "-i", material,
+            "-an",
+            "-vf",
+            f"scale='min(iw,{box})':'min(ih,{box})':force_original_aspect_ratio=decrease:force_divisible_by=2,fps={s['fps']}",
+            "-c:v", "libx264",
+            "-preset", s["preset"],
+            "-crf", "23",
+            "-g", str(s["fps"]),
+            "-pix_fmt", "yuv420p",
+            temp_file,
+        ]
+    )
+    if not ok or not os.path.exists(temp_file):
+        logger.warning(f"failed to create preview proxy for {material}, using the original")
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        return material
+    try:
+        os.replace(temp_file, proxy_file)
+    except OSError as e:
+        logger.warning(f"failed to publish preview proxy for {material}: {str(e)}")
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        # a concurrent writer may have published it already
+        if os.path.exists(proxy_file) and os.path.getsize(proxy_file) > 0:
+            return proxy_file
+        return material
+    return proxy_file
+
+
+def proxies_for(materials: Iterable[str]) -> Dict[str, str]:
+    """Return {material: proxy path}, creating missing proxies in parallel."""
+    materials = [m for m in dict.fromkeys(materials) if m and os.path.exists(m)]
+    if not materials:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(4, len(materials))) as pool:
+        proxies = dict(zip(materials, pool.map(_make_proxy, materials)))
+    evict(keep=proxies.values())
+    return proxies
+
+
+def proxy_segments(segments: List[SegmentItem]) -> List[SegmentItem]:
+    """Copies of segments that read their material from its proxy."""
+    proxies = proxies_for(s.material for s in segments)
+    return [
+        s.model_copy(update={"material": proxies[s.material]}) if s.material in proxies else s
+        for s in segments
+    ]
+
+
+def evict(keep: Iterable[str] = ()):
+    utils.evict_lru_files(
+        cache_dir(),
+        _max_size_bytes(),
+        suffix=".mp4",
+        keep=[os.path.basename(k) for k in keep],
+    )
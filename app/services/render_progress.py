@@ -0,0 +1,153 @@
+"""Frame-accurate progress of moviepy encodes.
+
+moviepy reports every frame it writes to a proglog logger. A render opens a
+tracking() scope with its frame budget; frame_logger() then returns a logger
+that counts the frames of each write_videofile call (segment bakes, clip
+normalization, merges, the final pass and its chunks) into one shared
+counter. Worker processes inherit the counter through the pool initializer
+(see video._process_pool), so parallel encodes are counted too.
+
+A ticker thread publishes frames done, the current encode fps and an ETA to
+sm.state every render_progress_interval seconds, as the task's progress and
+its render_progress field, so the hot encode loop never touches the state
+backend.
+"""
+
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import proglog
+from loguru import logger
+
+from app.config import config
+from app.services import state as sm
+
+_ctx = multiprocessing.get_context("spawn")
+# the render scope of the current task thread
+_current: ContextVar[Optional["RenderProgress"]] = ContextVar("render_progress", default=None)
+# the counter a pool worker inherited from the render that started it
+_worker_frames = None
+
+
+def _interval() -> float:
+    try:
+        return max(0.1, float(config.app.get("render_progress_interval", 1.0)))
+    except Exception:
+        return 1.0
+
+
+class FrameLogger(proglog.ProgressBarLogger):
+    """proglog logger adding the frames moviepy writes to a shared counter."""
+
+    def __init__(self, frames):
+        # audio is written in "chunk" bars, only video frames are counted
+        super().__init__(ignored_bars=("chunk",), logged_bars=None, min_time_interval=0.2)
+        self._frames = frames
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar != "frame_index" or attr != "index":
+            return
+        done = value - max(old_value or 0, 0)
+        if done > 0:
+            with self._frames.get_lock():
+                self._frames.value += done
+
+
+class RenderProgress:
+    """Frames done against a frame budget, published as progress start..end."""
+
+    def __init__(self, task_id: str, total_frames: int, start: float = 0, end: float = 100):
+        self.task_id = task_id
+        self.total_frames = max(1, int(total_frames))
+        self.start = start
+        self.end = end
+        self.frames = _ctx.Value("q", 0)
+        self._progress = start
+        self._fps = 0.0
+        self._last = (time.monotonic(), 0)
+        self._stop = threading.Event()
+        self._ticker = None
+
+    def snapshot(self) -> dict:
+        done = self.frames.value
+        now = time.monotonic()
+        last_time, last_done = self._last
+        if now > last_time and done >= last_done:
+            rate = (done - last_done) / (now - last_time)
+            # smoothed, so a slow merge between encodes does not zero it out
+            self._fps = rate if not self._fps else 0.5 * self._fps + 0.5 * rate
+        self._last = (now, done)
+        total = max(self.total_frames, done)
+        remaining = total - done
+        eta = round(remaining / self._fps, 1) if self._fps > 0 else None
+        # estimates can overshoot, progress never goes backwards
+        self._progress = max(self._progress, self.start + (self.end - self.start) * done / total)
+        return {
+            "frames": done,
+            "total_frames": total,
+            "fps": round(self._fps, 1),
+            "eta": eta if remaining else 0,
+        }
+
+    def publish(self):
+        try:
+            render_progress = self.snapshot()
+            sm.state.update_task(self.task_id, progress=self._progress, render_progress=render_progress)
+        except Exception as e:
+            logger.warning(f"failed to publish render progress: {str(e)}")
+
+    def _run(self):
+        interval = _interval()
+        while not self._stop.wait(interval):
+            self.publish()
+
+    def __enter__(self):
+        self._ticker = threading.Thread(target=self._run, name=f"render-progress-{self.task_id}", daemon=True)
+        self._ticker.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._ticker.join()
+        self.publish()
+
+
+@contextmanager
+def tracking(task_id: str, total_frames: int, start: float = 0, end: float = 100):
+    """Count moviepy encodes in this block towards task_id's progress.
+
+    Without a task_id nothing is tracked and frame_logger() stays None.
+    """
+    if not task_id:
+        yield None
+        return
+    with RenderProgress(task_id, total_frames, start, end) as progress:
+        token = _current.set(progress)
+        try:
+            yield progress
+        finally:
+            _current.reset(token)
+
+
+def shared_frames():
+    """Counter of the current render scope, handed to pool workers."""
+    progress = _current.get()
+    return progress.frames if progress else None
+
+
+def init_worker(frames):
+    """Pool initializer: count this worker's encodes into the parent's render."""
+    global _worker_frames
+    _worker_frames = frames
+
+
+def frame_logger() -> Optional[FrameLogger]:
+    """Logger for write_videofile, or None (silent) outside a tracked render."""
+    frames = shared_frames()
+    if frames is None:
+        frames = _worker_frames
+    return FrameLogger(frames) if frames is not None else None
@@ -0,0 +1,56 @@
+"""Per-task stage fingerprints for incremental re-renders.
+
+A segment render runs in stages (segments -> combined video, combined video
++ audio + subtitles + BGM -> final video). After each stage its input
+fingerprint and the identity of the file it wrote are recorded in
+storage/tasks/<task_id>/render_manifest.json. A re-render recomputes the
+fingerprints and resumes at the first stage whose inputs changed, or whose
+output was replaced or removed since it was recorded.
+"""
+
+import os
+
+from app.utils import utils
+
+MANIFEST_FILE = "render_manifest.json"
+
+STAGE_COMBINED = "combined"
+STAGE_FINAL = "final"
+
+
+def _manifest_path(task_id: str) -> str:
+    return os.path.join(utils.task_dir(task_id), MANIFEST_FILE)
+
+
+def load(task_id: str) -> dict:
+    return utils.load_json_file(_manifest_path(task_id))
+
+
+def is_fresh(manifest: dict, stage: str, stage_fingerprint: str, output_file: str) -> bool:
+    """True when the stage ran with these inputs and its output is untouched."""
+    entry = manifest.get(stage) or {}
+    if entry.get("fingerprint") != stage_fingerprint:
+        return False
+    return bool(output_file) and entry.get("output") == utils.file_identity(output_file)
+
+
+def record(task_id: str, stage: str, stage_fingerprint: str, output_file: str):
+    manifest = load(task_id)
+    manifest[stage] = {
+        "fingerprint": stage_fingerprint,
+        "output": utils.file_identity(output_file),
+    }
+    _write(task_id, manifest)
+
+
+def invalidate(task_id: str, *stages: str):
+    manifest = load(task_id)
+    if not any(stage in manifest for stage in stages):
+        return
+    for stage in stages:
+        manifest.pop(stage, None)
+    _write(task_id, manifest)
+
+
+def _write(task_id: str, manifest: dict):
+    utils.write_json_file(_manifest_path(task_id), manifest)
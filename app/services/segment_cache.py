@@ -0,0 +1,161 @@
+"""Content-addressed cache of baked segment clips.
+
+A baked clip only depends on the source file and on how the segment is cut,
+resized and transitioned, so it is stored under a hash of exactly those
+inputs. Re-rendering a timeline then only bakes segments that changed, and
+looped copies of the same material range are baked once.
+
+The cache is shared by every render on the machine. A render pins the keys
+it uses until it has merged them (a pin file per render under pins/), and
+eviction runs after the merge and never drops a pinned clip. Bakes write to
+a temp file unique to the bake and publish it with os.replace, so two
+renders baking the same key never touch each other's files.
+"""
+
+import glob
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterable, Set
+
+from loguru import logger
+
+from app.config import config
+from app.models.schema import SegmentItem, VideoParams
+from app.utils import utils
+
+# bump when the bake pipeline changes in a way that alters its output
+BAKE_VERSION = 2
+
+# pins and temp files older than this were left by a render that died
+STALE_SECONDS = 24 * 3600
+
+
+def max_size_bytes() -> int:
+    try:
+        size_mb = float(config.app.get("segment_cache_max_size_mb", 2048))
+    except Exception:
+        size_mb = 2048
+    return int(size_mb * 1024 * 1024)
+
+
+def enabled() -> bool:
+    return max_size_bytes() > 0
+
+
+def cache_dir() -> str:
+    d = (config.app.get("segment_cache_dir", "") or "").strip()
+    if not d:
+        d = utils.storage_dir("cache_segments")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def segment_key(s: SegmentItem, params: VideoParams, extra: dict | None = None) -> str:
+    """Hash every input that affects the baked output of a segment."""
+    transition = s.transition or getattr(params.video_transition_mode, "value", params.video_transition_mode)
+    data = {
+        "version": BAKE_VERSION,
+        "material": utils.file_identity(s.material),
+        "start": round(float(s.start), 3),
+        "end": round(float(s.end), 3),
+        "duration": round(float(s.duration), 3),
+        "speed": float(s.speed or 1.0),
+        "fit": s.fit or "contain",
+        "transition": transition,
+        "transition_duration": s.transition_duration,
+        "transition_direction": s.transition_direction,
+        "transition_mask": s.transition_mask,
+        "aspect": getattr(params.video_aspect, "value", params.video_aspect),
+        **(extra or {}),
+    }
+    return utils.md5(json.dumps(data, sort_keys=True, default=str))
+
+
+def path_for(key: str) -> str:
+    return os.path.join(cache_dir(), f"{key}.mp4")
+
+
+def temp_path(key: str) -> str:
+    """A temp file for one bake of key, unique across concurrent renders."""
+    # keep the .mp4 suffix so moviepy picks the right container
+    return os.path.join(cache_dir(), f"{key}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp.mp4")
+
+
+def lookup(key: str) -> str:
+    """Return the cached clip for key and mark it recently used, or ""."""
+    file_path = path_for(key)
+    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        try:
+            os.utime(file_path)
+        except OSError:
+            pass
+        return file_path
+    return ""
+
+
+def commit(key: str, baked_file: str) -> str:
+    """Move a freshly baked temp clip into its final cache location."""
+    file_path = path_for(key)
+    os.replace(baked_file, file_path)
+    return file_path
+
+
+def _pins_dir() -> str:
+    d = os.path.join(cache_dir(), "pins")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+@contextmanager
+def pinned(keys: Iterable[str]):
+    """Keep the clips of keys from being evicted, by any process, inside the block."""
+    pin_file = os.path.join(_pins_dir(), f"{os.getpid()}-{uuid.uuid4().hex}.json")
+    try:
+        with open(pin_file, "w", encoding="utf-8") as f:
+            json.dump(sorted(set(keys)), f)
+    except Exception as e:
+        logger.warning(f"failed to pin cached segments: {str(e)}")
+    try:
+        yield
+    finally:
+        try:
+            os.remove(pin_file)
+        except OSError:
+            pass
+
+
+def pinned_keys() -> Set[str]:
+    keys = set()
+    now = time.time()
+    for pin_file in glob.glob(os.path.join(_pins_dir(), "*.json")):
+        try:
+            if now - os.path.getmtime(pin_file) > STALE_SECONDS:
+                os.remove(pin_file)
+                continue
+            with open(pin_file, "r", encoding="utf-8") as f:
+                keys.update(json.load(f))
+        except Exception:
+            # removed by its render while being read
+            continue
+    return keys
+
+
+def evict(keep: Iterable[str] = ()):
+    """Drop least recently used clips until the cache fits its size budget.
+
+    Clips pinned by a render in progress and the keys in keep are never dropped.
+    """
+    now = time.time()
+    for temp_file in glob.glob(os.path.join(cache_dir(), "*.tmp.mp4")):
+        try:
+            if now - os.path.getmtime(temp_file) > STALE_SECONDS:
+                os.remove(temp_file)
+        except OSError:
+            continue
+    keep = set(keep) | pinned_keys()
+    utils.evict_lru_files(
+        cache_dir(), max_size_bytes(), suffix=".mp4", keep=[f"{k}.mp4" for k in keep]
+    )
@@ -11,6 +11,11 @@ class BaseState(ABC):
     def update_task(self, task_id: str, state: int, progress: int = 0, **kwargs):
         pass
 
+    # set only the given fields, leaving state and progress as they are
+    @abstractmethod
+    def update_task_fields(self, task_id: str, **fields):
+        pass
+
     @abstractmethod
     def get_task(self, task_id: str):
         pass
@@ -54,6 +59,9 @@ class MemoryState(BaseState):
         }
         self._tasks[task_id] = merged
 
+    def update_task_fields(self, task_id: str, **fields):
+        self._tasks[task_id] = {**self._tasks.get(task_id, {}), "task_id": task_id, **fields}
+
     def get_task(self, task_id: str):
         return self._tasks.get(task_id, None)
 
@@ -112,6 +120,10 @@ class RedisState(BaseState):
         for field, value in fields.items():
             self._redis.hset(task_id, field, str(value))
 
+    def update_task_fields(self, task_id: str, **fields):
+        fields = {"task_id": task_id, **fields}
+        self._redis.hset(task_id, mapping={field: str(value) for field, value in fields.items()})
+
     def get_task(self, task_id: str):
         task_data = self._redis.hgetall(task_id)
         if not task_data:
@@ -0,0 +1,182 @@
+"""Write subtitle cues as an ASS script for libass burn-in.
+
+The script uses the video resolution as PlayRes, so font sizes, outlines and
+margins are the same pixel values the moviepy overlay uses. Each distinct
+merged style (global VideoParams plus per-segment overrides) becomes one ASS
+style, and cues reference it by name.
+"""
+
+import os
+import struct
+from functools import lru_cache
+from typing import List, Tuple
+
+from PIL import ImageColor, ImageFont
+
+# (start, end, text, style) where style is a dict from video._subtitle_style
+Cue = Tuple[float, float, str, dict]
+
+
+def _ass_color(color, default: str = "&H00FFFFFF") -> str:
+    if not isinstance(color, str) or not color.strip():
+        return default
+    try:
+        r, g, b = ImageColor.getrgb(color.strip())[:3]
+    except ValueError:
+        return default
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+
+def _win_height_ratio(font_path: str) -> float:
+    """(usWinAscent + usWinDescent) / unitsPerEm from the OS/2 and head tables."""
+    with open(font_path, "rb") as f:
+        data = f.read()
+    offset = 0
+    if data[:4] == b"ttcf":
+        # first face of a collection, the one PIL loads by default
+        offset = struct.unpack(">I", data[12:16])[0]
+    num_tables = struct.unpack(">H", data[offset + 4 : offset + 6])[0]
+    tables = {}
+    for i in range(num_tables):
+        entry = offset + 12 + 16 * i
+        tag, _, table_offset, _ = struct.unpack(">4sIII", data[entry : entry + 16])
+        tables[tag] = table_offset
+    head, os2 = tables[b"head"], tables[b"OS/2"]
+    units_per_em = struct.unpack(">H", data[head + 18 : head + 20])[0]
+    win_ascent, win_descent = struct.unpack(">HH", data[os2 + 74 : os2 + 78])
+    if not units_per_em or not (win_ascent + win_descent):
+        raise ValueError("missing font metrics")
+    return (win_ascent + win_descent) / units_per_em
+
+
+@lru_cache(maxsize=64)
+def _font_metrics(font_path: str, font_size: int) -> Tuple[str, str, int, int]:
+    """Return the family, style name, ASS font size and line height for a PIL font size.
+
+    libass sizes a font by its OS/2 win ascent + descent while PIL uses the
+    em size, so the size is converted to render both at the same scale.
+    """
+    try:
+        font = ImageFont.truetype(font_path, font_size)
+    except Exception:
+        return os.path.splitext(os.path.basename(font_path or ""))[0], "", font_size, font_size
+    ascent, descent = font.getmetrics()
+    try:
+        ass_size = round(font_size * _win_height_ratio(font_path))
+    except Exception:
+        ass_size = ascent + descent
+    family, style_name = font.getname()
+    return family, style_name or "", max(1, ass_size), ascent + descent
+
+
+def _ass_time(t: float) -> str:
+    cs = int(round(max(0.0, t) * 100))
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+def _ass_text(text: str) -> str:
+    # libass has no escape for a backslash; a word joiner after it keeps it
+    # from starting an override (\N, \n, \h) and draws nothing itself
+    text = (text or "").replace("\\", "\\\u2060").replace("{", "\\{").replace("}", "\\}")
+    return text.replace("\r", "").replace("\n", "\\N")
+
+
+def _style_line(name: str, style: dict, width: int, height: int) -> str:
+    family, style_name, size, _ = _font_metrics(style["font_path"], style["font_size"])
+    # libass matches faces by family plus these flags
+    bold = -1 if "bold" in style_name.lower() else 0
+    italic = -1 if "italic" in style_name.lower() or "oblique" in style_name.lower() else 0
+    position = style["position"]
+    alignment = 2
+    if position in ("top", "custom"):
+        alignment = 8
+    elif position == "center":
+        alignment = 5
+
+    bg_color = style.get("bg_color")
+    if isinstance(bg_color, str) and bg_color.strip():
+        # opaque box behind the text, drawn with the outline colour
+        border_style, outline_color, outline = 3, _ass_color(bg_color, "&H00000000"), 0
+    else:
+        border_style = 1
+        outline_color = _ass_color(style["stroke_color"], "&H00000000")
+        outline = float(style["stroke_width"] or 0)
+
+    margin_lr = int(width * 0.05)
+    margin_v = int(height * 0.05)
+    fields = [
+        name,
+        family,
+        size,
+        _ass_color(style["color"]),
+        _ass_color(style["color"]),
+        outline_color,
+        "&H00000000",
+        bold, italic, 0, 0,
+        100, 100, 0, 0,
+        border_style,
+        outline,
+        0,
+        alignment,
+        margin_lr,
+        margin_lr,
+        margin_v,
+        1,
+    ]
+    return "Style: " + ",".join(str(f) for f in fields)
+
+
+def _position_tag(text: str, style: dict, width: int, height: int) -> str:
+    """Absolute placement for custom positions, mirroring the moviepy overlay."""
+    if style["position"] != "custom":
+        return ""
+    _, _, _, line_height = _font_metrics(style["font_path"], style["font_size"])
+    text_h = line_height * (text.count("\n") + 1)
+    margin = 10
+    y = (height - text_h) * (float(style["custom_position"]) / 100)
+    y = max(margin, min(y, height - text_h - margin))
+    return f"{{\\pos({width // 2},{int(y)})}}"
+
+
+def write_ass(cues: List[Cue], width: int, height: int, output_file: str) -> str:
+    """Write cues to output_file. Returns the path, or "" when there are no cues."""
+    if not cues:
+        return ""
+
+    styles = {}
+    events = []
+    for t0, t1, text, style in cues:
+        key = tuple(sorted((k, str(v)) for k, v in style.items()))
+        if key not in styles:
+            styles[key] = (f"S{len(styles)}", style)
+        name = styles[key][0]
+        events.append(
+            f"Dialogue: 0,{_ass_time(t0)},{_ass_time(t1)},{name},,0,0,0,,"
+            f"{_position_tag(text, style, width, height)}{_ass_text(text)}"
+        )
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {width}",
+        f"PlayResY: {height}",
+        "WrapStyle: 0",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, "
+        "OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, "
+        "ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, "
+        "MarginL, MarginR, MarginV, Encoding",
+        *[_style_line(name, style, width, height) for name, style in styles.values()],
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        *events,
+    ]
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return output_file
@@ -0,0 +1,94 @@
+"""Raster cache for subtitle lines.
+
+Laying out and stroking a subtitle line with PIL is the expensive part of
+building a TextClip, and the same line with the same style is rendered again
+for every re-render and every video_count variant. Sprites are stored as
+RGBA PNG files keyed by the text and style, and the most recent ones are kept
+in memory.
+"""
+
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+from PIL import Image
+
+from app.config import config
+from app.utils import utils
+
+_memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _memory_items() -> int:
+    try:
+        return int(config.app.get("subtitle_cache_memory_items", 256))
+    except Exception:
+        return 256
+
+
+def _max_size_bytes() -> int:
+    try:
+        size_mb = float(config.app.get("subtitle_cache_max_size_mb", 256))
+    except Exception:
+        size_mb = 256
+    return int(size_mb * 1024 * 1024)
+
+
+def cache_dir() -> str:
+    return utils.storage_dir("cache_subtitles", create=True)
+
+
+def sprite_key(**style) -> str:
+    return utils.md5(json.dumps(style, sort_keys=True, ensure_ascii=False, default=str))
+
+
+def _remember(key: str, sprite: np.ndarray):
+    with _lock:
+        _memory[key] = sprite
+        _memory.move_to_end(key)
+        while len(_memory) > max(0, _memory_items()):
+            _memory.popitem(last=False)
+
+
+def get_sprite(key: str, render: Callable[[], np.ndarray]) -> np.ndarray:
+    """Return the RGBA sprite for key, calling render() only on a cache miss."""
+    with _lock:
+        sprite = _memory.get(key)
+        if sprite is not None:
+            _memory.move_to_end(key)
+            return sprite
+
+    file_path = os.path.join(cache_dir(), f"{key}.png")
+    if os.path.exists(file_path):
+        try:
+            with Image.open(file_path) as img:
+                sprite = np.array(img.convert("RGBA"))
+            os.utime(file_path)
+        except Exception:
+            sprite = None
+
+    if sprite is None:
+        sprite = render()
+        # unique per writer, as concurrent renders may rasterize the same line;
+        # the .tmp suffix keeps it out of evict's .png files
+        temp_path = os.path.join(cache_dir(), f"{key}.{os.getpid()}-{uuid.uuid4().hex[:8]}.png.tmp")
+        try:
+            Image.fromarray(sprite, mode="RGBA").save(temp_path, format="PNG")
+            os.replace(temp_path, file_path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    _remember(key, sprite)
+    return sprite
+
+
+def evict():
+    utils.evict_lru_files(cache_dir(), _max_size_bytes(), suffix=".png")
@@ -1,3 +1,4 @@
+import json
 import math
 import os.path
 import re
@@ -8,10 +9,24 @@ from loguru import logger
 from app.config import config
 from app.models import const
 from app.models.schema import VideoConcatMode, VideoParams
-from app.services import llm, material, subtitle, video, voice
+from app.services import (
+    ffmpeg_render,
+    llm,
+    material,
+    packaging,
+    pipeline,
+    render_progress,
+    subtitle,
+    task_manifest,
+    video,
+    voice,
+)
 from app.services import state as sm
 from app.utils import utils
 
+# materials are prefetched for this much more than the estimated speech duration
+MATERIAL_PREFETCH_MARGIN = 1.2
+
 
 def generate_script(task_id, params):
     logger.info("\n\n## generating video script")
@@ -174,45 +189,477 @@ def generate_final_videos(
     )
     video_transition_mode = params.video_transition_mode
 
+    if len(video.target_aspects(params)) > 1:
+        return generate_final_videos_aspects(
+            task_id, params, downloaded_videos, audio_file, subtitle_path
+        )
+
+    if ffmpeg_render.use_ffmpeg_engine(params):
+        return generate_final_videos_ffmpeg(
+            task_id, params, downloaded_videos, audio_file, subtitle_path
+        )
+
+    task_dir = utils.task_dir(task_id)
+    # normalizing the sub clips and each final pass encode about the audio's
+    # length of frames per variant; progress follows the frames actually written
+    total_frames = 2 * params.video_count * video.audio_frames(audio_file)
+    with render_progress.tracking(task_id, total_frames, start=50, end=100):
+        logger.info(f"\n\n## combining {params.video_count} videos")
+        # sub clips are normalized once and shared by every variant
+        combined_files = video.combine_video_variants(
+            combined_video_paths=[
+                path.join(task_dir, f"combined-{i + 1}.mp4") for i in range(params.video_count)
+            ],
+            video_paths=downloaded_videos,
+            audio_file=audio_file,
+            video_aspect=params.video_aspect,
+            video_concat_mode=video_concat_mode,
+            video_transition_mode=video_transition_mode,
+            max_clip_duration=params.video_clip_duration,
+            threads=params.n_threads,
+        )
+
+        jobs = []
+        for i, combined_video_path in enumerate(combined_files):
+            final_video_path = path.join(task_dir, f"final-{i + 1}.mp4")
+            logger.info(f"\n\n## generating video: {combined_video_path} => {final_video_path}")
+            jobs.append(
+                {
+                    "video_path": combined_video_path,
+                    "audio_path": audio_file,
+                    "subtitle_path": subtitle_path,
+                    "output_file": final_video_path,
+                    "params": params,
+                }
+            )
+        final_files = video.generate_videos(jobs)
+
+    for combined_video_path, final_video_path in zip(combined_files, final_files):
+        if final_video_path:
+            final_video_paths.append(final_video_path)
+            combined_video_paths.append(combined_video_path)
+
+    return final_video_paths, combined_video_paths
+
+
+def generate_final_videos_ffmpeg(
+    task_id, params, downloaded_videos, audio_file, subtitle_path
+):
+    """Plan each variant and render it in a single ffmpeg pass.
+
+    The single-pass engine writes final videos directly, so no combined
+    videos are produced.
+    """
+    final_video_paths = []
+    live_playlists = []
+    video_concat_mode = (
+        params.video_concat_mode if params.video_count == 1 else VideoConcatMode.random
+    )
+
     _progress = 50
     for i in range(params.video_count):
         index = i + 1
-        combined_video_path = path.join(
-            utils.task_dir(task_id), f"combined-{index}.mp4"
+        final_video_path = path.join(utils.task_dir(task_id), f"final-{index}.mp4")
+        logger.info(f"\n\n## rendering video with ffmpeg: {index} => {final_video_path}")
+        if params.progressive_output:
+            live_playlists.append(ffmpeg_render.live_playlist(final_video_path))
+            sm.state.update_task(task_id, progress=_progress, live_playlists=live_playlists)
+        segments = video.plan_segments(
+            task_id=task_id,
+            video_paths=downloaded_videos,
+            audio_file=audio_file,
+            video_aspect=params.video_aspect,
+            video_concat_mode=video_concat_mode,
+            max_clip_duration=params.video_clip_duration,
+            save=False,
         )
-        logger.info(f"\n\n## combining video: {index} => {combined_video_path}")
-        video.combine_videos(
-            combined_video_path=combined_video_path,
+        if ffmpeg_render.render_segments(
+            segments,
+            params,
+            final_video_path,
+            audio_file=audio_file,
+            subtitle_path=subtitle_path,
+            task_id=task_id,
+            progressive=bool(params.progressive_output),
+        ):
+            final_video_paths.append(final_video_path)
+
+        _progress += 50 / params.video_count
+        sm.state.update_task(task_id, progress=_progress)
+
+    return final_video_paths, []
+
+
+def generate_final_videos_aspects(
+    task_id, params, downloaded_videos, audio_file, subtitle_path
+):
+    """Plan each variant once and render it in every target aspect.
+
+    Script, audio, subtitles and materials are shared by all aspects and
+    each variant's segments are decoded once for all of them, see
+    ffmpeg_render.render_aspects. Outputs are final-<aspect>.mp4, or
+    final-<n>-<aspect>.mp4 when there are several variants.
+    """
+    final_video_paths = []
+    live_playlists = []
+    video_concat_mode = (
+        params.video_concat_mode if params.video_count == 1 else VideoConcatMode.random
+    )
+    aspects = video.target_aspects(params)
+
+    _progress = 50
+    for i in range(params.video_count):
+        index = i + 1 if params.video_count > 1 else 0
+        outputs = {
+            aspect.value: video.final_aspect_path(utils.task_dir(task_id), aspect, index)
+            for aspect in aspects
+        }
+        logger.info(f"\n\n## rendering video {i + 1} in {len(outputs)} aspects")
+        if params.progressive_output:
+            live_playlists += [ffmpeg_render.live_playlist(f) for f in outputs.values()]
+            sm.state.update_task(task_id, progress=_progress, live_playlists=live_playlists)
+        segments = video.plan_segments(
+            task_id=task_id,
             video_paths=downloaded_videos,
             audio_file=audio_file,
             video_aspect=params.video_aspect,
             video_concat_mode=video_concat_mode,
-            video_transition_mode=video_transition_mode,
             max_clip_duration=params.video_clip_duration,
-            threads=params.n_threads,
+            save=False,
         )
+        rendered = ffmpeg_render.render_aspects(
+            segments,
+            params,
+            outputs,
+            audio_file=audio_file,
+            subtitle_path=subtitle_path,
+            task_id=task_id,
+            progressive=bool(params.progressive_output),
+        )
+        final_video_paths += list(rendered.values())
 
-        _progress += 50 / params.video_count / 2
+        _progress += 50 / params.video_count
         sm.state.update_task(task_id, progress=_progress)
 
-        final_video_path = path.join(utils.task_dir(task_id), f"final-{index}.mp4")
+    return final_video_paths, []
 
-        logger.info(f"\n\n## generating video: {index} => {final_video_path}")
-        video.generate_video(
-            video_path=combined_video_path,
-            audio_path=audio_file,
+
+def ensure_subtitle(task_id, params, audio_file, subtitle_path, script=""):
+    """Transcribe audio_file to the task's subtitle.srt when subtitles are enabled but missing.
+
+    The transcript is corrected against the script (from the task state or
+    script.json) when one is available. Best effort: returns the subtitle
+    path to use, which is the one passed in if transcription fails.
+    """
+    try:
+        sub_enabled = bool(getattr(params, "subtitle_enabled", True))
+    except Exception:
+        sub_enabled = True
+    if not sub_enabled or not audio_file or (subtitle_path and os.path.exists(subtitle_path)):
+        return subtitle_path
+    try:
+        if not script:
+            try:
+                script_file = path.join(utils.task_dir(task_id), "script.json")
+                if os.path.exists(script_file):
+                    with open(script_file, "r", encoding="utf-8") as fd:
+                        script = json.load(fd).get("script", "")
+            except Exception:
+                script = ""
+        # generate via whisper then correct if script available
+        _subtitle_path = path.join(utils.task_dir(task_id), "subtitle.srt")
+        subtitle.create(audio_file=audio_file, subtitle_file=_subtitle_path)
+        if script:
+            try:
+                subtitle.correct(subtitle_file=_subtitle_path, video_script=script)
+            except Exception:
+                pass
+        sm.state.update_task(task_id, subtitle_path=_subtitle_path)
+        return _subtitle_path
+    except Exception:
+        # best-effort fallback; ignore subtitle generation failure
+        return subtitle_path
+
+
+def render_segments(
+    task_id,
+    segments,
+    params: VideoParams,
+    audio_file,
+    subtitle_path="",
+    preview=False,
+    preview_label=None,
+    script="",
+):
+    """Render an edited segments plan and record the outputs in the task state.
+
+    A preview only writes the preview video. Otherwise every target aspect
+    is rendered, packaged, and stored as the task's videos. Returns
+    combined_video, final_video, final_videos (by aspect, multi-aspect
+    renders only) and playlists (by video).
+    """
+    subtitle_path = ensure_subtitle(task_id, params, audio_file, subtitle_path, script)
+
+    finals = {}
+    playlists = {}
+    aspects = video.target_aspects(params)
+    multi_aspect = len(aspects) > 1
+    if not preview and params.progressive_output:
+        # players can follow the live playlists while the encode runs
+        task_path = utils.task_dir(task_id)
+        final_files = (
+            [video.final_aspect_path(task_path, a) for a in aspects]
+            if multi_aspect
+            else [path.join(task_path, "final-1.mp4")]
+        )
+        sm.state.update_task(
+            task_id,
+            state=const.TASK_STATE_PROCESSING,
+            live_playlists=[ffmpeg_render.live_playlist(f) for f in final_files],
+        )
+    if not preview and multi_aspect:
+        # one decode of the segments fanned out to every requested aspect
+        finals = video.render_aspects_from_segments(
+            task_id=task_id,
+            segments=segments,
+            params=params,
+            audio_file=audio_file,
             subtitle_path=subtitle_path,
-            output_file=final_video_path,
+        )
+        combined, final = "", next(iter(finals.values()), "")
+    else:
+        combined, final = video.render_from_segments(
+            task_id=task_id,
+            segments=segments,
             params=params,
+            audio_file=audio_file,
+            subtitle_path=subtitle_path,
+            preview=preview,
+            preview_label=preview_label,
         )
 
-        _progress += 50 / params.video_count / 2
-        sm.state.update_task(task_id, progress=_progress)
+    if preview:
+        # previews are stored separately so they never replace the rendered videos
+        sm.state.update_task(task_id, state=const.TASK_STATE_COMPLETE, progress=100, preview_video=combined)
+    else:
+        videos = list(finals.values()) or ([final] if final else [])
+        playlists = packaging.package(videos)
+        sm.state.update_task(
+            task_id,
+            state=const.TASK_STATE_COMPLETE,
+            progress=100,
+            videos=videos,
+            combined_videos=[combined] if combined else [],
+            playlists=[playlists[f] for f in videos if f in playlists],
+        )
+    return {
+        "combined_video": combined,
+        "final_video": final,
+        "final_videos": finals,
+        "playlists": playlists,
+    }
 
-        final_video_paths.append(final_video_path)
-        combined_video_paths.append(combined_video_path)
 
-    return final_video_paths, combined_video_paths
+def prefetch_materials(task_id, params, video_terms, video_script):
+    """Download materials for the estimated speech duration, before the audio exists."""
+    estimated_duration = 0.0
+    if params.video_source != "local":
+        estimated_duration = (
+            voice.estimate_duration(video_script, params.voice_rate) * MATERIAL_PREFETCH_MARGIN
+        )
+        logger.info(f"prefetching materials for an estimated {estimated_duration:.1f} seconds of speech")
+    downloaded_videos = get_video_materials(task_id, params, video_terms, estimated_duration)
+    if not downloaded_videos:
+        return None
+    return downloaded_videos, estimated_duration
+
+
+def refine_materials(task_id, params, video_terms, prefetched, audio_duration):
+    """Top up the prefetched materials when the speech came out longer than estimated."""
+    downloaded_videos, estimated_duration = prefetched
+    if params.video_source == "local" or audio_duration <= estimated_duration:
+        return downloaded_videos
+    logger.info(
+        f"speech is {audio_duration:.1f} seconds, longer than the estimated {estimated_duration:.1f}, downloading more materials"
+    )
+    # files already downloaded are reused
+    return get_video_materials(task_id, params, video_terms, audio_duration)
+
+
+def _stage_inputs(params, *fields):
+    """The parameters a stage's output depends on, for its checkpoint."""
+    return params.model_dump(mode="json", include=set(fields) if fields else None, warnings=False)
+
+
+def _dump_audio(output):
+    audio_file, audio_duration, sub_maker = output
+    return {
+        "audio_file": audio_file,
+        "audio_duration": audio_duration,
+        "subs": list(getattr(sub_maker, "subs", []) or []),
+        "offset": [list(o) for o in getattr(sub_maker, "offset", []) or []],
+    }
+
+
+def _load_audio(data):
+    # edge subtitles are made from the word boundaries the TTS reported
+    sub_maker = voice.SubMaker()
+    sub_maker.subs = data["subs"]
+    sub_maker.offset = [tuple(o) for o in data["offset"]]
+    return data["audio_file"], data["audio_duration"], sub_maker
+
+
+def _files_exist(files):
+    return all(f and os.path.exists(f) for f in files)
+
+
+def task_stages(task_id, params: VideoParams):
+    """The stages of start(): each runs once the outputs it needs exist."""
+
+    def script_stage(r):
+        video_script = generate_script(task_id, params)
+        if not video_script or "Error: " in video_script:
+            return None
+        return video_script
+
+    def terms_stage(r):
+        video_terms = ""
+        if params.video_source != "local":
+            video_terms = generate_terms(task_id, params, r["script"])
+            if not video_terms:
+                return None
+        save_script_data(task_id, r["script"], video_terms, params)
+        return video_terms
+
+    def audio_stage(r):
+        audio_file, audio_duration, sub_maker = generate_audio(task_id, params, r["script"])
+        if not audio_file:
+            return None
+        return audio_file, audio_duration, sub_maker
+
+    def subtitle_stage(r):
+        audio_file, _, sub_maker = r["audio"]
+        return generate_subtitle(task_id, params, r["script"], sub_maker, audio_file)
+
+    def materials_stage(r):
+        return refine_materials(task_id, params, r["terms"], r["prefetch"], r["audio"][1])
+
+    def segments_stage(r):
+        return video.plan_segments(
+            task_id=task_id,
+            video_paths=r["materials"],
+            audio_file=r["audio"][0],
+            video_aspect=params.video_aspect,
+            video_concat_mode=params.video_concat_mode,
+            max_clip_duration=params.video_clip_duration,
+        )
+
+    def video_stage(r):
+        final_video_paths, combined_video_paths = generate_final_videos(
+            task_id, params, r["materials"], r["audio"][0], r["subtitle"]
+        )
+        if not final_video_paths:
+            return None
+        # done here rather than when packaging, so the checkpointed videos
+        # are not rewritten afterwards
+        if packaging.faststart_enabled():
+            for final_video_path in final_video_paths:
+                packaging.ensure_faststart(final_video_path)
+        return final_video_paths, combined_video_paths
+
+    def package_stage(r):
+        # HLS playlists, when enabled
+        return packaging.package(r["video"][0])
+
+    material_inputs = _stage_inputs(
+        params,
+        "video_source",
+        "video_materials",
+        "video_aspect",
+        "video_concat_mode",
+        "video_clip_duration",
+        "video_count",
+    )
+
+    # the dump of a stage is what its checkpoint keeps, see task_manifest
+    return [
+        pipeline.Stage(
+            "script",
+            script_stage,
+            progress=10,
+            inputs=_stage_inputs(params, "video_subject", "video_script", "video_language", "paragraph_number"),
+            dump=lambda o: o,
+        ),
+        pipeline.Stage(
+            "terms",
+            terms_stage,
+            ["script"],
+            progress=20,
+            inputs=_stage_inputs(params, "video_subject", "video_terms", "video_source"),
+            dump=lambda o: {"terms": o, "script_file": path.join(utils.task_dir(task_id), "script.json")},
+            load=lambda d: d["terms"],
+        ),
+        pipeline.Stage(
+            "audio",
+            audio_stage,
+            ["script"],
+            progress=30,
+            inputs=_stage_inputs(params, "voice_name", "voice_rate"),
+            dump=_dump_audio,
+            load=_load_audio,
+        ),
+        pipeline.Stage(
+            "subtitle",
+            subtitle_stage,
+            ["script", "audio"],
+            progress=40,
+            inputs={
+                **_stage_inputs(params, "subtitle_enabled"),
+                "provider": config.app.get("subtitle_provider", "edge"),
+            },
+            dump=lambda o: o,
+        ),
+        pipeline.Stage(
+            "prefetch",
+            lambda r: prefetch_materials(task_id, params, r["terms"], r["script"]),
+            ["script", "terms"],
+            inputs={**material_inputs, **_stage_inputs(params, "voice_rate")},
+            dump=lambda o: {"videos": o[0], "estimated_duration": o[1]},
+            load=lambda d: (d["videos"], d["estimated_duration"]) if _files_exist(d["videos"]) else None,
+        ),
+        pipeline.Stage(
+            "materials",
+            materials_stage,
+            ["terms", "prefetch", "audio"],
+            progress=50,
+            inputs=material_inputs,
+            dump=lambda o: o,
+            load=lambda d: d if _files_exist(d) else None,
+        ),
+        # cheap, and saved to segments.json by plan_segments itself
+        pipeline.Stage("segments", segments_stage, ["materials", "audio"]),
+        pipeline.Stage(
+            "video",
+            video_stage,
+            ["materials", "audio", "subtitle"],
+            inputs=_stage_inputs(params),
+            dump=lambda o: {"videos": o[0], "combined_videos": o[1]},
+            load=lambda d: (d["videos"], d["combined_videos"]) if _files_exist(d["videos"]) else None,
+        ),
+        pipeline.Stage("package", package_stage, ["video"], dump=lambda o: o),
+    ]
+
+
+# the stages each stop_at needs, the same work the sequential pipeline did
+STOP_AT_STAGES = {
+    "script": ["script"],
+    "terms": ["terms"],
+    "audio": ["terms", "audio"],
+    "subtitle": ["terms", "subtitle"],
+    "materials": ["subtitle", "materials"],
+    "segments": ["subtitle", "segments"],
+    "video": ["package"],
+}
 
 
 def start(task_id, params: VideoParams, stop_at: str = "video"):
@@ -222,48 +669,35 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
     if type(params.video_concat_mode) is str:
         params.video_concat_mode = VideoConcatMode(params.video_concat_mode)
 
-    # 1. Generate script
-    video_script = generate_script(task_id, params)
-    if not video_script or "Error: " in video_script:
-        sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
+    # independent stages overlap: materials download while speech and subtitles
+    # are generated. Stages checkpointed by an interrupted run of this task are
+    # restored rather than run again.
+    task_manifest.begin(task_id, params, stop_at)
+    try:
+        r = pipeline.run(
+            task_id, task_stages(task_id, params), STOP_AT_STAGES.get(stop_at, ["package"]), checkpoint=True
+        )
+    except Exception:
+        task_manifest.finish(task_id, task_manifest.STATUS_FAILED)
+        raise
+    if r is None:
+        task_manifest.finish(task_id, task_manifest.STATUS_FAILED)
         return
-
-    sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=10)
+    task_manifest.finish(task_id, task_manifest.STATUS_COMPLETE)
 
     if stop_at == "script":
         sm.state.update_task(
-            task_id, state=const.TASK_STATE_COMPLETE, progress=100, script=video_script
+            task_id, state=const.TASK_STATE_COMPLETE, progress=100, script=r["script"]
         )
-        return {"script": video_script}
-
-    # 2. Generate terms
-    video_terms = ""
-    if params.video_source != "local":
-        video_terms = generate_terms(task_id, params, video_script)
-        if not video_terms:
-            sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
-            return
-
-    save_script_data(task_id, video_script, video_terms, params)
+        return {"script": r["script"]}
 
     if stop_at == "terms":
         sm.state.update_task(
-            task_id, state=const.TASK_STATE_COMPLETE, progress=100, terms=video_terms
+            task_id, state=const.TASK_STATE_COMPLETE, progress=100, terms=r["terms"]
         )
-        return {"script": video_script, "terms": video_terms}
-
-    sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=20)
-
-    # 3. Generate audio
-    audio_file, audio_duration, sub_maker = generate_audio(
-        task_id, params, video_script
-    )
-    if not audio_file:
-        sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
-        return
-
-    sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=30)
+        return {"script": r["script"], "terms": r["terms"]}
 
+    audio_file, audio_duration, _ = r["audio"]
     if stop_at == "audio":
         sm.state.update_task(
             task_id,
@@ -273,11 +707,7 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
         )
         return {"audio_file": audio_file, "audio_duration": audio_duration}
 
-    # 4. Generate subtitle
-    subtitle_path = generate_subtitle(
-        task_id, params, video_script, sub_maker, audio_file
-    )
-
+    subtitle_path = r["subtitle"]
     if stop_at == "subtitle":
         sm.state.update_task(
             task_id,
@@ -287,16 +717,7 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
         )
         return {"subtitle_path": subtitle_path}
 
-    sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=40)
-
-    # 5. Get video materials
-    downloaded_videos = get_video_materials(
-        task_id, params, video_terms, audio_duration
-    )
-    if not downloaded_videos:
-        sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
-        return
-
+    downloaded_videos = r["materials"]
     if stop_at == "materials":
         sm.state.update_task(
             task_id,
@@ -306,28 +727,17 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
         )
         return {"materials": downloaded_videos}
 
-    sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=50)
-
     # segments planning only (new)
     if stop_at == "segments":
-        from app.services import video as video_service
-
-        segments = video_service.plan_segments(
-            task_id=task_id,
-            video_paths=downloaded_videos,
-            audio_file=audio_file,
-            video_aspect=params.video_aspect,
-            video_concat_mode=params.video_concat_mode,
-            max_clip_duration=params.video_clip_duration,
-        )
+        segments = r["segments"]
         # unify audio_duration with planned segments total to avoid UI mismatch
         try:
             _seg_total = round(sum(float(getattr(s, 'duration', 0.0) or 0.0) for s in segments), 3)
         except Exception:
             _seg_total = audio_duration
         kwargs = {
-            "script": video_script,
-            "terms": video_terms,
+            "script": r["script"],
+            "terms": r["terms"],
             "audio_file": audio_file,
             "audio_duration": _seg_total,
             "materials": downloaded_videos,
@@ -338,14 +748,8 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
         )
         return kwargs
 
-    # 6. Generate final videos
-    final_video_paths, combined_video_paths = generate_final_videos(
-        task_id, params, downloaded_videos, audio_file, subtitle_path
-    )
-
-    if not final_video_paths:
-        sm.state.update_task(task_id, state=const.TASK_STATE_FAILED)
-        return
+    final_video_paths, combined_video_paths = r["video"]
+    playlists = r["package"]
 
     logger.success(
         f"task {task_id} finished, generated {len(final_video_paths)} videos."
@@ -353,9 +757,10 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
 
     kwargs = {
         "videos": final_video_paths,
+        "playlists": [playlists[f] for f in final_video_paths if f in playlists],
         "combined_videos": combined_video_paths,
-        "script": video_script,
-        "terms": video_terms,
+        "script": r["script"],
+        "terms": r["terms"],
         "audio_file": audio_file,
         "audio_duration": audio_duration,
         "subtitle_path": subtitle_path,
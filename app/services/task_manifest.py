@@ -0,0 +1,129 @@
+"""Stage checkpoints of task.start, for resuming interrupted tasks.
+
+When a stage of task.start finishes, its input fingerprint, its output and
+the identity of the files it wrote are recorded in
+storage/tasks/<task_id>/task_manifest.json, next to the parameters and
+stop_at the task was started with. Starting the task again (POST
+/tasks/{task_id}/resume, a Redis job requeued after its worker died, or
+resume_interrupted_tasks at startup) restores every stage whose inputs are
+unchanged and whose files are untouched, and runs only the rest.
+"""
+
+import glob
+import os
+import threading
+import time
+from typing import List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from app.models import schema
+from app.utils import utils
+
+MANIFEST_FILE = "task_manifest.json"
+
+STATUS_RUNNING = "running"
+STATUS_COMPLETE = "complete"
+STATUS_FAILED = "failed"
+
+# stages of one task finish concurrently
+_lock = threading.Lock()
+
+
+def _manifest_path(task_id: str) -> str:
+    return os.path.join(utils.task_dir(task_id), MANIFEST_FILE)
+
+
+def load(task_id: str) -> dict:
+    return utils.load_json_file(_manifest_path(task_id))
+
+
+def begin(task_id: str, params: BaseModel, stop_at: str):
+    """Record how the task was started; checkpoints of an earlier run are kept."""
+    with _lock:
+        manifest = load(task_id)
+        manifest.update(
+            {
+                "params_model": type(params).__name__,
+                "params": params.model_dump(mode="json", warnings=False),
+                "stop_at": stop_at,
+                "status": STATUS_RUNNING,
+                "started_at": time.time(),
+            }
+        )
+        manifest.setdefault("stages", {})
+        _write(task_id, manifest)
+
+
+def finish(task_id: str, status: str):
+    with _lock:
+        manifest = load(task_id)
+        if not manifest:
+            return
+        manifest["status"] = status
+        _write(task_id, manifest)
+
+
+def params(manifest: dict) -> Optional[BaseModel]:
+    """The parameters the task was started with."""
+    try:
+        return getattr(schema, manifest["params_model"])(**manifest["params"])
+    except Exception as e:
+        logger.warning(f"invalid parameters in task manifest: {str(e)}")
+        return None
+
+
+def _files(data) -> List[str]:
+    """Existing files named anywhere in a stage output."""
+    if isinstance(data, str):
+        return [data] if data and os.path.isfile(data) else []
+    if isinstance(data, dict):
+        data = list(data.values())
+    if isinstance(data, (list, tuple)):
+        return [f for item in data for f in _files(item)]
+    return []
+
+
+def restore(manifest: dict, stage: str, inputs_fingerprint: str) -> Optional[dict]:
+    """The checkpoint of stage when it ran with these inputs and its files are untouched."""
+    entry = (manifest.get("stages") or {}).get(stage)
+    if not entry or entry.get("inputs") != inputs_fingerprint:
+        return None
+    for identity in entry.get("files", []):
+        if utils.file_identity(identity["path"]) != identity:
+            return None
+    return entry
+
+
+def record(task_id: str, stage: str, inputs_fingerprint: str, data, seconds: float) -> dict:
+    """Checkpoint a finished stage; returns its entry, whose digest identifies the output."""
+    files = [utils.file_identity(f) for f in dict.fromkeys(_files(data))]
+    entry = {
+        "inputs": inputs_fingerprint,
+        "output": data,
+        "files": files,
+        "digest": utils.fingerprint(output=data, files=files),
+        "seconds": round(seconds, 3),
+        "finished_at": time.time(),
+    }
+    with _lock:
+        manifest = load(task_id)
+        manifest.setdefault("stages", {})[stage] = entry
+        _write(task_id, manifest)
+    return entry
+
+
+def interrupted() -> List[str]:
+    """Tasks whose last run never finished, oldest first."""
+    tasks = []
+    for file_path in glob.glob(os.path.join(utils.task_dir(), "*", MANIFEST_FILE)):
+        task_id = os.path.basename(os.path.dirname(file_path))
+        manifest = load(task_id)
+        if manifest.get("status") == STATUS_RUNNING:
+            tasks.append((manifest.get("started_at", 0), task_id))
+    return [task_id for _, task_id in sorted(tasks)]
+
+
+def _write(task_id: str, manifest: dict):
+    utils.write_json_file(_manifest_path(task_id), manifest)
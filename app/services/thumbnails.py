@@ -0,0 +1,288 @@
+"""Batched segment thumbnails and the timeline sprite sheet.
+
+Segments are grouped by the file their frame comes from, so each source is
+opened once and its capture times are read in ascending order by a single
+ffmpeg reader, which walks forward between nearby frames and only seeks for
+large gaps. Sources are decoded in parallel and JPEG encoding runs on a
+separate writer pool.
+
+The sprite sheet packs every segment thumbnail into one image, in timeline
+order, next to a JSON index with the tile rectangle and timeline position of
+each segment, so the timeline loads one image instead of one per segment.
+"""
+
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
+from PIL import Image, ImageDraw, ImageFont
+
+from app.models import const
+from app.models.schema import SegmentItem
+from app.services import probe
+from app.utils import utils
+
+THUMB_SIZE = 640
+SPRITE_TILE_HEIGHT = 120
+SPRITE_COLUMNS = 10
+SPRITE_FILE = "sprite.jpg"
+SPRITE_INDEX_FILE = "sprite.json"
+
+# (segment_id, capture time in the source, output path)
+Capture = Tuple[str, float, str]
+
+
+def thumbs_dir(task_id: str) -> str:
+    d = os.path.join(utils.task_dir(task_id), "thumbs")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def thumb_path(task_id: str, segment_id: str) -> str:
+    return os.path.join(thumbs_dir(task_id), f"{segment_id}.jpg")
+
+
+def _as_segment(s) -> Optional[SegmentItem]:
+    if isinstance(s, SegmentItem):
+        return s
+    try:
+        return SegmentItem(**s)
+    except Exception:
+        return None
+
+
+def _capture_time(seg: SegmentItem) -> float:
+    """The middle of the segment's source range, clear of its edges."""
+    start = float(seg.start or 0)
+    dur = float(seg.duration or 0)
+    if dur > 0:
+        return start + max(0.05, min(dur * 0.5, dur - 0.05))
+    return start + 0.2
+
+
+def _fallback_source(task_id: str) -> str:
+    output_dir = utils.task_dir(task_id)
+    cand = glob.glob(os.path.join(output_dir, "combined-*.mp4"))
+    cand.extend(glob.glob(os.path.join(output_dir, "final-*.mp4")))
+    return cand[0] if cand else ""
+
+
+def _plan(task_id: str, segments: List[SegmentItem], wanted: Optional[set]) -> Tuple[Dict[str, List[Capture]], List[Tuple[str, str, str]], List[str]]:
+    """Split wanted segments into video captures per source, image copies and placeholders."""
+    videos: Dict[str, List[Capture]] = {}
+    images = []
+    placeholders = []
+    fallback = None
+    pos = 0.0
+    for seg in segments:
+        timeline_pos = pos
+        pos += float(seg.duration or 0)
+        if wanted is not None and seg.segment_id not in wanted:
+            continue
+        out = thumb_path(task_id, seg.segment_id)
+        material = seg.material
+        if isinstance(material, str) and os.path.exists(material):
+            if utils.parse_extension(material) in const.FILE_TYPE_IMAGES:
+                images.append((seg.segment_id, material, out))
+            else:
+                videos.setdefault(material, []).append((seg.segment_id, _capture_time(seg), out))
+            continue
+        # missing material: take the frame at the segment's timeline offset in a rendered video
+        if fallback is None:
+            fallback = _fallback_source(task_id)
+        if fallback:
+            videos.setdefault(fallback, []).append((seg.segment_id, timeline_pos + 0.05, out))
+        else:
+            placeholders.append(out)
+    return videos, images, placeholders
+
+
+def _save_thumbnail(img: Image.Image, out: str):
+    img = img.convert("RGB")
+    img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    temp_path = f"{out}.tmp.jpg"
+    img.save(temp_path, format="JPEG", quality=80)
+    os.replace(temp_path, out)
+
+
+def _save_image_thumbnail(material: str, out: str):
+    with Image.open(material) as img:
+        _save_thumbnail(img, out)
+
+
+def _save_placeholder(out: str):
+    img = Image.new("RGB", (640, 360), color=(240, 240, 240))
+    draw = ImageDraw.Draw(img)
+    text = "No Material"
+    try:
+        font = ImageFont.truetype(os.path.join(utils.font_dir(), "MicrosoftYaHeiBold.ttc"), 28)
+    except Exception:
+        font = ImageFont.load_default()
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    draw.text(((640 - (right - left)) // 2, (360 - (bottom - top)) // 2), text, fill=(128, 128, 128), font=font)
+    img.save(out, format="JPEG", quality=80)
+
+
+def _target_resolution(source: str):
+    """Let ffmpeg scale frames down to the thumbnail box before piping them."""
+    info = probe.probe(source)
+    if not info or not info["width"] or not info["height"]:
+        return None
+    if max(info["width"], info["height"]) <= THUMB_SIZE:
+        return None
+    # (width, height), the other side follows the aspect ratio
+    if info["width"] >= info["height"]:
+        return (THUMB_SIZE, None)
+    return (None, THUMB_SIZE)
+
+
+def _extract_source(source: str, captures: List[Capture], writer: ThreadPoolExecutor) -> list:
+    """Read all capture times of one source with a single reader, in ascending order."""
+    reader = None
+    pending = []
+    try:
+        reader = FFMPEG_VideoReader(source, target_resolution=_target_resolution(source))
+        last_t = max(0.0, float(reader.duration or 0) - 0.01)
+        for segment_id, t, out in sorted(captures, key=lambda c: c[1]):
+            frame = reader.get_frame(max(0.0, min(t, last_t)))
+            pending.append(writer.submit(_save_thumbnail, Image.fromarray(frame), out))
+    except Exception as e:
+        logger.warning(f"failed to extract thumbnails from {source}: {str(e)}")
+    finally:
+        if reader is not None:
+            reader.close()
+    return pending
+
+
+def generate_thumbnails(task_id: str, segments: Iterable, segment_ids: Optional[Iterable[str]] = None, overwrite: bool = False) -> Dict[str, str]:
+    """Write thumbs/<segment_id>.jpg for the given segments (all by default).
+
+    Returns {segment_id: path} for every thumbnail that exists afterwards.
+    """
+    segments = [s for s in (_as_segment(s) for s in segments) if s is not None]
+    requested = set(segment_ids) if segment_ids is not None else None
+    wanted = requested
+    if not overwrite:
+        existing = {s.segment_id for s in segments if os.path.exists(thumb_path(task_id, s.segment_id))}
+        wanted = (wanted if wanted is not None else {s.segment_id for s in segments}) - existing
+
+    if wanted is None or wanted:
+        videos, images, placeholders = _plan(task_id, segments, wanted)
+        workers = max(1, min(4, len(videos)))
+        with ThreadPoolExecutor(max_workers=4) as writer:
+            pending = []
+            for segment_id, material, out in images:
+                pending.append(writer.submit(_save_image_thumbnail, material, out))
+            for out in placeholders:
+                pending.append(writer.submit(_save_placeholder, out))
+            with ThreadPoolExecutor(max_workers=workers) as readers:
+                for futures in readers.map(lambda item: _extract_source(item[0], item[1], writer), videos.items()):
+                    pending.extend(futures)
+            for future in pending:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"failed to write thumbnail: {str(e)}")
+        logger.debug(f"thumbnails for task {task_id}: {sum(len(c) for c in videos.values())} frames from {len(videos)} sources, {len(images)} images")
+
+    result = {}
+    for s in segments:
+        if requested is not None and s.segment_id not in requested:
+            continue
+        path = thumb_path(task_id, s.segment_id)
+        if os.path.exists(path):
+            result[s.segment_id] = path
+    return result
+
+
+def _sprite_key(segments: List[SegmentItem], thumbs: Dict[str, str]) -> str:
+    parts = []
+    for s in segments:
+        path = thumbs.get(s.segment_id)
+        mtime = os.stat(path).st_mtime_ns if path else 0
+        parts.append([s.segment_id, s.duration, mtime])
+    return utils.md5(json.dumps(parts))
+
+
+def build_sprite_sheet(task_id: str, segments: Iterable, thumbs: Dict[str, str]) -> dict:
+    """Pack the thumbnails into thumbs/sprite.jpg and write the thumbs/sprite.json index.
+
+    The index is reused as long as the segments and their thumbnails are unchanged.
+    """
+    segments = [s for s in (_as_segment(s) for s in segments) if s is not None]
+    d = thumbs_dir(task_id)
+    index_file = os.path.join(d, SPRITE_INDEX_FILE)
+    sprite_file = os.path.join(d, SPRITE_FILE)
+    key = _sprite_key(segments, thumbs)
+    if os.path.exists(index_file) and os.path.exists(sprite_file):
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("key") == key:
+                return index
+        except Exception:
+            pass
+
+    tiles = []
+    for s in segments:
+        path = thumbs.get(s.segment_id)
+        if not path:
+            continue
+        try:
+            with Image.open(path) as img:
+                tiles.append((s, img.convert("RGB")))
+        except Exception as e:
+            logger.warning(f"failed to load thumbnail {path}: {str(e)}")
+
+    tile_h = SPRITE_TILE_HEIGHT
+    tile_w = 0
+    if tiles:
+        first = tiles[0][1]
+        tile_w = max(1, round(tile_h * first.width / first.height))
+    columns = max(1, min(SPRITE_COLUMNS, len(tiles)))
+    rows = (len(tiles) + columns - 1) // columns
+
+    index = {
+        "key": key,
+        "sprite": SPRITE_FILE,
+        "tile_width": tile_w,
+        "tile_height": tile_h,
+        "columns": columns,
+        "width": tile_w * columns if tiles else 0,
+        "height": tile_h * rows,
+        "segments": [],
+    }
+    sheet = Image.new("RGB", (max(1, index["width"]), max(1, index["height"])), color=(0, 0, 0))
+    timeline = {}
+    pos = 0.0
+    for s in segments:
+        timeline[s.segment_id] = pos
+        pos += float(s.duration or 0)
+    for i, (s, img) in enumerate(tiles):
+        # contain each thumbnail in its tile, so mixed aspects share one grid
+        img.thumbnail((tile_w, tile_h))
+        x = (i % columns) * tile_w
+        y = (i // columns) * tile_h
+        sheet.paste(img, (x + (tile_w - img.width) // 2, y + (tile_h - img.height) // 2))
+        index["segments"].append(
+            {
+                "segment_id": s.segment_id,
+                "x": x,
+                "y": y,
+                "w": tile_w,
+                "h": tile_h,
+                "start": round(timeline[s.segment_id], 3),
+                "duration": float(s.duration or 0),
+            }
+        )
+
+    temp_path = f"{sprite_file}.tmp.jpg"
+    sheet.save(temp_path, format="JPEG", quality=80)
+    os.replace(temp_path, sprite_file)
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    return index
@@ -0,0 +1,142 @@
+import os
+import subprocess
+from typing import List
+
+from loguru import logger
+from moviepy.config import FFMPEG_BINARY
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+
+def ffmpeg_binary() -> str:
+    # moviepy resolves IMAGEIO_FFMPEG_EXE (config.app.ffmpeg_path) or the bundled binary
+    return FFMPEG_BINARY
+
+
+def run_ffmpeg(args: List[str]) -> bool:
+    cmd = [ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y", *args]
+    logger.debug(f"running ffmpeg: {' '.join(cmd)}")
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except Exception as e:
+        logger.error(f"failed to run ffmpeg: {str(e)}")
+        return False
+    if proc.returncode != 0:
+        err = proc.stderr.decode("utf-8", errors="ignore").strip()
+        logger.error(f"ffmpeg exited with code {proc.returncode}: {err[-1000:]}")
+        return False
+    return True
+
+
+def stream_signature(file_path: str) -> tuple:
+    """Return the stream parameters that must match for a stream-copy concat."""
+    infos = ffmpeg_parse_infos(file_path)
+    return (
+        infos.get("video_codec_name"),
+        tuple(infos.get("video_size") or ()),
+        infos.get("video_fps"),
+        infos.get("video_profile"),
+        bool(infos.get("audio_found")),
+    )
+
+
+def can_concat_copy(files: List[str]) -> bool:
+    signatures = set()
+    for f in set(files):
+        try:
+            signatures.add(stream_signature(f))
+        except Exception as e:
+            logger.warning(f"failed to probe clip for concat: {f}, err: {str(e)}")
+            return False
+        if len(signatures) > 1:
+            return False
+    return True
+
+
+def escape_filter_path(file_path: str) -> str:
+    """Escape a file path for use as a quoted filter option value."""
+    p = os.path.abspath(file_path).replace("\\", "/")
+    p = p.replace(":", "\\:").replace("'", "'\\\\\\''")
+    return f"'{p}'"
+
+
+def write_concat_manifest(files: List[str], manifest_file: str) -> str:
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        for file in files:
+            # concat demuxer quoting: close the quote, escape it, reopen
+            escaped = os.path.abspath(file).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return manifest_file
+
+
+def concat_copy(files: List[str], output_file: str) -> bool:
+    """Join clips with the concat demuxer without re-encoding."""
+    manifest_file = f"{output_file}.concat.txt"
+    write_concat_manifest(files, manifest_file)
+    try:
+        return run_ffmpeg(
+            [
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                manifest_file,
+                "-c",
+                "copy",
+                output_file,
+            ]
+        )
+    finally:
+        try:
+            os.remove(manifest_file)
+        except Exception:
+            pass
+
+
+def concat_reencode(
+    files: List[str],
+    output_file: str,
+    fps: int,
+    video_codec: str = "libx264",
+    audio_codec: str = "aac",
+    threads: int = 2,
+) -> bool:
+    """Join clips whose parameters differ with the concat filter, encoding once.
+
+    One ffmpeg process reads the clips in turn; each is fitted to the size of
+    the first clip (rounded down to even), and clips without audio get silence when any clip has it.
+    """
+    try:
+        infos = [ffmpeg_parse_infos(f) for f in files]
+    except Exception as e:
+        logger.error(f"failed to probe clips for concat: {str(e)}")
+        return False
+    width, height = infos[0].get("video_size") or (1080, 1920)
+    # yuv420p needs even dimensions
+    width, height = width - width % 2, height - height % 2
+    with_audio = any(info.get("audio_found") for info in infos)
+
+    inputs = []
+    chains = []
+    labels = []
+    for i, (f, info) in enumerate(zip(files, infos)):
+        inputs += ["-i", f]
+        chains.append(
+            f"[{i}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p[v{i}]"
+        )
+        labels.append(f"[v{i}]")
+        if with_audio:
+            if info.get("audio_found"):
+                source = f"[{i}:a:0]"
+            else:
+                source = f"anullsrc=r=44100:cl=stereo,atrim=duration={float(info.get('duration') or 0):.3f},"
+            chains.append(f"{source}aresample=44100,aformat=channel_layouts=stereo[a{i}]")
+            labels.append(f"[a{i}]")
+    chains.append(f"{''.join(labels)}concat=n={len(files)}:v=1:a={1 if with_audio else 0}[vout]{'[aout]' if with_audio else ''}")
+
+    args = [*inputs, "-filter_complex", ";".join(chains), "-map", "[vout]"]
+    if with_audio:
+        args += ["-map", "[aout]", "-c:a", audio_codec]
+    args += ["-c:v", video_codec, "-pix_fmt", "yuv420p", "-r", str(fps), "-threads", str(threads), output_file]
+    return run_ffmpeg(args)
@@ -3,23 +3,25 @@ import itertools
 import os
 import random
 import gc
+import multiprocessing
 import shutil
-from typing import List, Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, List, Iterable
 from loguru import logger
 from moviepy import (
     AudioFileClip,
-    ColorClip,
     CompositeAudioClip,
     CompositeVideoClip,
     ImageClip,
     TextClip,
     VideoFileClip,
     afx,
-    concatenate_videoclips,
 )
-from moviepy.video.tools.subtitles import SubtitlesClip
-from PIL import ImageFont, Image, ImageDraw
+from moviepy.video.tools.subtitles import file_to_subtitles
+import numpy as np
+from PIL import ImageFont, Image
 
+from app.config import config
 from app.models import const
 from app.models.schema import (
     MaterialInfo,
@@ -29,7 +31,8 @@ from app.models.schema import (
     VideoTransitionMode,
     SegmentItem,
 )
-from app.services.utils import video_effects
+from app.services import probe, proxy, render_progress, render_stages, segment_cache, subtitle_ass, subtitle_cache, thumbnails
+from app.services.utils import ffmpeg_utils, video_effects
 from app.utils import utils
 
 class SubClippedVideoClip:
@@ -51,6 +54,9 @@ class SubClippedVideoClip:
 audio_codec = "aac"
 video_codec = "libx264"
 fps = 30
+# set in render pool workers (see _process_pool)
+_pool_worker = False
+
 
 def close_clip(clip):
     if clip is None:
@@ -156,145 +162,75 @@ def load_segments(task_id: str) -> List[SegmentItem]:
         return res
 
 
-def _thumbs_dir(task_id: str) -> str:
-    d = os.path.join(utils.task_dir(task_id), "thumbs")
-    if not os.path.exists(d):
-        os.makedirs(d, exist_ok=True)
-    return d
-
-
 def get_segment_thumbnail(task_id: str, segment_id: str) -> str:
     """Ensure and return a thumbnail image path for a segment.
 
     Returns absolute filesystem path to an image file.
     """
-    segments = load_segments(task_id)
-    seg = None
-    for s in segments:
-        try:
-            if isinstance(s, SegmentItem) and s.segment_id == segment_id:
-                seg = s
-                break
-            if not isinstance(s, SegmentItem) and s.get("segment_id") == segment_id:
-                # tolerate raw dict
-                seg = SegmentItem(**s)
-                break
-        except Exception:
-            continue
+    path = thumbnails.thumb_path(task_id, segment_id)
+    if os.path.exists(path):
+        return path
 
-    if seg is None:
+    segments = load_segments(task_id)
+    ids = {s.segment_id if hasattr(s, "segment_id") else s.get("segment_id") for s in segments}
+    if segment_id not in ids:
         raise FileNotFoundError("segment not found")
+    path = thumbnails.generate_thumbnails(task_id, segments, [segment_id]).get(segment_id)
+    if not path:
+        raise FileNotFoundError("thumbnail not available")
+    return path
 
-    material = getattr(seg, "material", None)
-    if not material or not isinstance(material, str) or not os.path.exists(material):
-        # Fallback: try to capture from combined/final video at timeline offset
-        output_dir = utils.task_dir(task_id)
-        import glob as _glob
-        cand = []
-        cand.extend(_glob.glob(os.path.join(output_dir, "combined-*.mp4")))
-        cand.extend(_glob.glob(os.path.join(output_dir, "final-*.mp4")))
-        if cand:
-            try:
-                # estimate position by summing durations before this segment
-                segs = load_segments(task_id)
-                pos = 0.0
-                for s in segs:
-                    sid = s.segment_id if hasattr(s, 'segment_id') else s.get('segment_id')
-                    if sid == segment_id:
-                        break
-                    try:
-                        pos += float(getattr(s, 'duration', 0) if hasattr(s, 'duration') else s.get('duration', 0) or 0)
-                    except Exception:
-                        continue
-                vid = cand[0]
-                clip = VideoFileClip(vid)
-                t = max(0.0, min(pos + 0.05, float(clip.duration) - 0.01))
-                frame = clip.get_frame(t)
-                img = Image.fromarray(frame)
-                img.thumbnail((640, 640))
-                thumb_dir = _thumbs_dir(task_id)
-                thumb_path = os.path.join(thumb_dir, f"{segment_id}.jpg")
-                img.save(thumb_path, format="JPEG", quality=80)
-                close_clip(clip)
-                return thumb_path
-            except Exception:
-                try:
-                    close_clip(clip)
-                except Exception:
-                    pass
-        # If still no source, return a generated placeholder to avoid 404
-        thumb_dir = _thumbs_dir(task_id)
-        thumb_path = os.path.join(thumb_dir, f"{segment_id}.jpg")
-        try:
-            img = Image.new('RGB', (640, 360), color=(240, 240, 240))
-            draw = ImageDraw.Draw(img)
-            text = "No Material"
-            try:
-                fpath = os.path.join(utils.font_dir(), "MicrosoftYaHeiBold.ttc")
-                font = ImageFont.truetype(fpath, 28)
-            except Exception:
-                font = ImageFont.load_default()
-            tw, th = draw.textsize(text, font=font)
-            draw.text(((640 - tw)//2, (360 - th)//2), text, fill=(128, 128, 128), font=font)
-            img.save(thumb_path, format="JPEG", quality=80)
-            return thumb_path
-        except Exception:
-            raise FileNotFoundError("material not found")
-
-    # if material is an image, return it directly
-    ext = os.path.splitext(material)[1].lower()
-    image_exts = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp"}
-    if ext in image_exts:
-        return material
-
-    # otherwise capture a middle frame from video as thumbnail
-    thumb_dir = _thumbs_dir(task_id)
-    thumb_path = os.path.join(thumb_dir, f"{segment_id}.jpg")
-    if os.path.exists(thumb_path):
-        return thumb_path
 
-    # pick a timestamp within the segment range
-    try:
-        cap_t = float(getattr(seg, "start", 0) or 0)
-        dur = float(getattr(seg, "duration", 0) or 0)
-        if dur and dur > 0:
-            cap_t = cap_t + max(0.05, min(dur * 0.5, dur - 0.05))
-        else:
-            # fallback to 0.2s
-            cap_t = cap_t + 0.2
-    except Exception:
-        cap_t = 0.2
+def ensure_thumbs(task_id: str) -> dict:
+    """Generate missing thumbnails for all segments and refresh the timeline sprite sheet.
 
+    Returns the sprite sheet index, or {} on failure.
+    """
     try:
-        clip = VideoFileClip(material)
-        t = max(0.0, min(cap_t, float(clip.duration) - 0.01))
-        frame = clip.get_frame(t)
-        img = Image.fromarray(frame)
-        img.thumbnail((640, 640))
-        img.save(thumb_path, format="JPEG", quality=80)
-        close_clip(clip)
-        return thumb_path
+        segments = load_segments(task_id)
+        thumbs = thumbnails.generate_thumbnails(task_id, segments)
+        return thumbnails.build_sprite_sheet(task_id, segments, thumbs)
     except Exception as e:
-        try:
-            close_clip(clip)
-        except Exception:
-            pass
-        raise e
+        logger.warning(f"failed to generate thumbnails for task {task_id}: {str(e)}")
+        return {}
 
 
-def ensure_thumbs(task_id: str):
-    """Generate thumbnails for all segments of the task if missing."""
+def _keyframe_snap_tolerance() -> float:
     try:
-        segs = load_segments(task_id)
-        for s in segs:
-            try:
-                seg_id = s.segment_id if hasattr(s, 'segment_id') else s.get('segment_id')
-                if seg_id:
-                    _ = get_segment_thumbnail(task_id, seg_id)
-            except Exception:
-                continue
+        return max(0.0, float(config.app.get("keyframe_snap_tolerance", 1.0)))
     except Exception:
-        pass
+        return 1.0
+
+
+def _keyframes_for_snap(video_paths: List[str]) -> dict:
+    """Keyframe index per source, or {} when snapping is disabled."""
+    if _keyframe_snap_tolerance() <= 0:
+        return {}
+    return probe.keyframes_many(video_paths)
+
+
+def _slice_windows(clip_duration: float, max_clip_duration: float, keyframes: List[float] | None = None) -> List[tuple]:
+    """Split [0, clip_duration) into consecutive windows of at most max_clip_duration.
+
+    With a keyframe index, each window ends on the latest keyframe within
+    keyframe_snap_tolerance before its nominal end, so every window starts
+    on a keyframe: seeks need no decode from an earlier keyframe and whole
+    windows can be stream copied.
+    """
+    tolerance = _keyframe_snap_tolerance()
+    windows = []
+    start_time = 0.0
+    while start_time < clip_duration:
+        end_time = start_time + max_clip_duration
+        if keyframes and tolerance > 0 and end_time < clip_duration:
+            candidates = [k for k in keyframes if end_time - tolerance <= k <= end_time and k > start_time]
+            if candidates:
+                end_time = max(candidates)
+        end_time = min(end_time, clip_duration)
+        if end_time - start_time > 0:
+            windows.append((start_time, end_time))
+        start_time = end_time
+    return windows
 
 
 def plan_segments(
@@ -304,12 +240,15 @@ def plan_segments(
     video_aspect: VideoAspect = VideoAspect.portrait,
     video_concat_mode: VideoConcatMode = VideoConcatMode.random,
     max_clip_duration: int = 5,
+    save: bool = True,
 ) -> List[SegmentItem]:
     """Create a segment plan based on materials and audio length.
 
-    - Slices each source video into <= max_clip_duration chunks.
+    - Slices each source video into <= max_clip_duration chunks, ending
+      chunks on a keyframe when one is within keyframe_snap_tolerance.
     - Shuffles when concat mode is random, otherwise keeps order.
     - Loops segments until total >= audio duration.
+    - Persists the plan to segments.json unless save is False.
     """
     audio_clip = AudioFileClip(audio_file)
     audio_duration = float(audio_clip.duration)
@@ -319,22 +258,18 @@ def plan_segments(
     order = 1
 
     # pre-scan all materials and form base segments list
+    infos = probe.probe_many(video_paths)
+    keyframes = _keyframes_for_snap(video_paths)
     for src in video_paths:
-        try:
-            clip = VideoFileClip(src)
-        except Exception:
+        info = infos.get(src)
+        if not info or info["is_image"]:
             # skip invalid video
             continue
-        clip_duration = float(clip.duration)
-        clip_w, clip_h = clip.size
-        close_clip(clip)
-
-        start_time = 0.0
-        min_piece = min(max_clip_duration, clip_duration)
+        clip_duration = float(info["duration"])
+        clip_w, clip_h = info["width"], info["height"]
 
         # at least one piece per video
-        while start_time < clip_duration:
-            end_time = min(start_time + max_clip_duration, clip_duration)
+        for start_time, end_time in _slice_windows(clip_duration, max_clip_duration, keyframes.get(src)):
             dur = float(max(0.0, end_time - start_time))
             # drop too tiny tail pieces (<0.6s)
             if dur >= 0.6:
@@ -361,7 +296,6 @@ def plan_segments(
             if video_concat_mode.value == VideoConcatMode.sequential.value:
                 # only one sub-clip from each video in sequential mode
                 break
-            start_time = end_time
 
     if not segments_all:
         logger.warning("plan_segments: no valid segments found from sources")
@@ -408,7 +342,8 @@ def plan_segments(
         total += float(new_seg.duration)
         idx += 1
 
-    save_segments(task_id, planned)
+    if save:
+        save_segments(task_id, planned)
     return planned
 
 
@@ -442,223 +377,644 @@ def _apply_transition_to_clip(clip, transition: VideoTransitionMode, t: float =
     return clip
 
 
+def _fit_geometry(src_w: int, src_h: int, dst_w: int, dst_h: int, fit: str = "contain"):
+    """Work out how a src_w x src_h frame is placed on a dst_w x dst_h canvas.
+
+    Returns (box, size, offset): the source region to read, the size it is
+    scaled to, and where its top-left corner lands on the canvas.
+      contain: scale to fit inside, black borders on the short side
+      cover:   scale to fill, crop the overflow
+      center:  no scaling, crop whatever does not fit
+    """
+    if fit == "center":
+        w, h = min(src_w, dst_w), min(src_h, dst_h)
+        x0, y0 = (src_w - w) // 2, (src_h - h) // 2
+        return (x0, y0, x0 + w, y0 + h), (w, h), ((dst_w - w) // 2, (dst_h - h) // 2)
+
+    if fit == "cover":
+        scale = max(dst_w / src_w, dst_h / src_h)
+        crop_w, crop_h = dst_w / scale, dst_h / scale
+        x0, y0 = (src_w - crop_w) / 2, (src_h - crop_h) / 2
+        return (x0, y0, x0 + crop_w, y0 + crop_h), (dst_w, dst_h), (0, 0)
+
+    # contain, also the fallback for unknown values
+    scale = min(dst_w / src_w, dst_h / src_h)
+    w = min(dst_w, max(1, round(src_w * scale)))
+    h = min(dst_h, max(1, round(src_h * scale)))
+    return (0, 0, src_w, src_h), (w, h), ((dst_w - w) // 2, (dst_h - h) // 2)
+
+
 def _resize_to_aspect(clip, video_width: int, video_height: int, fit: str = "contain"):
+    """Scale/pad/crop clip onto a video_width x video_height canvas.
+
+    Each frame is resampled once with PIL straight into a canvas that is
+    allocated once per clip; the black borders are never redrawn.
+    """
     clip_w, clip_h = clip.size
     if clip_w == video_width and clip_h == video_height:
         return clip
-    clip_ratio = clip_w / clip_h
-    video_ratio = video_width / video_height
-    # exact match
-    if clip_ratio == video_ratio:
-        return clip.resized(new_size=(video_width, video_height))
+    box, size, (x, y) = _fit_geometry(clip_w, clip_h, video_width, video_height, fit)
+    w, h = size
+    canvases = {}
+
+    def fit_frame(frame):
+        # masks are 2D float frames, video frames are HxWx3 uint8
+        if frame.dtype != np.uint8:
+            frame = frame.astype("float32")
+        img = Image.fromarray(frame)
+        if img.size != size or box != (0, 0, clip_w, clip_h):
+            img = img.resize(size, Image.Resampling.LANCZOS, box=box)
+        key = (frame.dtype.str, frame.shape[2:])
+        canvas = canvases.get(key)
+        if canvas is None:
+            canvas = np.zeros((video_height, video_width, *frame.shape[2:]), dtype=frame.dtype)
+            canvases[key] = canvas
+        canvas[y : y + h, x : x + w] = np.asarray(img)
+        return canvas
 
-    # center without scaling
-    if fit == "center":
-        background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip.duration)
-        return CompositeVideoClip([background, clip.with_position("center")])
+    return clip.image_transform(fit_frame, apply_to=["mask"])
 
-    # contain: fit inside, keep black borders
-    if fit == "contain":
-        if clip_ratio > video_ratio:
-            scale_factor = video_width / clip_w
-        else:
-            scale_factor = video_height / clip_h
-        new_width = int(clip_w * scale_factor)
-        new_height = int(clip_h * scale_factor)
-        background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip.duration)
-        clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-        return CompositeVideoClip([background, clip_resized])
-
-    # cover: fill and crop overflow
-    if fit == "cover":
-        if clip_ratio > video_ratio:
-            scale_factor = video_height / clip_h
-        else:
-            scale_factor = video_width / clip_w
-        new_width = int(clip_w * scale_factor)
-        new_height = int(clip_h * scale_factor)
-        background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip.duration)
-        clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-        return CompositeVideoClip([background, clip_resized])
-
-    # fallback to contain
-    if clip_ratio > video_ratio:
-        scale_factor = video_width / clip_w
-    else:
-        scale_factor = video_height / clip_h
-    new_width = int(clip_w * scale_factor)
-    new_height = int(clip_h * scale_factor)
-    background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip.duration)
-    clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-    return CompositeVideoClip([background, clip_resized])
 
+def concat_clip_files(clip_files: List[str], output_file: str, threads: int = 2) -> str:
+    """Join clips into output_file in a single pass.
 
-def _merge_clip_files(progressed_files: Iterable[str], output_dir: str, threads: int = 2) -> str:
-    progressed_files = list(progressed_files)
-    if not progressed_files:
+    Clips sharing codec, size, fps and profile are stream-copied through the
+    concat demuxer; otherwise all clips are re-encoded together exactly once
+    by ffmpeg's concat filter.
+    """
+    clip_files = list(clip_files)
+    if not clip_files:
+        return ""
+    if len(clip_files) == 1:
+        shutil.copy(clip_files[0], output_file)
+        return output_file
+
+    if ffmpeg_utils.can_concat_copy(clip_files):
+        logger.info(f"concatenating {len(clip_files)} clips with stream copy")
+        if ffmpeg_utils.concat_copy(clip_files, output_file):
+            return output_file
+        logger.warning("stream copy concat failed, falling back to re-encode")
+    else:
+        logger.info(f"clip parameters differ, re-encoding {len(clip_files)} clips once")
+
+    # the concat filter reads the clips in one ffmpeg process, rather than
+    # holding a moviepy reader (and its ffmpeg subprocess) open per clip
+    if not ffmpeg_utils.concat_reencode(
+        clip_files,
+        output_file,
+        fps=fps,
+        video_codec=video_codec,
+        audio_codec=audio_codec,
+        threads=threads,
+    ):
+        logger.error(f"failed to concatenate {len(clip_files)} clips")
         return ""
-    if len(progressed_files) == 1:
-        dst = os.path.join(output_dir, "temp-merged-video.mp4")
-        shutil.copy(progressed_files[0], dst)
-        return dst
+    return output_file
+
 
+def _merge_clip_files(progressed_files: Iterable[str], output_dir: str, threads: int = 2) -> str:
     temp_merged_video = os.path.join(output_dir, "temp-merged-video.mp4")
-    temp_merged_next = os.path.join(output_dir, "temp-merged-next.mp4")
-    shutil.copy(progressed_files[0], temp_merged_video)
-    for i, f in enumerate(progressed_files[1:], 1):
-        try:
-            base_clip = VideoFileClip(temp_merged_video)
-            next_clip = VideoFileClip(f)
-            merged_clip = concatenate_videoclips([base_clip, next_clip])
-            merged_clip.write_videofile(
-                filename=temp_merged_next,
-                threads=threads,
-                logger=None,
-                temp_audiofile_path=output_dir,
-                audio_codec=audio_codec,
-                fps=fps,
-            )
-            close_clip(base_clip)
-            close_clip(next_clip)
-            close_clip(merged_clip)
-            delete_files(temp_merged_video)
-            os.rename(temp_merged_next, temp_merged_video)
-        except Exception as e:
-            logger.error(f"failed to merge clip: {str(e)}")
-            continue
-    return temp_merged_video
+    return concat_clip_files(progressed_files, temp_merged_video, threads)
 
 
-def render_from_segments(
-    task_id: str,
-    segments: List[SegmentItem],
-    params: VideoParams,
-    audio_file: str,
-    subtitle_path: str = "",
-    preview: bool = False,
-    preview_label: str | None = None,
-) -> (str, str):
-    """Bake each segment, progressively merge, then overlay audio/subtitle.
+def _segment_transition(s: SegmentItem, params: VideoParams):
+    """The segment's transition, falling back to the global one; None if unset or invalid."""
+    try:
+        if s.transition:
+            return VideoTransitionMode(s.transition)
+        if params.video_transition_mode:
+            return VideoTransitionMode(params.video_transition_mode)
+    except Exception:
+        pass
+    return None
 
-    Returns: (combined_video_path, final_video_path)
+
+# H.264 profiles that are 8-bit 4:2:0, like the clips the baker writes
+_PASSTHROUGH_PROFILES = {"baseline", "constrained baseline", "main", "high"}
+
+
+def _passthrough_cut(s: SegmentItem, params: VideoParams, clip_file: str) -> str:
+    """Cut a segment that needs no processing by stream copy.
+
+    A segment qualifies when its source already is H.264 at the output size
+    and frame rate, plays at normal speed without a transition, and both
+    its start and end fall on keyframes (or the end of the source), so the
+    copied packets are exactly the frames a bake would encode. Returns
+    clip_file, or "" when the segment must be baked.
     """
-    output_dir = _task_output_dir(task_id)
-    clips_dir = _clips_dir(task_id)
+    try:
+        spd = float(s.speed or 1.0)
+    except Exception:
+        spd = 1.0
+    trans = _segment_transition(s, params)
+    if spd != 1.0 or (trans is not None and trans.value != VideoTransitionMode.none.value):
+        return ""
+
+    info = probe.probe(s.material)
+    video_width, video_height = VideoAspect(params.video_aspect).to_resolution()
+    if (
+        not info
+        or info["is_image"]
+        or info["codec"] != "h264"
+        or (info["profile"] or "").lower() not in _PASSTHROUGH_PROFILES
+        or info["rotation"]
+        or (info["width"], info["height"]) != (video_width, video_height)
+        or abs(info["fps"] - fps) > 0.01
+    ):
+        return ""
+
+    start = float(s.start)
+    frames = int(round(min(float(s.end) - start, float(s.duration)) * fps))
+    end = start + frames / fps
+    keyframes = probe.keyframes(s.material) or []
+
+    def on_keyframe(t: float) -> bool:
+        return any(abs(k - t) < 0.5 / fps for k in keyframes)
+
+    # packets are copied in decode order, so the end must close a GOP too,
+    # otherwise B-frames displayed before the cut would be dropped
+    if frames <= 0 or not on_keyframe(start):
+        return ""
+    if not on_keyframe(end) and end < info["duration"] - 0.5 / fps:
+        return ""
+
+    ok = ffmpeg_utils.run_ffmpeg(
+        [
+            "-ss", f"{start:.3f}",
+            "-i", s.material,
+            "-frames:v", str(frames),
+            "-map", "0:v:0",
+            "-c", "copy",
+            clip_file,
+        ]
+    )
+    if not ok or not os.path.exists(clip_file):
+        delete_files(clip_file)
+        return ""
+    logger.debug(f"stream copied segment {s.segment_id} from {s.material}")
+    return clip_file
+
+
+def _bake_segment(s: SegmentItem, params: VideoParams, clip_file: str, preview: bool = False) -> str:
+    """Cut, speed up, resize and transition one segment into clip_file.
 
+    Segments that need none of that are stream copied instead (see
+    _passthrough_cut). Runs in the render process or in a bake worker
+    process, so it only takes picklable arguments. Preview bakes use the proxy canvas, frame rate and
+    encoder settings. Returns clip_file on success, "" on failure.
+    """
     aspect = VideoAspect(params.video_aspect)
-    video_width, video_height = aspect.to_resolution()
+    if preview:
+        video_width, video_height = proxy.resolution(aspect)
+    else:
+        video_width, video_height = aspect.to_resolution()
+        if _passthrough_cut(s, params, clip_file):
+            return clip_file
 
-    baked_files: List[str] = []
-    for i, s in enumerate(sorted(segments, key=lambda x: x.order)):
-        try:
-            base_clip = VideoFileClip(s.material).subclipped(s.start, s.end).without_audio()
-        except Exception as e:
-            logger.error(f"failed to open source clip: {s.material}, err: {str(e)}")
-            continue
+    try:
+        base_clip = VideoFileClip(s.material).subclipped(s.start, s.end).without_audio()
+    except Exception as e:
+        logger.error(f"failed to open source clip: {s.material}, err: {str(e)}")
+        return ""
 
-        # apply playback speed (clamped)
+    # apply playback speed (clamped)
+    try:
+        spd = float(s.speed or 1.0)
+    except Exception:
+        spd = 1.0
+    if spd != 1.0:
+        # clamp to reasonable bounds
+        if spd < 0.75:
+            spd = 0.75
+        if spd > 1.25:
+            spd = 1.25
         try:
-            spd = float(s.speed or 1.0)
+            from moviepy import vfx
+            base_clip = base_clip.with_effects([vfx.MultiplySpeed(spd)])
         except Exception:
-            spd = 1.0
-        if spd != 1.0:
-            # clamp to reasonable bounds
-            if spd < 0.75:
-                spd = 0.75
-            if spd > 1.25:
-                spd = 1.25
             try:
-                from moviepy import vfx
-                base_clip = base_clip.with_effects([vfx.MultiplySpeed(spd)])
+                from moviepy import vfx as _vfx
+                # fallback to alternative naming if available
+                base_clip = base_clip.with_effects([_vfx.Speedx(spd)])
             except Exception:
-                try:
-                    from moviepy import vfx as _vfx
-                    # fallback to alternative naming if available
-                    base_clip = base_clip.with_effects([_vfx.Speedx(spd)])
-                except Exception:
-                    logger.warning("speed effect not supported by current moviepy, skipping")
-
-        # resize to aspect with fit mode
-        fit = getattr(s, "fit", None) or "contain"
-        clip = _resize_to_aspect(base_clip, video_width, video_height, fit)
-
-        # apply transition (fallback to global param if empty)
-        trans = None
+                logger.warning("speed effect not supported by current moviepy, skipping")
+
+    # resize to aspect with fit mode
+    fit = getattr(s, "fit", None) or "contain"
+    clip = _resize_to_aspect(base_clip, video_width, video_height, fit)
+
+    # apply transition (fallback to global param if empty)
+    trans = _segment_transition(s, params)
+    if trans:
         try:
-            if s.transition:
-                trans = VideoTransitionMode(s.transition)
-            elif params.video_transition_mode:
-                trans = VideoTransitionMode(params.video_transition_mode)
+            t = float(getattr(s, "transition_duration", None) or 1.0)
         except Exception:
-            trans = None
-        if trans:
-            try:
-                t = float(getattr(s, "transition_duration", None) or 1.0)
-            except Exception:
-                t = 1.0
-            if t < 0.2:
-                t = 0.2
-            if t > 2:
-                t = 2
-            side = getattr(s, "transition_direction", None)
-            # map mask type to direction if not set
-            if (getattr(trans, 'value', None) == VideoTransitionMode.mask.value) and not side:
-                m = getattr(s, "transition_mask", None)
-                if m == "vertical":
-                    side = random.choice(["top", "bottom"])  # default vertical
-                elif m == "horizontal":
-                    side = random.choice(["left", "right"])  # default horizontal
-                else:
-                    side = None
-            if isinstance(side, str) and side not in ["left", "right", "top", "bottom"]:
+            t = 1.0
+        if t < 0.2:
+            t = 0.2
+        if t > 2:
+            t = 2
+        side = getattr(s, "transition_direction", None)
+        # map mask type to direction if not set
+        if (getattr(trans, 'value', None) == VideoTransitionMode.mask.value) and not side:
+            m = getattr(s, "transition_mask", None)
+            if m == "vertical":
+                side = random.choice(["top", "bottom"])  # default vertical
+            elif m == "horizontal":
+                side = random.choice(["left", "right"])  # default horizontal
+            else:
                 side = None
-            clip = _apply_transition_to_clip(clip, trans, t=t, side=side)
+        if isinstance(side, str) and side not in ["left", "right", "top", "bottom"]:
+            side = None
+        clip = _apply_transition_to_clip(clip, trans, t=t, side=side)
 
-        # trim to declared duration if needed
-        if clip.duration > s.duration:
-            clip = clip.subclipped(0, s.duration)
+    # trim to declared duration if needed
+    if clip.duration > s.duration:
+        clip = clip.subclipped(0, s.duration)
 
-        # write baked file
-        clip_file = os.path.join(clips_dir, f"seg-{i+1}.mp4")
-        try:
-            clip.write_videofile(clip_file, logger=None, fps=fps, codec=video_codec)
+    # write baked file
+    write_args = {"fps": fps, "codec": video_codec}
+    if preview:
+        preview_settings = proxy.settings()
+        write_args.update(
+            fps=preview_settings["fps"],
+            preset=preview_settings["preset"],
+            ffmpeg_params=proxy.encoder_params(),
+        )
+    try:
+        clip.write_videofile(clip_file, logger=render_progress.frame_logger(), **write_args)
+        return clip_file
+    except Exception as e:
+        logger.error(f"failed to write baked clip: {str(e)}")
+        return ""
+    finally:
+        close_clip(base_clip)
+        if clip is not base_clip:
+            close_clip(clip)
+
+
+def _render_workers(count: int) -> int:
+    """Number of bake worker processes; 0/1 keeps baking in-process."""
+    try:
+        workers = int(config.app.get("render_workers", 1) or 1)
+    except Exception:
+        workers = 1
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, count))
+
+
+def _process_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn instead of fork: the API process runs worker threads and forking
+    # them can deadlock on locks held by other threads (logging, ffmpeg readers)
+    # workers count their encoded frames into the task's render progress
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_pool_worker,
+        initargs=(render_progress.shared_frames(),),
+    )
+
+
+def _init_pool_worker(frames):
+    global _pool_worker
+    _pool_worker = True
+    render_progress.init_worker(frames)
+
+
+def _bake_segments(jobs: List[tuple]) -> List[str]:
+    """Bake (segment, params, clip_file) jobs and return results in job order.
+
+    Failed bakes yield "" so callers can skip them exactly like the
+    sequential loop does; each one is logged with its segment id.
+    """
+    workers = _render_workers(len(jobs))
+    if workers <= 1:
+        results = [_bake_segment(*job) for job in jobs]
+    else:
+        logger.info(f"baking {len(jobs)} segments with {workers} worker processes")
+        results = [""] * len(jobs)
+        with _process_pool(workers) as pool:
+            futures = {pool.submit(_bake_segment, *job): i for i, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    logger.error(f"bake worker crashed on segment {jobs[i][0].segment_id}: {str(e)}")
+    for job, result in zip(jobs, results):
+        if not result:
+            logger.error(f"failed to bake segment {job[0].segment_id}, it is left out of the video")
+    return results
+
+
+def _bake_extra(preview: bool = False) -> dict:
+    """Encoder settings that are part of every baked clip's cache key."""
+    extra = {"fps": fps, "codec": video_codec}
+    if preview:
+        extra["preview"] = proxy.settings()
+    return extra
+
+
+def _segment_keys(ordered: List[SegmentItem], params: VideoParams, preview: bool = False) -> List[str]:
+    extra = _bake_extra(preview)
+    return [segment_cache.segment_key(s, params, extra) for s in ordered]
+
+
+def _bake_segments_cached(
+    ordered: List[SegmentItem], params: VideoParams, keys: List[str], preview: bool = False
+) -> List[str]:
+    """Bake only segments missing from the segment cache, return clips in order.
+
+    The caller pins keys (segment_cache.pinned) until it has merged the clips.
+    """
+    jobs = []
+    job_keys = []
+    for s, key in zip(ordered, keys):
+        if key in job_keys or segment_cache.lookup(key):
+            continue
+        job_keys.append(key)
+        jobs.append((s, params, segment_cache.temp_path(key), preview))
+    logger.info(f"segment cache: baking {len(jobs)} of {len(ordered)} segments")
+
+    for key, job, result in zip(job_keys, jobs, _bake_segments(jobs)):
+        if result:
+            segment_cache.commit(key, result)
+        else:
+            delete_files(job[2])
+
+    baked_files = []
+    for key in keys:
+        clip_file = segment_cache.path_for(key)
+        if os.path.exists(clip_file):
             baked_files.append(clip_file)
-        except Exception as e:
-            logger.error(f"failed to write baked clip: {str(e)}")
-        finally:
-            close_clip(base_clip)
-            if clip is not base_clip:
-                close_clip(clip)
+    return baked_files
 
+
+def _merge_baked(baked_files: List[str], output_dir: str, params: VideoParams) -> str:
+    """Merge baked clips in one pass."""
     if not baked_files:
         logger.warning("no baked files to merge")
-        return "", ""
+        return ""
+    return _merge_clip_files(baked_files, output_dir, params.n_threads or 2)
 
-    # merge baked clips progressively
-    merged_tmp = _merge_clip_files(baked_files, output_dir, params.n_threads or 2)
-    if not merged_tmp or not os.path.exists(merged_tmp):
-        logger.error("merge failed")
-        return "", ""
 
-    # move to combined path (use dedicated preview filename when previewing)
-    if preview:
-        tag = preview_label or "preview"
-        # normalize tag to filesystem-friendly
-        import re, time
-        tag = re.sub(r"[^a-zA-Z0-9_-]", "-", str(tag))[:40] or str(int(time.time()))
-        combined_video_path = os.path.join(output_dir, f"preview-{tag}.mp4")
-    else:
-        combined_video_path = os.path.join(output_dir, "combined-1.mp4")
-    if os.path.exists(combined_video_path):
-        delete_files(combined_video_path)
-    os.rename(merged_tmp, combined_video_path)
+def _preview_path(output_dir: str, preview_label: str | None = None) -> str:
+    tag = preview_label or "preview"
+    # normalize tag to filesystem-friendly
+    import re, time
+    tag = re.sub(r"[^a-zA-Z0-9_-]", "-", str(tag))[:40] or str(int(time.time()))
+    return os.path.join(output_dir, f"preview-{tag}.mp4")
+
+
+def _render_from_segments_ffmpeg(
+    task_id: str,
+    segments: List[SegmentItem],
+    params: VideoParams,
+    audio_file: str,
+    subtitle_path: str = "",
+    preview: bool = False,
+    preview_label: str | None = None,
+) -> (str, str):
+    """Single-pass variant of render_from_segments; there is no combined video."""
+    from app.services import ffmpeg_render
 
-    # overlay audio and subtitle to final output
+    output_dir = _task_output_dir(task_id)
     if preview:
-        # In preview mode, return combined only and skip final mux to speed up
-        return combined_video_path, ""
-    else:
-        final_video_path = os.path.join(output_dir, "final-1.mp4")
+        preview_path = ffmpeg_render.render_segments(
+            proxy.proxy_segments(segments),
+            params,
+            _preview_path(output_dir, preview_label),
+            video_only=True,
+            preview=True,
+        )
+        return preview_path, ""
+
+    final_video_path = os.path.join(output_dir, "final-1.mp4")
+    final_fp = _final_fingerprint(
+        task_id,
+        _combined_fingerprint(segments, params, ffmpeg_render.ENGINE_FFMPEG),
+        segments,
+        params,
+        audio_file,
+        subtitle_path,
+    )
+    if render_stages.is_fresh(render_stages.load(task_id), render_stages.STAGE_FINAL, final_fp, final_video_path):
+        logger.info("render inputs unchanged, reusing the final video")
+        return "", final_video_path
+
+    render_stages.invalidate(task_id, render_stages.STAGE_FINAL)
+    final_video_path = ffmpeg_render.render_segments(
+        segments,
+        params,
+        final_video_path,
+        audio_file=audio_file,
+        subtitle_path=subtitle_path,
+        task_id=task_id,
+        progressive=bool(params.progressive_output),
+    )
+    if final_video_path:
+        render_stages.record(task_id, render_stages.STAGE_FINAL, final_fp, final_video_path)
+    return "", final_video_path
+
+
+def target_aspects(params: VideoParams) -> List[VideoAspect]:
+    """params.video_aspect followed by the extra video_aspects, without duplicates."""
+    aspects = [VideoAspect(params.video_aspect)]
+    for aspect in params.video_aspects or []:
+        aspect = VideoAspect(aspect)
+        if aspect not in aspects:
+            aspects.append(aspect)
+    return aspects
+
+
+def final_aspect_path(output_dir: str, aspect: VideoAspect | str, index: int = 0) -> str:
+    """final-<aspect>.mp4, or final-<index>-<aspect>.mp4 for one of several variants."""
+    slug = VideoAspect(aspect).value.replace(":", "x")
+    name = f"final-{index}-{slug}.mp4" if index else f"final-{slug}.mp4"
+    return os.path.join(output_dir, name)
+
+
+def render_aspects_from_segments(
+    task_id: str,
+    segments: List[SegmentItem],
+    params: VideoParams,
+    audio_file: str,
+    subtitle_path: str = "",
+) -> dict:
+    """Render final-<aspect>.mp4 for every target aspect of params.
+
+    The segments are decoded once and fanned out to per-aspect branches of
+    a single ffmpeg graph, whatever params.render_engine says, so N aspects
+    cost one decode and N encodes instead of N full renders. Aspects whose
+    final stage inputs are unchanged are reused.
+
+    Returns: {aspect: final_video_path} in target order
+    """
+    from app.services import ffmpeg_render
+
+    output_dir = _task_output_dir(task_id)
+    manifest = render_stages.load(task_id)
+    finals = {}
+    stale = {}
+    stages = {}
+    for aspect in target_aspects(params):
+        output_file = final_aspect_path(output_dir, aspect)
+        aspect_params = params.model_copy(update={"video_aspect": aspect, "video_aspects": None})
+        combined_fp = _combined_fingerprint(segments, aspect_params, ffmpeg_render.ENGINE_FFMPEG)
+        final_fp = _final_fingerprint(task_id, combined_fp, segments, aspect_params, audio_file, subtitle_path)
+        stage = f"{render_stages.STAGE_FINAL}-{os.path.basename(output_file)}"
+        if render_stages.is_fresh(manifest, stage, final_fp, output_file):
+            finals[aspect.value] = output_file
+        else:
+            stale[aspect.value] = output_file
+            stages[aspect.value] = (stage, final_fp)
+
+    if stale:
+        logger.info(f"rendering aspects {', '.join(stale)} from one decode")
+        render_stages.invalidate(task_id, *(stage for stage, _ in stages.values()))
+        rendered = ffmpeg_render.render_aspects(
+            segments,
+            params,
+            stale,
+            audio_file=audio_file,
+            subtitle_path=subtitle_path,
+            task_id=task_id,
+            progressive=bool(params.progressive_output),
+        )
+        for aspect, output_file in rendered.items():
+            render_stages.record(task_id, *stages[aspect], output_file)
+        finals.update(rendered)
+    return {a.value: finals[a.value] for a in target_aspects(params) if a.value in finals}
+
+
+def _combined_fingerprint(segments: List[SegmentItem], params: VideoParams, engine: str) -> str:
+    """Inputs of the segments -> combined video stage: every baked clip's cache key, in order."""
+    extra = _bake_extra()
+    ordered = sorted(segments, key=lambda x: x.order)
+    return utils.fingerprint(
+        engine=engine,
+        segments=[segment_cache.segment_key(s, params, extra) for s in ordered],
+    )
+
+
+def _final_fingerprint(
+    task_id: str,
+    combined_fp: str,
+    segments: List[SegmentItem],
+    params: VideoParams,
+    audio_file: str,
+    subtitle_path: str,
+) -> str:
+    """Inputs of the combined -> final stage: audio, subtitles, overrides, BGM and params."""
+    overrides = sorted(glob.glob(os.path.join(utils.task_dir(task_id), "sub_overrides", "*", "applied.srt")))
+    return utils.fingerprint(
+        combined=combined_fp,
+        audio=utils.file_identity(audio_file) if audio_file else "",
+        subtitle=utils.file_identity(subtitle_path) if subtitle_path else "",
+        overrides=[utils.file_identity(f) for f in overrides],
+        bgm=utils.file_identity(params.bgm_file) if params.bgm_file else "",
+        params=params.model_dump(mode="json", exclude={"n_threads"}),
+        segments=[s.model_dump(mode="json") for s in sorted(segments, key=lambda x: x.order)],
+    )
+
+
+def render_from_segments(
+    task_id: str,
+    segments: List[SegmentItem],
+    params: VideoParams,
+    audio_file: str,
+    subtitle_path: str = "",
+    preview: bool = False,
+    preview_label: str | None = None,
+) -> (str, str):
+    """Bake each segment, merge them in one pass, then overlay audio/subtitle.
+
+    A preview renders the video track only, from proxies of the materials at
+    the proxy resolution, into preview-<label>.mp4 instead of combined-1.mp4.
+    A full render records stage fingerprints in the task's render manifest
+    and reuses combined-1.mp4 (or final-1.mp4) when their inputs are
+    unchanged, so subtitle, audio and BGM edits only redo the final mux.
+
+    Returns: (combined_video_path, final_video_path)
+    """
+    output_dir = _task_output_dir(task_id)
+
+    from app.services import ffmpeg_render
+
+    if ffmpeg_render.use_ffmpeg_engine(params):
+        return _render_from_segments_ffmpeg(
+            task_id, segments, params, audio_file, subtitle_path, preview, preview_label
+        )
+
+    clips_dir = _clips_dir(task_id)
+    ordered = sorted(segments, key=lambda x: x.order)
+    combined_video_path = os.path.join(output_dir, "combined-1.mp4")
+    final_video_path = os.path.join(output_dir, "final-1.mp4")
+
+    # resume at the first stage whose inputs changed
+    manifest = {}
+    combined_fp = final_fp = ""
+    if not preview:
+        manifest = render_stages.load(task_id)
+        combined_fp = _combined_fingerprint(ordered, params, ffmpeg_render.ENGINE_MOVIEPY)
+        final_fp = _final_fingerprint(task_id, combined_fp, ordered, params, audio_file, subtitle_path)
+        if render_stages.is_fresh(
+            manifest, render_stages.STAGE_COMBINED, combined_fp, combined_video_path
+        ) and render_stages.is_fresh(manifest, render_stages.STAGE_FINAL, final_fp, final_video_path):
+            logger.info("render inputs unchanged, reusing the final video")
+            return combined_video_path, final_video_path
+
+    bake = preview or not render_stages.is_fresh(
+        manifest, render_stages.STAGE_COMBINED, combined_fp, combined_video_path
+    )
+    # baking encodes every segment once and the final pass the whole timeline again
+    total_frames = sum(float(s.duration or 0.0) for s in ordered) * (
+        proxy.settings()["fps"] if preview else fps * (2 if bake else 1)
+    )
+    with render_progress.tracking(task_id, total_frames):
+        if bake:
+            if not preview:
+                render_stages.invalidate(task_id, render_stages.STAGE_COMBINED, render_stages.STAGE_FINAL)
+            if preview:
+                ordered = proxy.proxy_segments(ordered)
+            if segment_cache.enabled():
+                keys = _segment_keys(ordered, params, preview)
+                # other renders may evict from the shared cache until the clips are merged
+                with segment_cache.pinned(keys):
+                    baked_files = _bake_segments_cached(ordered, params, keys, preview)
+                    merged_tmp = _merge_baked(baked_files, output_dir, params)
+                segment_cache.evict()
+            else:
+                jobs = []
+                for i, s in enumerate(ordered):
+                    clip_file = os.path.join(clips_dir, f"{'preview-' if preview else ''}seg-{i+1}.mp4")
+                    jobs.append((s, params, clip_file, preview))
+                baked_files = [f for f in _bake_segments(jobs) if f]
+                merged_tmp = _merge_baked(baked_files, output_dir, params)
+
+            if not baked_files:
+                return "", ""
+            if not merged_tmp or not os.path.exists(merged_tmp):
+                logger.error("merge failed")
+                return "", ""
+
+            # move to combined path (use dedicated preview filename when previewing)
+            if preview:
+                combined_video_path = _preview_path(output_dir, preview_label)
+            if os.path.exists(combined_video_path):
+                delete_files(combined_video_path)
+            os.rename(merged_tmp, combined_video_path)
+
+            if preview:
+                # In preview mode, return combined only and skip final mux to speed up
+                return combined_video_path, ""
+            render_stages.record(task_id, render_stages.STAGE_COMBINED, combined_fp, combined_video_path)
+        else:
+            logger.info("segments unchanged, reusing the combined video")
+            render_stages.invalidate(task_id, render_stages.STAGE_FINAL)
+
+        # overlay audio and subtitle to final output
         generate_video(
             video_path=combined_video_path,
             audio_path=audio_file,
@@ -666,148 +1022,153 @@ def render_from_segments(
             output_file=final_video_path,
             params=params,
             segments=segments,
+            task_id=task_id,
         )
-        return combined_video_path, final_video_path
+    if os.path.exists(final_video_path):
+        render_stages.record(task_id, render_stages.STAGE_FINAL, final_fp, final_video_path)
+    return combined_video_path, final_video_path
 
-def combine_videos(
-    combined_video_path: str,
+def _subclip_items(
     video_paths: List[str],
-    audio_file: str,
-    video_aspect: VideoAspect = VideoAspect.portrait,
-    video_concat_mode: VideoConcatMode = VideoConcatMode.random,
-    video_transition_mode: VideoTransitionMode = None,
-    max_clip_duration: int = 5,
-    threads: int = 2,
-) -> str:
-    # normalize enums if strings are passed in
-    try:
-        if isinstance(video_concat_mode, str):
-            video_concat_mode = VideoConcatMode(video_concat_mode)
-    except Exception:
-        pass
-    try:
-        if isinstance(video_transition_mode, str):
-            video_transition_mode = VideoTransitionMode(video_transition_mode)
-    except Exception:
-        video_transition_mode = None
-    audio_clip = AudioFileClip(audio_file)
-    audio_duration = audio_clip.duration
-    logger.info(f"audio duration: {audio_duration} seconds")
-    # Required duration of each clip
-    req_dur = audio_duration / len(video_paths)
-    req_dur = max_clip_duration
-    logger.info(f"maximum clip duration: {req_dur} seconds")
-    output_dir = os.path.dirname(combined_video_path)
-
-    aspect = VideoAspect(video_aspect)
-    video_width, video_height = aspect.to_resolution()
-
-    processed_clips = []
+    video_concat_mode: VideoConcatMode,
+    max_clip_duration: int,
+) -> List[SubClippedVideoClip]:
+    """Probe each source once and slice it into <= max_clip_duration pieces."""
     subclipped_items = []
-    video_duration = 0
+    infos = probe.probe_many(video_paths)
+    keyframes = _keyframes_for_snap(video_paths)
     for video_path in video_paths:
-        clip = VideoFileClip(video_path)
-        clip_duration = clip.duration
-        clip_w, clip_h = clip.size
-        close_clip(clip)
-        
-        start_time = 0
+        info = infos.get(video_path)
+        if not info or info["is_image"]:
+            logger.warning(f"skipping unreadable video: {video_path}")
+            continue
+        clip_duration = info["duration"]
+        clip_w, clip_h = info["width"], info["height"]
 
-        while start_time < clip_duration:
-            end_time = min(start_time + max_clip_duration, clip_duration)
+        for start_time, end_time in _slice_windows(clip_duration, max_clip_duration, keyframes.get(video_path)):
             # accept even short tails; don't drop clips shorter than max_clip_duration
-            if end_time - start_time > 0:
-                subclipped_items.append(
-                    SubClippedVideoClip(
-                        file_path=video_path,
-                        start_time=start_time,
-                        end_time=end_time,
-                        width=clip_w,
-                        height=clip_h,
-                    )
+            subclipped_items.append(
+                SubClippedVideoClip(
+                    file_path=video_path,
+                    start_time=start_time,
+                    end_time=end_time,
+                    width=clip_w,
+                    height=clip_h,
                 )
-            start_time = end_time
+            )
             if video_concat_mode.value == VideoConcatMode.sequential.value:
                 break
+    return subclipped_items
+
 
+def _order_subclips(
+    subclipped_items: List[SubClippedVideoClip],
+    video_concat_mode: VideoConcatMode,
+    max_clip_duration: int,
+    audio_duration: float,
+) -> List[int]:
+    """Pick item indexes for one variant: shuffled when random, until the audio is covered."""
+    indexes = list(range(len(subclipped_items)))
     # random subclipped_items order
     if video_concat_mode.value == VideoConcatMode.random.value:
-        random.shuffle(subclipped_items)
-        
-    logger.debug(f"total subclipped items: {len(subclipped_items)}")
-    
-    # Add downloaded clips over and over until the duration of the audio (max_duration) has been reached
-    for i, subclipped_item in enumerate(subclipped_items):
+        random.shuffle(indexes)
+
+    selected = []
+    video_duration = 0
+    for i in indexes:
         if video_duration > audio_duration:
             break
-        
-        logger.debug(f"processing clip {i+1}: {subclipped_item.width}x{subclipped_item.height}, current duration: {video_duration:.2f}s, remaining: {audio_duration - video_duration:.2f}s")
-        
-        try:
-            clip = VideoFileClip(subclipped_item.file_path).subclipped(subclipped_item.start_time, subclipped_item.end_time)
-            clip_duration = clip.duration
-            # Not all videos are same size, so we need to resize them
-            clip_w, clip_h = clip.size
-            if clip_w != video_width or clip_h != video_height:
-                clip_ratio = clip.w / clip.h
-                video_ratio = video_width / video_height
-                logger.debug(f"resizing clip, source: {clip_w}x{clip_h}, ratio: {clip_ratio:.2f}, target: {video_width}x{video_height}, ratio: {video_ratio:.2f}")
-                
-                if clip_ratio == video_ratio:
-                    clip = clip.resized(new_size=(video_width, video_height))
-                else:
-                    if clip_ratio > video_ratio:
-                        scale_factor = video_width / clip_w
-                    else:
-                        scale_factor = video_height / clip_h
-
-                    new_width = int(clip_w * scale_factor)
-                    new_height = int(clip_h * scale_factor)
-
-                    background = ColorClip(size=(video_width, video_height), color=(0, 0, 0)).with_duration(clip_duration)
-                    clip_resized = clip.resized(new_size=(new_width, new_height)).with_position("center")
-                    clip = CompositeVideoClip([background, clip_resized])
-                    
-            shuffle_side = random.choice(["left", "right", "top", "bottom"])
-            # normalize transition mode; treat None or falsy as no transition
-            _vt = getattr(video_transition_mode, "value", video_transition_mode)
-            if not _vt:
-                pass  # no transition
-            elif _vt == VideoTransitionMode.fade_in.value:
-                clip = video_effects.fadein_transition(clip, 1)
-            elif _vt == VideoTransitionMode.fade_out.value:
-                clip = video_effects.fadeout_transition(clip, 1)
-            elif _vt == VideoTransitionMode.slide_in.value:
-                clip = video_effects.slidein_transition(clip, 1, shuffle_side)
-            elif _vt == VideoTransitionMode.slide_out.value:
-                clip = video_effects.slideout_transition(clip, 1, shuffle_side)
-            elif _vt == VideoTransitionMode.shuffle.value:
-                transition_funcs = [
-                    lambda c: video_effects.fadein_transition(c, 1),
-                    lambda c: video_effects.fadeout_transition(c, 1),
-                    lambda c: video_effects.slidein_transition(c, 1, shuffle_side),
-                    lambda c: video_effects.slideout_transition(c, 1, shuffle_side),
-                ]
-                shuffle_transition = random.choice(transition_funcs)
-                clip = shuffle_transition(clip)
-
-            if clip.duration > max_clip_duration:
-                clip = clip.subclipped(0, max_clip_duration)
-                
-            # wirte clip to temp file
-            clip_file = f"{output_dir}/temp-clip-{i+1}.mp4"
-            clip.write_videofile(clip_file, logger=None, fps=fps, codec=video_codec)
-            
-            close_clip(clip)
-        
-            processed_clips.append(SubClippedVideoClip(file_path=clip_file, duration=clip.duration, width=clip_w, height=clip_h))
-            video_duration += clip.duration
-            
-        except Exception as e:
-            logger.error(f"failed to process clip: {str(e)}")
-    
+        selected.append(i)
+        video_duration += min(subclipped_items[i].duration, max_clip_duration)
+    return selected
+
+
+def _normalize_subclip(
+    subclipped_item: SubClippedVideoClip,
+    video_width: int,
+    video_height: int,
+    video_transition_mode: VideoTransitionMode,
+    max_clip_duration: int,
+    clip_file: str,
+):
+    """Cut, resize and transition one sub clip into clip_file.
+
+    Top-level so it can run in a worker process. Returns the written clip as
+    a SubClippedVideoClip, or None on failure.
+    """
+    try:
+        clip = VideoFileClip(subclipped_item.file_path).subclipped(subclipped_item.start_time, subclipped_item.end_time)
+        # Not all videos are same size, so we need to resize them
+        clip_w, clip_h = clip.size
+        if clip_w != video_width or clip_h != video_height:
+            logger.debug(f"resizing clip, source: {clip_w}x{clip_h}, target: {video_width}x{video_height}")
+            clip = _resize_to_aspect(clip, video_width, video_height, "contain")
+
+        shuffle_side = random.choice(["left", "right", "top", "bottom"])
+        # normalize transition mode; treat None or falsy as no transition
+        _vt = getattr(video_transition_mode, "value", video_transition_mode)
+        if not _vt:
+            pass  # no transition
+        elif _vt == VideoTransitionMode.fade_in.value:
+            clip = video_effects.fadein_transition(clip, 1)
+        elif _vt == VideoTransitionMode.fade_out.value:
+            clip = video_effects.fadeout_transition(clip, 1)
+        elif _vt == VideoTransitionMode.slide_in.value:
+            clip = video_effects.slidein_transition(clip, 1, shuffle_side)
+        elif _vt == VideoTransitionMode.slide_out.value:
+            clip = video_effects.slideout_transition(clip, 1, shuffle_side)
+        elif _vt == VideoTransitionMode.shuffle.value:
+            transition_funcs = [
+                lambda c: video_effects.fadein_transition(c, 1),
+                lambda c: video_effects.fadeout_transition(c, 1),
+                lambda c: video_effects.slidein_transition(c, 1, shuffle_side),
+                lambda c: video_effects.slideout_transition(c, 1, shuffle_side),
+            ]
+            shuffle_transition = random.choice(transition_funcs)
+            clip = shuffle_transition(clip)
+
+        if clip.duration > max_clip_duration:
+            clip = clip.subclipped(0, max_clip_duration)
+
+        # wirte clip to temp file
+        clip.write_videofile(clip_file, logger=render_progress.frame_logger(), fps=fps, codec=video_codec)
+
+        close_clip(clip)
+
+        return SubClippedVideoClip(file_path=clip_file, duration=clip.duration, width=clip_w, height=clip_h)
+    except Exception as e:
+        logger.error(f"failed to process clip: {str(e)}")
+        return None
+
+
+def _normalize_subclips(jobs: List[tuple]) -> dict:
+    """Run _normalize_subclip jobs keyed by item index, in worker processes when configured."""
+    workers = _render_workers(len(jobs))
+    if workers <= 1:
+        return {i: _normalize_subclip(*job) for i, job in jobs}
+
+    logger.info(f"normalizing {len(jobs)} clips with {workers} worker processes")
+    results = {}
+    with _process_pool(workers) as pool:
+        futures = {pool.submit(_normalize_subclip, *job): i for i, job in jobs}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                logger.error(f"failed to process clip: {str(e)}")
+                results[futures[future]] = None
+    return results
+
+
+def _assemble_variant(
+    combined_video_path: str,
+    processed_clips: List[SubClippedVideoClip],
+    audio_duration: float,
+    threads: int = 2,
+) -> str:
+    video_duration = sum(clip.duration for clip in processed_clips)
     # loop processed clips until the video duration matches or exceeds the audio duration.
-    if video_duration < audio_duration:
+    if processed_clips and video_duration < audio_duration:
         logger.warning(f"video duration ({video_duration:.2f}s) is shorter than audio duration ({audio_duration:.2f}s), looping clips to match audio length.")
         base_clips = processed_clips.copy()
         for clip in itertools.cycle(base_clips):
@@ -816,72 +1177,116 @@ def combine_videos(
             processed_clips.append(clip)
             video_duration += clip.duration
         logger.info(f"video duration: {video_duration:.2f}s, audio duration: {audio_duration:.2f}s, looped {len(processed_clips)-len(base_clips)} clips")
-     
-    # merge video clips progressively, avoid loading all videos at once to avoid memory overflow
-    logger.info("starting clip merging process")
+
+    logger.info(f"starting clip merging process: {combined_video_path}")
     if not processed_clips:
         logger.error("no clips available for merging; ensure materials are valid and readable")
         raise ValueError("no clips available for merging")
-    
-    # if there is only one clip, use it directly
-    if len(processed_clips) == 1:
-        logger.info("using single clip directly")
-        shutil.copy(processed_clips[0].file_path, combined_video_path)
-        # clean up temp single clip
-        delete_files(processed_clips[0].file_path)
-        logger.info("video combining completed")
-        return combined_video_path
-    
-    # create initial video file as base
-    base_clip_path = processed_clips[0].file_path
-    temp_merged_video = f"{output_dir}/temp-merged-video.mp4"
-    temp_merged_next = f"{output_dir}/temp-merged-next.mp4"
-    
-    # copy first clip as initial merged video
-    shutil.copy(base_clip_path, temp_merged_video)
-    
-    # merge remaining video clips one by one
-    for i, clip in enumerate(processed_clips[1:], 1):
-        logger.info(f"merging clip {i}/{len(processed_clips)-1}, duration: {clip.duration:.2f}s")
-        
-        try:
-            # load current base video and next clip to merge
-            base_clip = VideoFileClip(temp_merged_video)
-            next_clip = VideoFileClip(clip.file_path)
-            
-            # merge these two clips
-            merged_clip = concatenate_videoclips([base_clip, next_clip])
-
-            # save merged result to temp file
-            merged_clip.write_videofile(
-                filename=temp_merged_next,
-                threads=threads,
-                logger=None,
-                temp_audiofile_path=output_dir,
-                audio_codec=audio_codec,
-                fps=fps,
+
+    # join all clips in one pass instead of re-encoding a growing prefix
+    logger.info(f"merging {len(processed_clips)} clips")
+    if not concat_clip_files([clip.file_path for clip in processed_clips], combined_video_path, threads):
+        raise ValueError("failed to merge clips")
+    return combined_video_path
+
+
+def combine_video_variants(
+    combined_video_paths: List[str],
+    video_paths: List[str],
+    audio_file: str,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+    video_concat_mode: VideoConcatMode = VideoConcatMode.random,
+    video_transition_mode: VideoTransitionMode = None,
+    max_clip_duration: int = 5,
+    threads: int = 2,
+) -> List[str]:
+    """Build one combined video per path in combined_video_paths.
+
+    Sources are probed and each sub clip is cut, resized and encoded once for
+    all variants; a variant is only an ordering of the shared clips plus a
+    concat. Returns the combined paths that were written.
+    """
+    # normalize enums if strings are passed in
+    try:
+        if isinstance(video_concat_mode, str):
+            video_concat_mode = VideoConcatMode(video_concat_mode)
+    except Exception:
+        pass
+    try:
+        if isinstance(video_transition_mode, str):
+            video_transition_mode = VideoTransitionMode(video_transition_mode)
+    except Exception:
+        video_transition_mode = None
+    audio_clip = AudioFileClip(audio_file)
+    audio_duration = audio_clip.duration
+    close_clip(audio_clip)
+    logger.info(f"audio duration: {audio_duration} seconds")
+    logger.info(f"maximum clip duration: {max_clip_duration} seconds")
+    output_dir = os.path.dirname(combined_video_paths[0])
+
+    aspect = VideoAspect(video_aspect)
+    video_width, video_height = aspect.to_resolution()
+
+    subclipped_items = _subclip_items(video_paths, video_concat_mode, max_clip_duration)
+    logger.debug(f"total subclipped items: {len(subclipped_items)}")
+
+    orders = [
+        _order_subclips(subclipped_items, video_concat_mode, max_clip_duration, audio_duration)
+        for _ in combined_video_paths
+    ]
+    needed = sorted(set(itertools.chain.from_iterable(orders)))
+    logger.info(f"normalizing {len(needed)} clips for {len(orders)} variants")
+    jobs = [
+        (
+            i,
+            (
+                subclipped_items[i],
+                video_width,
+                video_height,
+                video_transition_mode,
+                max_clip_duration,
+                f"{output_dir}/temp-clip-{i+1}.mp4",
+            ),
+        )
+        for i in needed
+    ]
+    normalized = _normalize_subclips(jobs)
+
+    results = []
+    try:
+        for combined_video_path, order in zip(combined_video_paths, orders):
+            processed_clips = [normalized[i] for i in order if normalized.get(i)]
+            results.append(
+                _assemble_variant(combined_video_path, processed_clips, audio_duration, threads)
             )
-            close_clip(base_clip)
-            close_clip(next_clip)
-            close_clip(merged_clip)
-            
-            # replace base file with new merged file
-            delete_files(temp_merged_video)
-            os.rename(temp_merged_next, temp_merged_video)
-            
-        except Exception as e:
-            logger.error(f"failed to merge clip: {str(e)}")
-            continue
-    
-    # after merging, rename final result to target file name
-    os.rename(temp_merged_video, combined_video_path)
-    
-    # clean temp files
-    clip_files = [clip.file_path for clip in processed_clips]
-    delete_files(clip_files)
-            
+    finally:
+        # clean temp files
+        delete_files([clip.file_path for clip in normalized.values() if clip])
+
     logger.info("video combining completed")
-    return combined_video_path
+    return results
+
+
+def combine_videos(
+    combined_video_path: str,
+    video_paths: List[str],
+    audio_file: str,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+    video_concat_mode: VideoConcatMode = VideoConcatMode.random,
+    video_transition_mode: VideoTransitionMode = None,
+    max_clip_duration: int = 5,
+    threads: int = 2,
+) -> str:
+    return combine_video_variants(
+        [combined_video_path],
+        video_paths,
+        audio_file,
+        video_aspect=video_aspect,
+        video_concat_mode=video_concat_mode,
+        video_transition_mode=video_transition_mode,
+        max_clip_duration=max_clip_duration,
+        threads=threads,
+    )[0]
 
 
 def wrap_text(text, max_width, font="Arial", fontsize=60):
@@ -938,368 +1343,286 @@ def wrap_text(text, max_width, font="Arial", fontsize=60):
     return result, height
 
 
-def generate_video(
-    video_path: str,
-    audio_path: str,
-    subtitle_path: str,
-    output_file: str,
-    params: VideoParams,
-    segments: List[SegmentItem] | List[dict] | None = None,
-):
-    # Validate input video exists and is non-empty before proceeding
-    if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
-        raise ValueError(f"invalid input video for rendering: {video_path}")
-
-    aspect = VideoAspect(params.video_aspect)
-    video_width, video_height = aspect.to_resolution()
+SUBTITLE_RENDER_MOVIEPY = "moviepy"
+SUBTITLE_RENDER_ASS = "ass"
+
+
+def _subtitle_style(params: VideoParams, overrides: dict | None = None, font_path: str = "") -> dict:
+    """Merge per-segment subtitle overrides over the global VideoParams style."""
+    overrides = overrides or {}
+    if overrides.get("font_name"):
+        font_path = os.path.join(utils.font_dir(), overrides["font_name"])
+    elif not font_path:
+        font_path = os.path.join(utils.font_dir(), params.font_name or "STHeitiMedium.ttc")
+    if os.name == "nt":
+        font_path = font_path.replace("\\", "/")
+    bg_color = overrides.get("text_background_color")
+    if bg_color is None:
+        bg_color = params.text_background_color
+    custom_position = overrides.get("custom_position")
+    if custom_position is None:
+        custom_position = params.custom_position
+    return {
+        "font_path": font_path,
+        "font_size": int(overrides.get("font_size") or params.font_size),
+        "color": overrides.get("text_fore_color") or params.text_fore_color,
+        "bg_color": bg_color,
+        "stroke_color": overrides.get("stroke_color") or params.stroke_color,
+        "stroke_width": int(overrides.get("stroke_width") or params.stroke_width),
+        "position": overrides.get("subtitle_position") or params.subtitle_position,
+        "custom_position": custom_position if custom_position is not None else 70.0,
+    }
+
+
+def _subtitle_clip(subtitle_item, style: dict, video_width: int, video_height: int):
+    """Build a timed, positioned subtitle clip from a cached RGBA sprite."""
+    phrase = subtitle_item[1]
+    max_width = video_width * 0.9
+
+    def render():
+        wrapped_txt, _ = wrap_text(
+            phrase, max_width=max_width, font=style["font_path"], fontsize=style["font_size"]
+        )
+        text_clip = TextClip(
+            text=wrapped_txt,
+            font=style["font_path"],
+            font_size=style["font_size"],
+            color=style["color"],
+            bg_color=style["bg_color"],
+            stroke_color=style["stroke_color"],
+            stroke_width=style["stroke_width"],
+        )
+        rgb = text_clip.img[:, :, :3]
+        if text_clip.mask is not None:
+            alpha = np.round(text_clip.mask.img * 255).astype("uint8")
+        else:
+            alpha = np.full(rgb.shape[:2], 255, dtype="uint8")
+        return np.dstack([rgb, alpha])
+
+    raster_style = {
+        k: style[k]
+        for k in ("font_path", "font_size", "color", "bg_color", "stroke_color", "stroke_width")
+    }
+    key = subtitle_cache.sprite_key(text=phrase, max_width=max_width, **raster_style)
+    _clip = ImageClip(subtitle_cache.get_sprite(key, render))
+
+    duration = subtitle_item[0][1] - subtitle_item[0][0]
+    _clip = _clip.with_start(subtitle_item[0][0])
+    _clip = _clip.with_end(subtitle_item[0][1])
+    _clip = _clip.with_duration(duration)
+    position = style["position"]
+    if position == "bottom":
+        _clip = _clip.with_position(("center", video_height * 0.95 - _clip.h))
+    elif position == "top":
+        _clip = _clip.with_position(("center", video_height * 0.05))
+    elif position == "custom":
+        # Ensure the subtitle is fully within the screen bounds
+        margin = 10  # Additional margin, in pixels
+        max_y = video_height - _clip.h - margin
+        min_y = margin
+        custom_y = (video_height - _clip.h) * (style["custom_position"] / 100)
+        custom_y = max(
+            min_y, min(custom_y, max_y)
+        )  # Constrain the y value within the valid range
+        _clip = _clip.with_position(("center", custom_y))
+    else:  # center
+        _clip = _clip.with_position(("center", "center"))
+    return _clip
+
+
+def _subtitle_render_mode(params: VideoParams) -> str:
+    mode = (getattr(params, "subtitle_render_mode", None) or SUBTITLE_RENDER_MOVIEPY).strip().lower()
+    return SUBTITLE_RENDER_ASS if mode == SUBTITLE_RENDER_ASS else SUBTITLE_RENDER_MOVIEPY
+
+
+def subtitles_filter(ass_file: str) -> str:
+    """ffmpeg filter that burns an ASS file in, resolving fonts from the font dir."""
+    return (
+        f"subtitles=filename={ffmpeg_utils.escape_filter_path(ass_file)}"
+        f":fontsdir={ffmpeg_utils.escape_filter_path(utils.font_dir())}"
+    )
 
-    logger.info(f"generating video: {video_width} x {video_height}")
-    logger.info(f"  ① video: {video_path}")
-    logger.info(f"  ② audio: {audio_path}")
-    logger.info(f"  ③ subtitle: {subtitle_path}")
-    logger.info(f"  ④ output: {output_file}")
 
-    # https://github.com/harry0703/MoneyPrinterTurbo/issues/217
-    # PermissionError: [WinError 32] The process cannot access the file because it is being used by another process: 'final-1.mp4.tempTEMP_MPY_wvf_snd.mp3'
-    # write into the same directory as the output file
-    output_dir = os.path.dirname(output_file)
+def write_subtitle_ass(events: list, params: VideoParams, output_file: str, font_path: str = "") -> str:
+    """Convert subtitle_events() output to an ASS script sized for params.video_aspect."""
+    video_width, video_height = VideoAspect(params.video_aspect).to_resolution()
+    cues = []
+    for (t0, t1), text, overrides in events:
+        style = _subtitle_style(params, overrides, font_path=font_path)
+        # wrap with the same metrics as the moviepy overlay so lines break identically
+        try:
+            text, _ = wrap_text(
+                text, max_width=video_width * 0.9, font=style["font_path"], fontsize=style["font_size"]
+            )
+        except Exception:
+            pass
+        cues.append((t0, t1, text, style))
+    return subtitle_ass.write_ass(cues, video_width, video_height, output_file)
 
-    font_path = ""
-    if params.subtitle_enabled:
-        if not params.font_name:
-            params.font_name = "STHeitiMedium.ttc"
-        font_path = os.path.join(utils.font_dir(), params.font_name)
-        if os.name == "nt":
-            font_path = font_path.replace("\\", "/")
 
-        logger.info(f"  ⑤ font: {font_path}")
+def _segment_value(s, name, default=None):
+    # segments may be pydantic models or raw dicts
+    if isinstance(s, dict):
+        return s.get(name, default)
+    return getattr(s, name, default)
 
-    def create_text_clip(subtitle_item):
-        params.font_size = int(params.font_size)
-        params.stroke_width = int(params.stroke_width)
-        phrase = subtitle_item[1]
-        max_width = video_width * 0.9
-        wrapped_txt, txt_height = wrap_text(
-            phrase, max_width=max_width, font=font_path, fontsize=params.font_size
-        )
-        interline = int(params.font_size * 0.25)
-        size=(int(max_width), int(txt_height + params.font_size * 0.25 + (interline * (wrapped_txt.count("\n") + 1))))
 
-        _clip = TextClip(
-            text=wrapped_txt,
-            font=font_path,
-            font_size=params.font_size,
-            color=params.text_fore_color,
-            bg_color=params.text_background_color,
-            stroke_color=params.stroke_color,
-            stroke_width=params.stroke_width,
-            # interline=interline,
-            # size=size,
-        )
-        duration = subtitle_item[0][1] - subtitle_item[0][0]
-        _clip = _clip.with_start(subtitle_item[0][0])
-        _clip = _clip.with_end(subtitle_item[0][1])
-        _clip = _clip.with_duration(duration)
-        if params.subtitle_position == "bottom":
-            _clip = _clip.with_position(("center", video_height * 0.95 - _clip.h))
-        elif params.subtitle_position == "top":
-            _clip = _clip.with_position(("center", video_height * 0.05))
-        elif params.subtitle_position == "custom":
-            # Ensure the subtitle is fully within the screen bounds
-            margin = 10  # Additional margin, in pixels
-            max_y = video_height - _clip.h - margin
-            min_y = margin
-            custom_y = (video_height - _clip.h) * (params.custom_position / 100)
-            custom_y = max(
-                min_y, min(custom_y, max_y)
-            )  # Constrain the y value within the valid range
-            _clip = _clip.with_position(("center", custom_y))
-        else:  # center
-            _clip = _clip.with_position(("center", "center"))
-        return _clip
+def _read_override_srt(file_path: str) -> list:
+    items = []
+    for (t0, t1), text in file_to_subtitles(file_path, encoding="utf-8"):
+        items.append(((float(t0), float(t1)), " ".join(x for x in text.split("\n") if x)))
+    return items
 
-    video_clip = VideoFileClip(video_path).without_audio()
-    audio_clip = AudioFileClip(audio_path).with_effects(
-        [afx.MultiplyVolume(params.voice_volume)]
-    )
 
-    def make_textclip(text):
-        return TextClip(
-            text=text,
-            font=font_path,
-            font_size=params.font_size,
-        )
+def subtitle_events(
+    subtitle_path: str,
+    params: VideoParams,
+    segments: List[SegmentItem] | List[dict] | None = None,
+    task_id: str = "",
+    duration: float = 0.0,
+) -> list:
+    """Place subtitle lines on the final timeline.
+
+    Applies the global subtitle_offset, per-segment offsets, per-segment
+    subtitle_enabled and the sub_overrides/<segment_id>/applied.srt files.
+    Returns [((t0, t1), text, style_overrides)] where style_overrides is the
+    segment's style dict or None.
+    """
+    if not subtitle_path or not os.path.exists(subtitle_path):
+        return []
 
-    if subtitle_path and os.path.exists(subtitle_path):
-        sub = SubtitlesClip(
-            subtitles=subtitle_path, encoding="utf-8", make_textclip=make_textclip
-        )
-        text_clips = []
-        # global subtitle time shift (can be negative)
+    # global subtitle time shift (can be negative)
+    try:
+        shift = float(getattr(params, "subtitle_offset", 0.0) or 0.0)
+    except Exception:
+        shift = 0.0
+
+    def _clamp(nt0, nt1):
+        # clamp to valid range and enforce minimal duration
+        if duration and duration > 0:
+            if nt1 < 0 or nt0 >= duration:
+                return None  # completely out of range
+            nt0 = max(0.0, min(nt0, max(0.0, duration - 0.05)))
+            nt1 = max(nt0 + 0.1, min(nt1, duration))
+        return nt0, nt1
+
+    # build segment windows on the final combined timeline when provided
+    windows = []
+    if segments:
         try:
-            shift = float(getattr(params, "subtitle_offset", 0.0) or 0.0)
+            ordered = sorted(segments, key=lambda x: _segment_value(x, "order", 0) or 0)
         except Exception:
-            shift = 0.0
-        # build segment windows on the final combined timeline when provided
-        # Build segment windows with optional style overrides and check for overrides
-        windows = []
-        overrides = {}
-        if segments:
+            ordered = []
+        t = 0.0
+        for s in ordered:
             try:
-                # tolerate raw dict or pydantic model
-                ordered = sorted(segments, key=lambda x: (x.order if hasattr(x, 'order') else x.get('order', 0)))
+                dur = float(_segment_value(s, "duration", 0.0) or 0.0)
             except Exception:
-                try:
-                    ordered = sorted(segments, key=lambda x: (x.get('order', 0)))  # type: ignore
-                except Exception:
-                    ordered = []
-            t = 0.0
-            for s in ordered:
-                try:
-                    dur = float(getattr(s, 'duration', 0.0) if hasattr(s, 'duration') else s.get('duration', 0.0) or 0.0)
-                except Exception:
-                    dur = 0.0
-                try:
-                    soff = float(getattr(s, 'subtitle_offset', 0.0) if hasattr(s, 'subtitle_offset') else s.get('subtitle_offset', 0.0) or 0.0)
-                except Exception:
-                    soff = 0.0
-                if dur <= 0:
-                    continue
-                # collect style overrides per segment (all optional)
-                def _get(name, default=None):
-                    try:
-                        return getattr(s, name)
-                    except Exception:
-                        try:
-                            return (s.get(name) if isinstance(s, dict) else default)
-                        except Exception:
-                            return default
-                style = {
-                    'subtitle_position': _get('subtitle_position', None),
-                    'custom_position': _get('custom_position', None),
-                    'font_name': _get('font_name', None),
-                    'font_size': _get('font_size', None),
-                    'text_fore_color': _get('text_fore_color', None),
-                    'stroke_color': _get('stroke_color', None),
-                    'stroke_width': _get('stroke_width', None),
-                    'text_background_color': _get('text_background_color', None),
-                }
-                seg_enabled = _get('subtitle_enabled', None)
-                seg_id = _get('segment_id', None)
-                ws, we = t, t + dur
-                # check override file for this segment
-                ov_items = None
-                try:
-                    if seg_id:
-                        ov_path = os.path.join(utils.task_dir(task_id), 'sub_overrides', str(seg_id), 'applied.srt')
-                        if os.path.exists(ov_path):
-                            # parse srt to items relative to window (we'll offset by ws below)
-                            # simple parser: collect ((t0,t1), text) where t0/t1 are relative seconds
-                            # use local helper
-                            def _parse_srt(path):
-                                out = []
-                                with open(path, 'r', encoding='utf-8') as fd:
-                                    buf = []
-                                    for line in fd:
-                                        line = line.rstrip('\n')
-                                        if line.strip() == '':
-                                            if len(buf) >= 2:
-                                                tl = buf[1]
-                                                if '-->' in tl:
-                                                    ss = tl.split('-->')[0].strip()
-                                                    es = tl.split('-->')[1].strip()
-                                                    def _to_sec(s):
-                                                        try:
-                                                            h, m, rest = s.split(':', 2)
-                                                            sec, ms = rest.split(',', 1)
-                                                            return int(h)*3600 + int(m)*60 + int(sec) + int(ms)/1000.0
-                                                        except Exception:
-                                                            return 0.0
-                                                    t0r = _to_sec(ss)
-                                                    t1r = _to_sec(es)
-                                                    txt = ' '.join(x for x in buf[2:] if x)
-                                                    out.append(((t0r, t1r), txt))
-                                            buf = []
-                                        else:
-                                            buf.append(line)
-                                return out
-                            ov_items = _parse_srt(ov_path)
-                            overrides[str(seg_id)] = ov_items
-                except Exception:
-                    pass
-                windows.append((ws, we, soff, style, seg_enabled, str(seg_id) if seg_id else None, ov_items))
-                t += dur
-        for item in sub.subtitles:
+                dur = 0.0
             try:
-                t0, t1 = float(item[0][0]), float(item[0][1])
-                eff_shift = shift
-                item_style = None
-                item_enabled = True
-                skip_due_to_override = False
-                seg_id_for_item = None
-                if windows:
-                    mid = (t0 + t1) / 2.0
-                    for (ws, we, soff, style, seg_enabled, seg_id, ov_items) in windows:
-                        if ws <= mid < we:
-                            eff_shift = shift + (soff or 0.0)
-                            item_style = style
-                            if seg_enabled is False:
-                                item_enabled = False
-                            if ov_items and len(ov_items) > 0:
-                                skip_due_to_override = True
-                                seg_id_for_item = seg_id
-                            break
-                if skip_due_to_override:
-                    continue
-                if not item_enabled:
-                    continue
-                nt0, nt1 = t0 + eff_shift, t1 + eff_shift
-                # clamp to valid range and enforce minimal duration
-                vdur = float(getattr(video_clip, 'duration', 0.0) or 0.0)
-                if vdur and vdur > 0:
-                    if nt1 < 0 or nt0 >= vdur:
-                        continue  # completely out of range
-                    nt0 = max(0.0, min(nt0, max(0.0, vdur - 0.05)))
-                    nt1 = max(nt0 + 0.1, min(nt1, vdur))
-                new_item = ((nt0, nt1), item[1])
+                soff = float(_segment_value(s, "subtitle_offset", 0.0) or 0.0)
             except Exception:
-                new_item = item
-            # apply style overrides by creating clip with merged style
-            if item_style is None:
-                clip = create_text_clip(subtitle_item=new_item)
-            else:
-                # build merged style from params + item_style
-                try:
-                    # resolve font
-                    _font_name = item_style.get('font_name') or params.font_name
-                    _font_path = os.path.join(utils.font_dir(), _font_name) if _font_name else os.path.join(utils.font_dir(), "STHeitiMedium.ttc")
-                    if os.name == "nt":
-                        _font_path = _font_path.replace("\\", "/")
-                    # size and stroke
-                    _font_size = int(item_style.get('font_size') or params.font_size)
-                    _stroke_width = int(item_style.get('stroke_width') or params.stroke_width)
-                    _fore = item_style.get('text_fore_color') or params.text_fore_color
-                    _stroke = item_style.get('stroke_color') or params.stroke_color
-                    _bg = item_style.get('text_background_color')
-                    if _bg is None:
-                        _bg = params.text_background_color
-                    _pos = item_style.get('subtitle_position') or params.subtitle_position
-                    _custom = item_style.get('custom_position')
-                    if _custom is None:
-                        _custom = params.custom_position
-
-                    # local text clip creator using merged style
-                    def _create_clip(subtitle_item):
-                        phrase = subtitle_item[1]
-                        max_width = video_width * 0.9
-                        wrapped_txt, txt_height = wrap_text(
-                            phrase, max_width=max_width, font=_font_path, fontsize=_font_size
-                        )
-                        interline = int(_font_size * 0.25)
-                        size=(int(max_width), int(txt_height + _font_size * 0.25 + (interline * (wrapped_txt.count("\n") + 1))))
-
-                        _clip = TextClip(
-                            text=wrapped_txt,
-                            font=_font_path,
-                            font_size=_font_size,
-                            color=_fore,
-                            bg_color=_bg,
-                            stroke_color=_stroke,
-                            stroke_width=_stroke_width,
-                        )
-                        duration = subtitle_item[0][1] - subtitle_item[0][0]
-                        _clip = _clip.with_start(subtitle_item[0][0])
-                        _clip = _clip.with_end(subtitle_item[0][1])
-                        _clip = _clip.with_duration(duration)
-                        if _pos == "bottom":
-                            _clip = _clip.with_position(("center", video_height * 0.95 - _clip.h))
-                        elif _pos == "top":
-                            _clip = _clip.with_position(("center", video_height * 0.05))
-                        elif _pos == "custom":
-                            margin = 10
-                            max_y = video_height - _clip.h - margin
-                            min_y = margin
-                            custom_y = (video_height - _clip.h) * ((_custom or 70.0) / 100)
-                            custom_y = max(min_y, min(custom_y, max_y))
-                            _clip = _clip.with_position(("center", custom_y))
-                        else:
-                            _clip = _clip.with_position(("center", "center"))
-                        return _clip
-
-                    clip = _create_clip(new_item)
-                except Exception:
-                    clip = create_text_clip(subtitle_item=new_item)
-            text_clips.append(clip)
-        # add override items clips
-        for (ws, we, soff, style, seg_enabled, seg_id, ov_items) in windows:
-            if not ov_items or seg_enabled is False:
+                soff = 0.0
+            if dur <= 0:
                 continue
-            eff_shift_local = shift + (soff or 0.0)
-            for (rel_times, txt) in ov_items:
-                try:
-                    t0r, t1r = float(rel_times[0]), float(rel_times[1])
-                except Exception:
-                    t0r, t1r = 0.0, max(0.1, we - ws)
-                nt0 = ws + t0r + eff_shift_local
-                nt1 = ws + t1r + eff_shift_local
-                # clamp bounds
-                vdur = float(getattr(video_clip, 'duration', 0.0) or 0.0)
-                if vdur and vdur > 0:
-                    if nt1 < 0 or nt0 >= vdur:
-                        continue
-                    nt0 = max(0.0, min(nt0, max(0.0, vdur - 0.05)))
-                    nt1 = max(nt0 + 0.1, min(nt1, vdur))
-                new_item = ((nt0, nt1), txt)
-                # create clip using merged style similar to above
-                if style is None:
-                    clip = create_text_clip(subtitle_item=new_item)
-                else:
-                    try:
-                        _font_name = style.get('font_name') or params.font_name
-                        _font_path = os.path.join(utils.font_dir(), _font_name) if _font_name else os.path.join(utils.font_dir(), "STHeitiMedium.ttc")
-                        if os.name == "nt":
-                            _font_path = _font_path.replace("\\", "/")
-                        _font_size = int(style.get('font_size') or params.font_size)
-                        _stroke_width = int(style.get('stroke_width') or params.stroke_width)
-                        _fore = style.get('text_fore_color') or params.text_fore_color
-                        _stroke = style.get('stroke_color') or params.stroke_color
-                        _bg = style.get('text_background_color')
-                        if _bg is None:
-                            _bg = params.text_background_color
-                        _pos = style.get('subtitle_position') or params.subtitle_position
-                        _custom = style.get('custom_position')
-                        if _custom is None:
-                            _custom = params.custom_position
-
-                        def _create_clip2(subtitle_item):
-                            phrase = subtitle_item[1]
-                            max_width = video_width * 0.9
-                            wrapped_txt, txt_height = wrap_text(phrase, max_width=max_width, font=_font_path, fontsize=_font_size)
-                            interline = int(_font_size * 0.25)
-                            size=(int(max_width), int(txt_height + _font_size * 0.25 + (interline * (wrapped_txt.count("\n") + 1))))
-                            _clip = TextClip(text=wrapped_txt, font=_font_path, font_size=_font_size, color=_fore, bg_color=_bg, stroke_color=_stroke, stroke_width=_stroke_width)
-                            duration = subtitle_item[0][1] - subtitle_item[0][0]
-                            _clip = _clip.with_start(subtitle_item[0][0]).with_end(subtitle_item[0][1]).with_duration(duration)
-                            if _pos == "bottom":
-                                _clip = _clip.with_position(("center", video_height * 0.95 - _clip.h))
-                            elif _pos == "top":
-                                _clip = _clip.with_position(("center", video_height * 0.05))
-                            elif _pos == "custom":
-                                margin = 10
-                                max_y = video_height - _clip.h - margin
-                                min_y = margin
-                                custom_y = (video_height - _clip.h) * ((_custom or 70.0) / 100)
-                                custom_y = max(min_y, min(custom_y, max_y))
-                                _clip = _clip.with_position(("center", custom_y))
-                            else:
-                                _clip = _clip.with_position(("center", "center"))
-                            return _clip
-                        clip = _create_clip2(new_item)
-                    except Exception:
-                        clip = create_text_clip(subtitle_item=new_item)
-                text_clips.append(clip)
-        video_clip = CompositeVideoClip([video_clip, *text_clips])
+            # collect style overrides per segment (all optional)
+            style = {
+                name: _segment_value(s, name)
+                for name in (
+                    "subtitle_position",
+                    "custom_position",
+                    "font_name",
+                    "font_size",
+                    "text_fore_color",
+                    "stroke_color",
+                    "stroke_width",
+                    "text_background_color",
+                )
+            }
+            seg_enabled = _segment_value(s, "subtitle_enabled")
+            seg_id = _segment_value(s, "segment_id")
+            ov_items = None
+            try:
+                if seg_id and task_id:
+                    ov_path = os.path.join(
+                        utils.task_dir(task_id), "sub_overrides", str(seg_id), "applied.srt"
+                    )
+                    if os.path.exists(ov_path):
+                        # items are relative to the segment window
+                        ov_items = _read_override_srt(ov_path)
+            except Exception as e:
+                logger.warning(f"failed to read subtitle override for {seg_id}: {str(e)}")
+            windows.append((t, t + dur, soff, style, seg_enabled, ov_items))
+            t += dur
+
+    events = []
+    for item in file_to_subtitles(subtitle_path, encoding="utf-8"):
+        t0, t1 = float(item[0][0]), float(item[0][1])
+        eff_shift = shift
+        item_style = None
+        skip = False
+        if windows:
+            mid = (t0 + t1) / 2.0
+            for ws, we, soff, style, seg_enabled, ov_items in windows:
+                if ws <= mid < we:
+                    eff_shift = shift + (soff or 0.0)
+                    item_style = style
+                    # disabled segments and segments with override files drop the original lines
+                    skip = seg_enabled is False or bool(ov_items)
+                    break
+        if skip:
+            continue
+        timing = _clamp(t0 + eff_shift, t1 + eff_shift)
+        if timing:
+            events.append((timing, item[1], item_style))
 
+    # add override items
+    for ws, we, soff, style, seg_enabled, ov_items in windows:
+        if not ov_items or seg_enabled is False:
+            continue
+        eff_shift_local = shift + (soff or 0.0)
+        for rel_times, txt in ov_items:
+            timing = _clamp(
+                ws + rel_times[0] + eff_shift_local, ws + rel_times[1] + eff_shift_local
+            )
+            if timing:
+                events.append((timing, txt, style))
+    return events
+
+
+def _burn_subtitles(video_clip, events: list, params: VideoParams, font_path: str, output_file: str):
+    """Attach subtitle events to video_clip for writing to output_file.
+
+    ASS mode burns them in with libass while encoding, moviepy mode
+    composites text clips. Returns (clip, ffmpeg_params).
+    """
+    if not events:
+        return video_clip, []
+    if _subtitle_render_mode(params) == SUBTITLE_RENDER_ASS:
+        # burn in with libass while encoding instead of compositing every frame
+        ass_file = write_subtitle_ass(events, params, f"{output_file}.ass", font_path=font_path)
+        if ass_file:
+            return video_clip, ["-vf", subtitles_filter(ass_file)]
+        return video_clip, []
+
+    video_width, video_height = VideoAspect(params.video_aspect).to_resolution()
+    text_clips = []
+    for timing, text, style_overrides in events:
+        try:
+            style = _subtitle_style(params, style_overrides, font_path=font_path)
+            clip = _subtitle_clip((timing, text), style, video_width, video_height)
+        except Exception:
+            clip = _subtitle_clip((timing, text), _subtitle_style(params, font_path=font_path), video_width, video_height)
+        text_clips.append(clip)
+    subtitle_cache.evict()
+    return CompositeVideoClip([video_clip, *text_clips]), []
+
+
+def _final_audio_clip(audio_path: str, params: VideoParams, duration: float):
+    """Voice track with the BGM mixed under it for a video of the given duration."""
+    audio_clip = AudioFileClip(audio_path).with_effects(
+        [afx.MultiplyVolume(params.voice_volume)]
+    )
     bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
     if bgm_file:
         try:
@@ -1318,7 +1641,7 @@ def generate_video(
             if fo > 0:
                 effects.append(afx.AudioFadeOut(fo))
             # loop to match duration
-            effects.append(afx.AudioLoop(duration=video_clip.duration))
+            effects.append(afx.AudioLoop(duration=duration))
             # simple ducking: apply additional volume reduction when enabled
             try:
                 if bool(getattr(params, "bgm_ducking", False)):
@@ -1329,6 +1652,217 @@ def generate_video(
             audio_clip = CompositeAudioClip([audio_clip, bgm_clip])
         except Exception as e:
             logger.error(f"failed to add bgm: {str(e)}")
+    return audio_clip
+
+
+def audio_frames(audio_file: str) -> int:
+    """Number of output frames covering audio_file, 0 when it cannot be read."""
+    audio_clip = None
+    try:
+        audio_clip = AudioFileClip(audio_file)
+        return int(round(audio_clip.duration * fps))
+    except Exception as e:
+        logger.warning(f"failed to read audio duration: {str(e)}")
+        return 0
+    finally:
+        close_clip(audio_clip)
+
+
+def _final_chunk_count(duration: float) -> int:
+    """How many time chunks the final encode is split into; 1 encodes in one pass."""
+    try:
+        chunks = int(config.app.get("final_encode_chunks", 1))
+    except Exception:
+        chunks = 1
+    if chunks <= 0:
+        chunks = os.cpu_count() or 1
+    # chunks encode in worker processes, which do not start pools of their own
+    if _pool_worker:
+        return 1
+    try:
+        min_seconds = float(config.app.get("final_encode_chunk_min_seconds", 10))
+    except Exception:
+        min_seconds = 10.0
+    return max(1, min(chunks, int(duration // max(1.0, min_seconds))))
+
+
+def _chunk_events(events: list, start: float, end: float) -> list:
+    """Subtitle events overlapping [start, end), shifted onto the chunk's own timeline."""
+    shifted = []
+    for (t0, t1), text, style in events:
+        if t1 <= start or t0 >= end:
+            continue
+        shifted.append(((max(0.0, t0 - start), min(t1, end) - start), text, style))
+    return shifted
+
+
+def _encode_final_chunk(
+    video_path: str,
+    start: float,
+    end: float,
+    events: list,
+    params: VideoParams,
+    font_path: str,
+    chunk_file: str,
+) -> str:
+    """Composite and encode [start, end) of the final video, without audio.
+
+    Top-level so it can run in a worker process; events are already shifted
+    onto the chunk. Returns chunk_file, or "" on failure.
+    """
+    video_clip = None
+    try:
+        video_clip = VideoFileClip(video_path).without_audio().subclipped(start, end)
+        video_clip, ffmpeg_params = _burn_subtitles(video_clip, events, params, font_path, chunk_file)
+        video_clip.write_videofile(
+            chunk_file,
+            audio=False,
+            threads=params.n_threads or 2,
+            logger=render_progress.frame_logger(),
+            fps=fps,
+            ffmpeg_params=ffmpeg_params,
+        )
+        return chunk_file
+    except Exception as e:
+        logger.error(f"failed to encode final chunk {chunk_file}: {str(e)}")
+        return ""
+    finally:
+        close_clip(video_clip)
+        delete_files(f"{chunk_file}.ass")
+
+
+def _generate_video_chunked(
+    video_path: str,
+    audio_path: str,
+    output_file: str,
+    params: VideoParams,
+    events: list,
+    font_path: str,
+    duration: float,
+    chunks: int,
+):
+    """Encode the final video as parallel time chunks joined by stream copy.
+
+    The audio mix is encoded once for the whole timeline, each chunk
+    composites and encodes its slice of the video with the subtitle events
+    shifted to its offset, then the chunks are concatenated and muxed with
+    the audio without re-encoding.
+    """
+    # frame-aligned boundaries so the chunks add up to exactly the full frame count
+    total_frames = max(1, int(round(duration * fps)))
+    per_chunk = -(-total_frames // chunks)
+    bounds = [
+        (i * per_chunk / fps, min(total_frames, (i + 1) * per_chunk) / fps)
+        for i in range(chunks)
+        if i * per_chunk < total_frames
+    ]
+    logger.info(f"encoding final video in {len(bounds)} chunks")
+
+    audio_file = f"{output_file}.audio.m4a"
+    video_file = f"{output_file}.video.mp4"
+    chunk_files = [f"{output_file}.chunk-{i + 1}.mp4" for i in range(len(bounds))]
+    audio_clip = None
+    try:
+        audio_clip = _final_audio_clip(audio_path, params, duration)
+        audio_clip.write_audiofile(audio_file, fps=44100, codec=audio_codec, logger=None)
+
+        jobs = [
+            (video_path, t0, t1, _chunk_events(events, t0, t1), params, font_path, chunk_file)
+            for (t0, t1), chunk_file in zip(bounds, chunk_files)
+        ]
+        results = [""] * len(jobs)
+        with _process_pool(len(jobs)) as pool:
+            futures = {pool.submit(_encode_final_chunk, *job): i for i, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        if not all(results):
+            raise ValueError("failed to encode final video chunks")
+
+        if not (ffmpeg_utils.can_concat_copy(chunk_files) and ffmpeg_utils.concat_copy(chunk_files, video_file)):
+            logger.warning("final chunks differ, joining them with a re-encode")
+            if not concat_clip_files(chunk_files, video_file, params.n_threads or 2):
+                raise ValueError("failed to join final video chunks")
+
+        ok = ffmpeg_utils.run_ffmpeg(
+            [
+                "-i",
+                video_file,
+                "-i",
+                audio_file,
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                "-c",
+                "copy",
+                "-movflags",
+                "+faststart",
+                output_file,
+            ]
+        )
+        if not ok:
+            raise ValueError("failed to mux final video")
+    finally:
+        close_clip(audio_clip)
+        delete_files([audio_file, video_file, *chunk_files])
+
+
+def generate_video(
+    video_path: str,
+    audio_path: str,
+    subtitle_path: str,
+    output_file: str,
+    params: VideoParams,
+    segments: List[SegmentItem] | List[dict] | None = None,
+    task_id: str = "",
+):
+    # Validate input video exists and is non-empty before proceeding
+    if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
+        raise ValueError(f"invalid input video for rendering: {video_path}")
+
+    aspect = VideoAspect(params.video_aspect)
+    video_width, video_height = aspect.to_resolution()
+
+    logger.info(f"generating video: {video_width} x {video_height}")
+    logger.info(f"  ① video: {video_path}")
+    logger.info(f"  ② audio: {audio_path}")
+    logger.info(f"  ③ subtitle: {subtitle_path}")
+    logger.info(f"  ④ output: {output_file}")
+
+    # https://github.com/harry0703/MoneyPrinterTurbo/issues/217
+    # PermissionError: [WinError 32] The process cannot access the file because it is being used by another process: 'final-1.mp4.tempTEMP_MPY_wvf_snd.mp3'
+    # write into the same directory as the output file
+    output_dir = os.path.dirname(output_file)
+
+    font_path = ""
+    if params.subtitle_enabled:
+        if not params.font_name:
+            params.font_name = "STHeitiMedium.ttc"
+        font_path = os.path.join(utils.font_dir(), params.font_name)
+        if os.name == "nt":
+            font_path = font_path.replace("\\", "/")
+
+        logger.info(f"  ⑤ font: {font_path}")
+
+    video_clip = VideoFileClip(video_path).without_audio()
+    duration = float(video_clip.duration)
+
+    events = []
+    if params.subtitle_enabled:
+        events = subtitle_events(
+            subtitle_path, params, segments=segments, task_id=task_id, duration=duration
+        )
+
+    chunks = _final_chunk_count(duration)
+    if chunks > 1:
+        close_clip(video_clip)
+        _generate_video_chunked(
+            video_path, audio_path, output_file, params, events, font_path, duration, chunks
+        )
+        return
+
+    video_clip, ffmpeg_params = _burn_subtitles(video_clip, events, params, font_path, output_file)
+    audio_clip = _final_audio_clip(audio_path, params, video_clip.duration)
 
     video_clip = video_clip.with_audio(audio_clip)
     video_clip.write_videofile(
@@ -1336,11 +1870,52 @@ def generate_video(
         audio_codec=audio_codec,
         temp_audiofile_path=output_dir,
         threads=params.n_threads or 2,
-        logger=None,
+        logger=render_progress.frame_logger(),
         fps=fps,
+        # moov atom in front so playback starts before the download ends
+        ffmpeg_params=[*ffmpeg_params, "-movflags", "+faststart"],
     )
     video_clip.close()
     del video_clip
+    delete_files(f"{output_file}.ass")
+
+
+def _generate_video_job(kwargs: dict) -> str:
+    try:
+        generate_video(**kwargs)
+        return kwargs["output_file"]
+    except Exception as e:
+        logger.error(f"failed to generate video {kwargs['output_file']}: {str(e)}")
+        return ""
+
+
+def generate_videos(jobs: List[dict], on_done: Callable[[int], None] | None = None) -> List[str]:
+    """Run generate_video for each kwargs dict, in worker processes when configured.
+
+    Returns the output files in job order, "" for jobs that failed. on_done is
+    called with the job index as each job finishes.
+    """
+    workers = _render_workers(len(jobs))
+    results = [""] * len(jobs)
+    if workers <= 1:
+        for i, job in enumerate(jobs):
+            results[i] = _generate_video_job(job)
+            if on_done:
+                on_done(i)
+        return results
+
+    logger.info(f"generating {len(jobs)} videos with {workers} worker processes")
+    with _process_pool(workers) as pool:
+        futures = {pool.submit(_generate_video_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logger.error(f"failed to generate video {jobs[i]['output_file']}: {str(e)}")
+            if on_done:
+                on_done(i)
+    return results
 
 
 def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
@@ -1349,13 +1924,13 @@ def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
             continue
 
         ext = utils.parse_extension(material.url)
-        try:
-            clip = VideoFileClip(material.url)
-        except Exception:
-            clip = ImageClip(material.url)
+        info = probe.probe(material.url)
+        if not info:
+            logger.warning(f"unreadable material: {material.url}")
+            continue
 
-        width = clip.size[0]
-        height = clip.size[1]
+        width = info["width"]
+        height = info["height"]
         if width < 480 or height < 480:
             logger.warning(f"low resolution material: {width}x{height}, minimum 480x480 required")
             continue
@@ -1383,7 +1958,7 @@ def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
 
             # Output the video to a file.
             video_file = f"{material.url}.mp4"
-            final_clip.write_videofile(video_file, fps=30, logger=None)
+            final_clip.write_videofile(video_file, fps=30, logger=render_progress.frame_logger())
             close_clip(clip)
             material.url = video_file
             logger.success(f"image processed: {video_file}")
@@ -1486,6 +1486,17 @@ def create_subtitle(sub_maker: submaker.SubMaker, text: str, subtitle_file: str)
         logger.error(f"failed, error: {str(e)}")
 
 
+def estimate_duration(text: str, voice_rate: float = 1.0) -> float:
+    """
+    估算文本朗读时长（秒），用于在语音合成完成前预取素材
+    """
+    cjk = r"\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af"
+    # about 4.5 CJK characters or 2.5 words per second at the normal rate
+    chars = len(re.findall(f"[{cjk}]", text or ""))
+    words = len(re.findall(f"[^\\s{cjk}]+", text or ""))
+    return (chars / 4.5 + words / 2.5) / max(float(voice_rate or 1.0), 0.1)
+
+
 def get_audio_duration(sub_maker: submaker.SubMaker):
     """
     获取音频时长
@@ -133,6 +133,55 @@ def run_in_background(func, *args, **kwargs):
     return thread
 
 
+def file_identity(file_path: str) -> dict:
+    """Path, size and mtime of a file, enough to tell whether it changed."""
+    try:
+        st = os.stat(file_path)
+        return {
+            "path": os.path.abspath(file_path),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+        }
+    except OSError:
+        return {"path": os.path.abspath(file_path)}
+
+
+def evict_lru_files(directory: str, max_bytes: int, suffix: str = "", keep=()):
+    """Delete least recently modified files until directory fits in max_bytes.
+
+    Files named *.tmp<suffix> are still being written and are left alone, as
+    are the file names listed in keep.
+    """
+    if not os.path.isdir(directory):
+        return
+    keep = set(keep)
+    entries = []
+    total = 0
+    for entry in os.scandir(directory):
+        if not entry.is_file() or not entry.name.endswith(suffix):
+            continue
+        if entry.name.endswith(f".tmp{suffix}"):
+            continue
+        st = entry.stat()
+        total += st.st_size
+        entries.append((st.st_mtime, st.st_size, entry.name, entry.path))
+    if total <= max_bytes:
+        return
+
+    entries.sort()
+    for _, size, name, file_path in entries:
+        if total <= max_bytes:
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(file_path)
+            total -= size
+            logger.debug(f"evicted cached file: {file_path}")
+        except OSError:
+            continue
+
+
 def time_convert_seconds_to_hmsm(seconds) -> str:
     hours = int(seconds // 3600)
     seconds = seconds % 3600
@@ -204,6 +253,34 @@ def md5(text):
     return hashlib.md5(text.encode("utf-8")).hexdigest()
 
 
+def fingerprint(**inputs) -> str:
+    """Stable hash of JSON-able inputs, for cache keys and stage manifests."""
+    return md5(json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str))
+
+
+def load_json_file(file_path: str) -> dict:
+    """The JSON object in file_path, {} when it is missing or unreadable."""
+    if not os.path.exists(file_path):
+        return {}
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"failed to read {file_path}: {str(e)}")
+        return {}
+
+
+def write_json_file(file_path: str, data: dict):
+    """Write data to file_path atomically, so readers never see a partial file."""
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(temp_path, file_path)
+    except Exception as e:
+        logger.warning(f"failed to write {file_path}: {str(e)}")
+
+
 def get_system_locale():
     try:
         loc = locale.getdefaultlocale()
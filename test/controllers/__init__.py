@@ -0,0 +1 @@
+# Unit test package for services
\ No newline at end of file
@@ -0,0 +1,103 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import anyio
+from fastapi.testclient import TestClient
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.asgi import app
+from app.controllers.media import PATHSEND, MediaFileResponse
+from app.utils import utils
+
+
+class TestMediaResponses(unittest.TestCase):
+    def setUp(self):
+        self.task_id = "test-media"
+        self.task_dir = utils.task_dir(self.task_id)
+        self.content = bytes(range(256)) * 4096
+        with open(os.path.join(self.task_dir, "final-1.mp4"), "wb") as f:
+            f.write(self.content)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        shutil.rmtree(self.task_dir, ignore_errors=True)
+
+    def test_stream(self):
+        url = f"/api/v1/stream/{self.task_id}/final-1.mp4"
+        size = len(self.content)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.content)
+        self.assertEqual(response.headers["accept-ranges"], "bytes")
+        self.assertEqual(response.headers["content-type"], "video/mp4")
+        etag = response.headers["etag"]
+
+        response = self.client.get(url, headers={"Range": "bytes=100-199"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.content[100:200])
+        self.assertEqual(response.headers["content-range"], f"bytes 100-199/{size}")
+
+        response = self.client.get(url, headers={"Range": "bytes=-10"})
+        self.assertEqual(response.content, self.content[-10:])
+
+        response = self.client.get(url, headers={"Range": "bytes=0-9,20-29"})
+        self.assertEqual(response.status_code, 206)
+        self.assertIn("multipart/byteranges", response.headers["content-type"])
+        self.assertNotIn("content-range", response.headers)
+        self.assertEqual(int(response.headers["content-length"]), len(response.content))
+        self.assertIn(b"Content-Range: bytes 20-29/", response.content)
+        self.assertIn(self.content[20:30], response.content)
+
+        response = self.client.get(url, headers={"Range": f"bytes={size}-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers["content-range"], f"*/{size}")
+
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+        # a stale If-Range validator gets the whole file
+        response = self.client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(f"/api/v1/stream/{self.task_id}/missing.mp4").status_code, 404)
+        self.assertEqual(self.client.get("/api/v1/stream/..%2F..%2Fconfig.toml").status_code, 404)
+
+    def test_download_and_static(self):
+        response = self.client.get(f"/api/v1/download/{self.task_id}/final-1.mp4")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('filename="final-1.mp4"', response.headers["content-disposition"])
+
+        url = f"/tasks/{self.task_id}/final-1.mp4"
+        response = self.client.get(url, headers={"Range": "bytes=0-0"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.content[:1])
+        last_modified = response.headers["last-modified"]
+        self.assertEqual(self.client.get(url, headers={"If-Modified-Since": last_modified}).status_code, 304)
+
+    def test_pathsend(self):
+        # servers offering the pathsend extension send the file themselves
+        file_path = os.path.join(self.task_dir, "final-1.mp4")
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "headers": [],
+            "extensions": {PATHSEND: {}},
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request"}
+
+        async def send(message):
+            messages.append(message)
+
+        anyio.run(MediaFileResponse(file_path), scope, receive, send)
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(messages[1], {"type": PATHSEND, "path": file_path})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import json
+import sys
+import time
+from pathlib import Path
+
+import redis
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.controllers.manager import base_manager, redis_manager
+from app.models.schema import SegmentItem, VideoParams
+from app.services import task as tm
+
+
+def redis_available() -> bool:
+    try:
+        return redis.Redis.from_url(redis_manager.redis_url(), socket_connect_timeout=1).ping()
+    except Exception:
+        return False
+
+
+class TestRedisManager(unittest.TestCase):
+    def test_job_codec(self):
+        params = VideoParams(video_subject="test", video_aspects=["16:9", "1:1"])
+        segments = [SegmentItem(segment_id="seg-1", order=1, duration=1.5, material="a.mp4", start=0.0, end=1.5)]
+        raw = redis_manager.encode_job(
+            {
+                "func": tm.render_segments,
+                "kwargs": {"task_id": "t", "params": params, "segments": segments},
+                "lane": base_manager.LANE_PREVIEW,
+            }
+        )
+        job = redis_manager.decode_job(raw)
+        self.assertIs(job["func"], tm.render_segments)
+        self.assertEqual(job["lane"], base_manager.LANE_PREVIEW)
+        self.assertGreater(job["enqueued_at"], 0)
+        self.assertEqual(job["kwargs"]["task_id"], "t")
+        self.assertIsInstance(job["kwargs"]["params"], VideoParams)
+        self.assertEqual(job["kwargs"]["params"], params)
+        self.assertIsInstance(job["kwargs"]["segments"][0], SegmentItem)
+        self.assertEqual(job["kwargs"]["segments"], segments)
+        self.assertTrue(json.loads(raw)["id"])
+
+    @unittest.skipUnless(redis_available(), "needs a redis server")
+    def test_reserve_ack_and_requeue(self):
+        worker = redis_manager.RedisWorker(redis_manager.redis_url(), 1, queue="test_task_queue")
+        keys = [worker.processing, worker.leases, worker.attempts, worker.workers]
+        keys += [redis_manager.lane_queue(worker.queue, lane) for lane in base_manager.LANES]
+        keys += [redis_manager.lane_signal(worker.queue, lane) for lane in base_manager.LANES]
+        client = worker.redis_client
+        client.delete(*keys)
+        manager = redis_manager.RedisTaskManager(1, redis_manager.redis_url(), fleet=True)
+        manager.queue = worker.queue
+        try:
+            manager.enqueue({"func": tm.start, "kwargs": {"task_id": "a"}})
+            manager.enqueue({"func": tm.start, "kwargs": {"task_id": "b"}})
+            manager.enqueue({"func": tm.start, "kwargs": {"task_id": "c"}, "lane": base_manager.LANE_BATCH})
+            self.assertEqual(len(manager.queued()), 3)
+            # batch work is only taken by unreserved slots, which keep its wake-up
+            self.assertIsNone(worker.reserve(base_manager.INTERACTIVE_LANES, timeout=1))
+            batch_signal = redis_manager.lane_signal(worker.queue, base_manager.LANE_BATCH)
+            self.assertEqual(client.llen(batch_signal), 1)
+
+            # first in, first out; a reserved job waits in the processing list until acked
+            raw, job = worker.reserve(timeout=1)
+            self.assertEqual(job["kwargs"]["task_id"], "a")
+            self.assertEqual(client.llen(worker.processing), 1)
+            worker.ack(raw, job["id"])
+            self.assertEqual(client.llen(worker.processing), 0)
+
+            # a job whose lease ran out goes back to the front of the queue
+            raw, job = worker.reserve(timeout=1)
+            worker.requeue_expired()
+            self.assertEqual(client.llen(worker.processing), 1)
+            client.hset(worker.leases, job["id"], time.time() - 1)
+            worker.requeue_expired()
+            self.assertEqual(client.llen(worker.processing), 0)
+            self.assertEqual(int(client.hget(worker.attempts, job["id"])), 1)
+            raw, again = worker.reserve(timeout=1)
+            self.assertEqual(again["id"], job["id"])
+            worker.ack(raw, again["id"])
+
+            _, batch = worker.reserve(timeout=1)
+            self.assertEqual(batch["kwargs"]["task_id"], "c")
+            self.assertTrue(manager.is_queue_empty())
+
+            worker.heartbeat()
+            self.assertTrue(client.hexists(worker.workers, worker.worker_id))
+        finally:
+            client.delete(*keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import sys
+import threading
+import time
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.config import config
+from app.controllers.manager import base_manager
+from app.controllers.manager.memory_manager import InMemoryTaskManager
+from app.services import state as sm
+
+
+class TestTaskManager(unittest.TestCase):
+    def setUp(self):
+        self.saved_config = {k: config.app.get(k) for k in ("interactive_slots", "task_aging_seconds")}
+        self.release = threading.Event()
+        self.started = []
+        self.task_ids = []
+
+    def tearDown(self):
+        self.release.set()
+        for k, v in self.saved_config.items():
+            if v is None:
+                config.app.pop(k, None)
+            else:
+                config.app[k] = v
+        for task_id in self.task_ids:
+            sm.state.delete_task(task_id)
+
+    def blocking(self, task_id):
+        self.started.append(task_id)
+        self.release.wait(10)
+        return task_id
+
+    def add(self, manager, task_id, lane):
+        self.task_ids.append(task_id)
+        manager.add_task(self.blocking, task_id=task_id, lane=lane)
+
+    def wait_for(self, count):
+        for _ in range(100):
+            if len(self.started) >= count:
+                return
+            time.sleep(0.05)
+
+    def test_lane_order(self):
+        config.app["interactive_slots"] = 0
+        config.app["task_aging_seconds"] = 0
+        manager = InMemoryTaskManager(max_concurrent_tasks=1)
+        self.add(manager, "lane-running", base_manager.LANE_BATCH)
+        for lane in (base_manager.LANE_BATCH, base_manager.LANE_VIDEO, base_manager.LANE_RENDER, base_manager.LANE_PREVIEW):
+            self.add(manager, f"lane-{lane}", lane)
+
+        running = sm.state.get_task("lane-running")
+        self.assertEqual(running["queue_position"], 0)
+        # the state shows where each queued task stands
+        preview = sm.state.get_task("lane-preview")
+        self.assertEqual(preview["lane"], base_manager.LANE_PREVIEW)
+        self.assertEqual(preview["queue_position"], 1)
+        self.assertEqual(sm.state.get_task("lane-batch")["queue_position"], 4)
+
+        self.release.set()
+        self.wait_for(5)
+        self.assertEqual(self.started, ["lane-running", "lane-preview", "lane-render", "lane-video", "lane-batch"])
+
+    def test_positions_keep_progress(self):
+        config.app["interactive_slots"] = 0
+        config.app["task_aging_seconds"] = 0
+        manager = InMemoryTaskManager(max_concurrent_tasks=1)
+        self.add(manager, "keep-running", base_manager.LANE_BATCH)
+        self.add(manager, "keep-video", base_manager.LANE_VIDEO)
+        sm.state.update_task("keep-video", progress=5)
+        # a preview moves the video task back a place without touching its progress
+        self.add(manager, "keep-preview", base_manager.LANE_PREVIEW)
+        task = sm.state.get_task("keep-video")
+        self.assertEqual(task["queue_position"], 2)
+        self.assertEqual(task["progress"], 5)
+
+        self.release.set()
+        self.wait_for(3)
+
+    def test_aging(self):
+        config.app["task_aging_seconds"] = 10
+        now = time.time()
+        batch = {"id": "b", "lane": base_manager.LANE_BATCH, "enqueued_at": now - 25}
+        video = {"id": "v", "lane": base_manager.LANE_VIDEO, "enqueued_at": now}
+        preview = {"id": "p", "lane": base_manager.LANE_PREVIEW, "enqueued_at": now}
+        # a batch task that waited 2.5 lanes' worth overtakes new video tasks, not previews
+        order = base_manager.schedule_order([video, batch, preview])
+        self.assertEqual([t["id"] for t in order], ["p", "b", "v"])
+
+    def test_reserved_slots(self):
+        config.app["interactive_slots"] = 1
+        manager = InMemoryTaskManager(max_concurrent_tasks=2)
+        self.add(manager, "slot-video-1", base_manager.LANE_VIDEO)
+        self.add(manager, "slot-video-2", base_manager.LANE_VIDEO)
+        self.wait_for(1)
+        # the second slot is kept for previews
+        self.assertEqual(sm.state.get_task("slot-video-2")["queue_position"], 1)
+
+        self.add(manager, "slot-preview", base_manager.LANE_PREVIEW)
+        self.wait_for(2)
+        self.assertEqual(self.started, ["slot-video-1", "slot-preview"])
+        self.assertEqual(sm.state.get_task("slot-preview")["queue_position"], 0)
+
+        self.release.set()
+        self.wait_for(3)
+        self.assertEqual(self.started[-1], "slot-video-2")
+
+    def test_run(self):
+        manager = InMemoryTaskManager(max_concurrent_tasks=1)
+        self.release.set()
+        self.task_ids.append("run-preview")
+        result = manager.run(self.blocking, task_id="run-preview", lane=base_manager.LANE_PREVIEW)
+        self.assertEqual(result, "run-preview")
+        with self.assertRaises(ZeroDivisionError):
+            manager.run(lambda: 1 / 0, lane=base_manager.LANE_PREVIEW)
+        self.assertEqual(manager.current_tasks, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.config import config
+from app.controllers.manager.memory_manager import InMemoryTaskManager
+from app.controllers.manager.worker_pool import WorkerPool
+from app.models import const
+from app.services import state as sm
+
+
+# tasks are sent to the workers by reference, so they live at module level
+def report_pid(task_id):
+    sm.state.update_task(task_id, state=const.TASK_STATE_COMPLETE, progress=100, pid=os.getpid())
+
+
+def fail(task_id):
+    raise ValueError("boom")
+
+
+def crash(task_id):
+    os._exit(1)
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.task_id = "test-worker-pool"
+        self.saved_config = {k: config.app.get(k) for k in ("task_worker_max_tasks",)}
+        self.pool = None
+
+    def tearDown(self):
+        if self.pool:
+            self.pool.shutdown()
+        for k, v in self.saved_config.items():
+            if v is None:
+                config.app.pop(k, None)
+            else:
+                config.app[k] = v
+        sm.state.delete_task(self.task_id)
+
+    def test_run_and_recycle(self):
+        config.app["task_worker_max_tasks"] = 2
+        self.pool = WorkerPool(1)
+
+        pids = []
+        for _ in range(3):
+            self.pool.run(report_pid, self.task_id)
+            # state updates made in the worker reach the API process
+            task = sm.state.get_task(self.task_id)
+            self.assertEqual(task["progress"], 100)
+            pids.append(task["pid"])
+        self.assertNotEqual(pids[0], os.getpid())
+        self.assertEqual(pids[0], pids[1])
+        # replaced by a fresh worker after two tasks
+        self.assertNotEqual(pids[1], pids[2])
+
+    def test_failures(self):
+        self.pool = WorkerPool(1)
+        with self.assertRaisesRegex(RuntimeError, "boom"):
+            self.pool.run(fail, self.task_id)
+        with self.assertRaisesRegex(RuntimeError, "exited unexpectedly"):
+            self.pool.run(crash, self.task_id)
+        # the dead worker was replaced
+        self.pool.run(report_pid, self.task_id)
+        self.assertEqual(sm.state.get_task(self.task_id)["state"], const.TASK_STATE_COMPLETE)
+
+    def test_shutdown_while_waiting(self):
+        self.pool = WorkerPool(1)
+        # the only worker is busy, so run waits until the pool shuts down
+        self.pool._idle.get()
+        threading.Timer(0.5, self.pool.shutdown).start()
+        with self.assertRaisesRegex(RuntimeError, "shut down"):
+            self.pool.run(report_pid, self.task_id)
+
+    def test_task_manager(self):
+        manager = InMemoryTaskManager(max_concurrent_tasks=1, executor="process")
+        self.pool = manager.pool
+        # the second task waits in the queue for the only worker
+        manager.add_task(fail, task_id=self.task_id)
+        manager.add_task(report_pid, task_id=f"{self.task_id}-2")
+        for _ in range(600):
+            task = sm.state.get_task(f"{self.task_id}-2")
+            if task and task.get("pid"):
+                break
+            time.sleep(0.1)
+        self.assertEqual(sm.state.get_task(self.task_id)["state"], const.TASK_STATE_FAILED)
+        self.assertEqual(sm.state.get_task(self.task_id)["error"], "boom")
+        sm.state.delete_task(f"{self.task_id}-2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from moviepy import VideoFileClip
+from app.models.schema import SegmentItem, VideoParams
+from app.services import ffmpeg_render
+from app.services import video as vd
+from app.services.utils import ffmpeg_utils
+from app.utils import utils
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
+
+class TestFfmpegRender(unittest.TestCase):
+    def setUp(self):
+        self.params = VideoParams(
+            video_subject="test",
+            video_aspect="9:16",
+            render_engine="ffmpeg",
+            bgm_type="",
+        )
+        self.segments = [
+            SegmentItem(
+                segment_id=f"seg-{i}",
+                order=i,
+                duration=1.0,
+                material=os.path.join(resources_dir, f"{i}.png.mp4"),
+                start=0.5,
+                end=2.0,
+                fit=fit,
+            )
+            for i, fit in ((1, "contain"), (2, "cover"), (3, "center"))
+        ]
+
+    def test_build_command(self):
+        args = ffmpeg_render.build_command(self.segments, self.params, "out.mp4")
+        graph = args[args.index("-filter_complex") + 1]
+        self.assertEqual(args.count("-i"), 3)
+        self.assertIn("concat=n=3:v=1:a=0", graph)
+        self.assertIn("force_original_aspect_ratio=increase", graph)
+        output_args = args[args.index("-filter_complex"):]
+        self.assertEqual(output_args[output_args.index("-t") + 1], "3.000")
+
+    def test_shared_reads(self):
+        material = self.segments[0].material
+        segments = [
+            SegmentItem(segment_id=f"seg-{i}", order=i, duration=1.0, material=material, start=start, end=start + 1.0)
+            for i, start in enumerate((0.0, 1.0, 0.5))
+        ]
+        # the first two read the source forward and share one decoder, the third rewinds
+        reads = ffmpeg_render._plan_reads(segments)
+        self.assertEqual([r["segments"] for r in reads], [[0, 1], [2]])
+        self.assertEqual((reads[0]["start"], reads[0]["end"]), (0.0, 2.0))
+
+        args = ffmpeg_render.build_command(segments, self.params, "out.mp4")
+        graph = args[args.index("-filter_complex") + 1]
+        self.assertEqual(args.count("-i"), 2)
+        self.assertIn("[0:v:0]split=2[r0_0][r0_1]", graph)
+        self.assertIn("[r0_1]trim=start=1.000:duration=1.000", graph)
+
+        output_file = os.path.join(utils.storage_dir("temp", create=True), "test-ffmpeg-shared.mp4")
+        try:
+            self.assertEqual(
+                ffmpeg_render.render_segments(segments, self.params, output_file, video_only=True), output_file
+            )
+            clip = VideoFileClip(output_file)
+            self.assertAlmostEqual(clip.duration, 3.0, delta=0.1)
+            vd.close_clip(clip)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def test_fanout_shared_reads(self):
+        material = self.segments[0].material
+        segments = [
+            SegmentItem(segment_id=f"seg-{i}", order=i, duration=1.0, material=material, start=i, end=i + 1.0)
+            for i in range(2)
+        ]
+        args = ffmpeg_render.build_fanout_command(
+            segments, self.params, {"9:16": "a.mp4", "16:9": "b.mp4"}
+        )
+        graph = args[args.index("-filter_complex") + 1]
+        # one decode of the source feeds both segments, each split per aspect
+        self.assertEqual(args.count("-i"), 1)
+        self.assertIn("[0:v:0]split=2[r0_0][r0_1]", graph)
+        self.assertIn("split=2[s0_0][s0_1]", graph)
+        self.assertIn("split=2[s1_0][s1_1]", graph)
+
+    def test_muted_voice(self):
+        params = self.params.model_copy(update={"voice_volume": 0.0})
+        args = ffmpeg_render.build_command(self.segments, params, "out.mp4", audio_file="audio.mp3")
+        self.assertIn("volume=0.0[voice]", args[args.index("-filter_complex") + 1])
+
+    def test_render_segments_video_only(self):
+        output_file = os.path.join(utils.storage_dir("temp", create=True), "test-ffmpeg-render.mp4")
+        try:
+            result = ffmpeg_render.render_segments(
+                self.segments, self.params, output_file, video_only=True
+            )
+            self.assertEqual(result, output_file)
+
+            clip = VideoFileClip(output_file)
+            self.assertEqual(tuple(clip.size), (1080, 1920))
+            self.assertAlmostEqual(clip.duration, 3.0, delta=0.1)
+            vd.close_clip(clip)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def test_render_aspects(self):
+        output_dir = utils.storage_dir("temp/test_ffmpeg_aspects", create=True)
+        audio_file = os.path.join(output_dir, "audio.mp3")
+        ffmpeg_utils.run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono", "-t", "3", audio_file])
+        outputs = {aspect: os.path.join(output_dir, f"{aspect.replace(':', 'x')}.mp4") for aspect in ("9:16", "16:9", "1:1")}
+        try:
+            args = ffmpeg_render.build_fanout_command(self.segments, self.params, outputs, audio_file=audio_file)
+            # one input per segment source plus the voice; each segment is split per aspect
+            self.assertEqual(args.count("-i"), 4)
+            self.assertIn("split=3", args[args.index("-filter_complex") + 1])
+
+            params = self.params.model_copy(update={"subtitle_enabled": False})
+            result = ffmpeg_render.render_aspects(self.segments, params, outputs, audio_file=audio_file)
+            self.assertEqual(result, outputs)
+            for aspect, size in (("9:16", (1080, 1920)), ("16:9", (1920, 1080)), ("1:1", (1080, 1080))):
+                clip = VideoFileClip(outputs[aspect])
+                self.assertEqual(tuple(clip.size), size)
+                self.assertAlmostEqual(clip.duration, 3.0, delta=0.1)
+                self.assertIsNotNone(clip.audio)
+                vd.close_clip(clip)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_render_segments_progressive(self):
+        # tee output paths are escaped, so separators in them are fine
+        output_dir = utils.storage_dir("temp/test_ffmpeg_live:1", create=True)
+        output_file = os.path.join(output_dir, "final-1.mp4")
+        try:
+            result = ffmpeg_render.render_segments(
+                self.segments, self.params, output_file, video_only=True, progressive=True
+            )
+            self.assertEqual(result, output_file)
+            clip = VideoFileClip(output_file)
+            self.assertAlmostEqual(clip.duration, 3.0, delta=0.1)
+            vd.close_clip(clip)
+
+            playlist = ffmpeg_render.live_playlist(output_file)
+            self.assertEqual(playlist, os.path.join(output_dir, "live", "final-1", "index.m3u8"))
+            with open(playlist, encoding="utf-8") as f:
+                content = f.read()
+            self.assertIn("#EXT-X-PLAYLIST-TYPE:EVENT", content)
+            self.assertIn("seg-00001.m4s", content)
+            self.assertIn("#EXT-X-ENDLIST", content)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_target_aspects(self):
+        params = self.params.model_copy(update={"video_aspects": ["16:9", "9:16", "1:1"]})
+        self.assertEqual([a.value for a in vd.target_aspects(params)], ["9:16", "16:9", "1:1"])
+        self.assertEqual(os.path.basename(vd.final_aspect_path("", "16:9")), "final-16x9.mp4")
+        self.assertEqual(os.path.basename(vd.final_aspect_path("", "1:1", 2)), "final-2-1x1.mp4")
+
+
+if __name__ == "__main__":
+    unittest.main()
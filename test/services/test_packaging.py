@@ -0,0 +1,67 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.config import config
+from app.services import packaging, probe
+from app.services.utils import ffmpeg_utils
+from app.utils import utils
+
+
+class TestPackagingService(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = utils.storage_dir("temp/test_packaging", create=True)
+        self.video_file = os.path.join(self.temp_dir, "final-1.mp4")
+        ffmpeg_utils.run_ffmpeg(
+            [
+                "-f", "lavfi", "-i", "testsrc=s=720x1280:r=30",
+                "-f", "lavfi", "-i", "sine=r=44100",
+                "-t", "5", "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", self.video_file,
+            ]
+        )
+        self.hls_config = {k: config.app.get(k) for k in ("output_hls", "hls_ladder")}
+
+    def tearDown(self):
+        for k, v in self.hls_config.items():
+            if v is None:
+                config.app.pop(k, None)
+            else:
+                config.app[k] = v
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_ensure_faststart(self):
+        # ffmpeg writes the moov atom at the end unless asked otherwise
+        self.assertFalse(probe.mp4_moov_first(self.video_file))
+        self.assertTrue(packaging.ensure_faststart(self.video_file))
+        self.assertTrue(probe.mp4_moov_first(self.video_file))
+        self.assertAlmostEqual(probe.probe(self.video_file)["duration"], 5.0, delta=0.1)
+
+    def test_package_hls(self):
+        config.app["output_hls"] = True
+        config.app["hls_ladder"] = [1080, 480, 360]
+        playlists = packaging.package([self.video_file])
+        master = os.path.join(self.temp_dir, "hls", "final-1", "master.m3u8")
+        self.assertEqual(playlists, {self.video_file: master})
+        self.assertTrue(probe.mp4_moov_first(self.video_file))
+
+        with open(master, encoding="utf-8") as f:
+            content = f.read()
+        # 1080 would upscale the 720 wide source and is skipped
+        self.assertNotIn("1080p/index.m3u8", content)
+        self.assertIn("RESOLUTION=480x854", content)
+        self.assertIn("RESOLUTION=360x640", content)
+        with open(os.path.join(self.temp_dir, "hls", "final-1", "480p", "index.m3u8"), encoding="utf-8") as f:
+            self.assertIn("#EXT-X-MAP:URI=", f.read())
+
+        # an existing package newer than the video is reused
+        mtime = os.stat(master).st_mtime_ns
+        self.assertEqual(packaging.package_hls(self.video_file), master)
+        self.assertEqual(os.stat(master).st_mtime_ns, mtime)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.models import const
+from app.services import pipeline
+from app.services import state as sm
+from app.services import task_manifest
+from app.utils import utils
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.task_id = "test-pipeline"
+
+    def tearDown(self):
+        sm.state.delete_task(self.task_id)
+        shutil.rmtree(utils.task_dir(self.task_id), ignore_errors=True)
+
+    def test_independent_stages_overlap(self):
+        # audio and materials only finish if they run at the same time
+        both = threading.Barrier(2, timeout=5)
+
+        def meet(value):
+            both.wait()
+            return value
+
+        stages = [
+            pipeline.Stage("script", lambda r: "script", progress=10),
+            pipeline.Stage("audio", lambda r: meet(r["script"] + "+audio"), ["script"], progress=30),
+            pipeline.Stage("materials", lambda r: meet(r["script"] + "+materials"), ["script"], progress=50),
+            pipeline.Stage("video", lambda r: [r["audio"], r["materials"]], ["audio", "materials"]),
+            pipeline.Stage("unused", lambda r: self.fail("not a dependency of the target")),
+        ]
+        r = pipeline.run(self.task_id, stages, ["video"])
+        self.assertEqual(r["video"], ["script+audio", "script+materials"])
+        self.assertNotIn("unused", r)
+
+        task = sm.state.get_task(self.task_id)
+        self.assertEqual(task["progress"], 50)
+        self.assertEqual(set(task["stage_timings"]), {"script", "audio", "materials", "video"})
+        self.assertGreaterEqual(task["stage_timings"]["video"]["start"], task["stage_timings"]["audio"]["start"])
+
+    def test_failed_stage(self):
+        ran = []
+        stages = [
+            pipeline.Stage("script", lambda r: None),
+            pipeline.Stage("audio", lambda r: ran.append("audio"), ["script"]),
+        ]
+        self.assertIsNone(pipeline.run(self.task_id, stages, ["audio"]))
+        self.assertEqual(ran, [])
+        self.assertEqual(sm.state.get_task(self.task_id)["state"], const.TASK_STATE_FAILED)
+
+        stages = [pipeline.Stage("script", lambda r: 1 / 0)]
+        with self.assertRaises(ZeroDivisionError):
+            pipeline.run(self.task_id, stages, ["script"])
+
+    def test_checkpoints(self):
+        calls = []
+        audio_file = os.path.join(utils.task_dir(self.task_id), "audio.mp3")
+
+        def script(r):
+            calls.append("script")
+            return "script"
+
+        def audio(r):
+            calls.append("audio")
+            with open(audio_file, "w") as f:
+                f.write(r["script"])
+            return audio_file
+
+        def stages(voice="a", video=lambda r: [r["audio"]]):
+            return [
+                pipeline.Stage("script", script, dump=lambda o: o),
+                pipeline.Stage("audio", audio, ["script"], inputs={"voice": voice}, dump=lambda o: o),
+                pipeline.Stage("video", video, ["audio"], dump=lambda o: o),
+            ]
+
+        # interrupted after the audio
+        self.assertIsNone(pipeline.run(self.task_id, stages(video=lambda r: None), ["video"], checkpoint=True))
+        self.assertEqual(calls, ["script", "audio"])
+
+        # resuming only runs what is left
+        calls.clear()
+        r = pipeline.run(self.task_id, stages(), ["video"], checkpoint=True)
+        self.assertEqual(r["video"], [audio_file])
+        self.assertEqual(calls, [])
+        self.assertTrue(sm.state.get_task(self.task_id)["stage_timings"]["audio"]["restored"])
+        self.assertEqual(set(task_manifest.load(self.task_id)["stages"]), {"script", "audio", "video"})
+
+        # changed inputs run the stage again, and a replaced output invalidates its checkpoint
+        pipeline.run(self.task_id, stages(voice="b"), ["video"], checkpoint=True)
+        self.assertEqual(calls, ["audio"])
+        with open(audio_file, "w") as f:
+            f.write("edited audio")
+        calls.clear()
+        pipeline.run(self.task_id, stages(voice="b"), ["video"], checkpoint=True)
+        self.assertEqual(calls, ["audio"])
+
+
+if __name__ == "__main__":
+    unittest.main()
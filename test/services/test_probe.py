@@ -0,0 +1,73 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.services import probe
+from app.services.utils import ffmpeg_utils
+from app.utils import utils
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
+
+
+class TestProbeService(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = utils.storage_dir("temp/test_probe", create=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_probe(self):
+        info = probe.probe(os.path.join(resources_dir, "1.png.mp4"))
+        self.assertEqual((info["width"], info["height"]), (580, 751))
+        self.assertAlmostEqual(info["duration"], 3.0, delta=0.1)
+        self.assertEqual(info["codec"], "h264")
+        self.assertFalse(info["is_image"])
+
+        image = probe.probe(os.path.join(resources_dir, "1.png"))
+        self.assertTrue(image["is_image"])
+        self.assertEqual((image["width"], image["height"]), (580, 751))
+
+        self.assertIsNone(probe.probe(os.path.join(self.temp_dir, "missing.mp4")))
+
+    def test_keyframes(self):
+        video_file = os.path.join(self.temp_dir, "gop.mp4")
+        ffmpeg_utils.run_ffmpeg(
+            ["-f", "lavfi", "-i", "testsrc=s=320x240:r=25", "-t", "6", "-g", "50", "-c:v", "libx264", video_file]
+        )
+        self.assertEqual(probe.mp4_keyframe_times(video_file), [0.0, 2.0, 4.0])
+        self.assertEqual(probe.probe(video_file)["keyframe_interval"], 2.0)
+
+    def test_keyframes_index(self):
+        # not an MP4, so the index comes from a keyframe-only decode
+        video_file = os.path.join(self.temp_dir, "gop.mkv")
+        ffmpeg_utils.run_ffmpeg(
+            ["-f", "lavfi", "-i", "testsrc=s=320x240:r=25", "-t", "6", "-g", "50", "-c:v", "libx264", video_file]
+        )
+        self.assertEqual(probe.keyframes(video_file), [0.0, 2.0, 4.0])
+        self.assertIsNone(probe.keyframes(os.path.join(resources_dir, "1.png")))
+
+    def test_probe_many_cached(self):
+        video_file = os.path.join(self.temp_dir, "copy.mp4")
+        shutil.copy(os.path.join(resources_dir, "2.png.mp4"), video_file)
+        first = probe.probe_many([video_file])[video_file]
+
+        # a cached entry is returned without probing again
+        probe_file = probe._probe_file
+        probe._probe_file = lambda _: self.fail("probed a cached file")
+        try:
+            self.assertEqual(probe.probe_many([video_file])[video_file], first)
+        finally:
+            probe._probe_file = probe_file
+
+        # a changed file is probed again
+        shutil.copy(os.path.join(resources_dir, "3.png.mp4"), video_file)
+        os.utime(video_file, ns=(1, 1))
+        self.assertIsNotNone(probe.probe_many([video_file])[video_file])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.models.schema import SegmentItem, VideoAspect, VideoParams
+from app.services import probe, proxy
+from app.services import video as vd
+from app.services.utils import ffmpeg_utils
+from app.utils import utils
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
+
+
+class TestProxyService(unittest.TestCase):
+    def setUp(self):
+        self.task_id = "test-proxy"
+        self.temp_dir = utils.storage_dir("temp/test_proxy", create=True)
+        self.material = os.path.join(self.temp_dir, "full.mp4")
+        ffmpeg_utils.run_ffmpeg(
+            ["-f", "lavfi", "-i", "testsrc=s=1080x1920:r=30", "-t", "3", "-c:v", "libx264", "-preset", "ultrafast", self.material]
+        )
+
+    def tearDown(self):
+        proxy_file = os.path.join(proxy.cache_dir(), f"{proxy._proxy_key(self.material)}.mp4")
+        if os.path.exists(proxy_file):
+            os.remove(proxy_file)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        shutil.rmtree(utils.task_dir(self.task_id), ignore_errors=True)
+
+    def test_resolution(self):
+        self.assertEqual(proxy.resolution(VideoAspect.portrait), (540, 960))
+        self.assertEqual(proxy.resolution(VideoAspect.landscape), (960, 540))
+        self.assertEqual(proxy.resolution(VideoAspect.square), (540, 540))
+
+    def test_proxies_for(self):
+        image = os.path.join(resources_dir, "1.png")
+        proxies = proxy.proxies_for([self.material, image])
+        # images are used as they are
+        self.assertEqual(proxies[image], image)
+
+        info = probe.probe(proxies[self.material])
+        self.assertEqual((info["width"], info["height"]), (540, 960))
+        self.assertEqual(info["fps"], 15)
+        self.assertAlmostEqual(info["duration"], 3.0, delta=0.1)
+
+        # served from the cache the second time
+        mtime = os.stat(proxies[self.material]).st_mtime_ns
+        self.assertEqual(proxy.proxies_for([self.material]), {self.material: proxies[self.material]})
+        self.assertGreaterEqual(os.stat(proxies[self.material]).st_mtime_ns, mtime)
+
+    def test_proxies_for_concurrent(self):
+        # two previews of the same material create its proxy at the same time
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda _: proxy.proxies_for([self.material]), range(2)))
+        proxy_file = os.path.join(proxy.cache_dir(), f"{proxy._proxy_key(self.material)}.mp4")
+        self.assertEqual(results, [{self.material: proxy_file}] * 2)
+        info = probe.probe(proxy_file)
+        self.assertEqual((info["width"], info["height"]), (540, 960))
+        self.assertAlmostEqual(info["duration"], 3.0, delta=0.1)
+        key = proxy._proxy_key(self.material)
+        self.assertFalse([f for f in os.listdir(proxy.cache_dir()) if f.startswith(key) and ".tmp" in f])
+
+    def test_render_preview(self):
+        params = VideoParams(video_subject="test", video_aspect="9:16", bgm_type="")
+        segments = [
+            SegmentItem(segment_id="s1", order=1, duration=1.0, material=self.material, start=0.0, end=1.0),
+            SegmentItem(segment_id="s2", order=2, duration=1.0, material=self.material, start=1.5, end=2.5),
+        ]
+        combined, final = vd.render_from_segments(
+            self.task_id, segments, params, audio_file="", preview=True, preview_label="all"
+        )
+        self.assertEqual(final, "")
+        self.assertEqual(os.path.basename(combined), "preview-all.mp4")
+        self.assertFalse(os.path.exists(os.path.join(utils.task_dir(self.task_id), "combined-1.mp4")))
+        info = probe.probe(combined)
+        self.assertEqual((info["width"], info["height"]), (540, 960))
+        self.assertEqual(info["fps"], 15)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from moviepy import ColorClip
+from app.config import config
+from app.models.schema import SegmentItem, VideoParams
+from app.services import render_progress
+from app.services import state as sm
+from app.services import video as vd
+from app.utils import utils
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
+
+
+class TestRenderProgress(unittest.TestCase):
+    def setUp(self):
+        self.task_id = "test-render-progress"
+        self.temp_dir = utils.storage_dir("temp/test_render_progress", create=True)
+        self.saved_config = {k: config.app.get(k) for k in ("render_workers",)}
+
+    def tearDown(self):
+        for k, v in self.saved_config.items():
+            if v is None:
+                config.app.pop(k, None)
+            else:
+                config.app[k] = v
+        sm.state.delete_task(self.task_id)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_frames_in_process(self):
+        self.assertIsNone(render_progress.frame_logger())
+        clip = ColorClip((64, 64), color=(255, 0, 0), duration=2)
+        # two encodes of 60 frames against a budget of 150
+        with render_progress.tracking(self.task_id, 150, start=50, end=100):
+            for i in range(2):
+                clip.write_videofile(
+                    os.path.join(self.temp_dir, f"{i}.mp4"), fps=30, logger=render_progress.frame_logger()
+                )
+        self.assertIsNone(render_progress.frame_logger())
+
+        task = sm.state.get_task(self.task_id)
+        self.assertEqual(task["render_progress"]["frames"], 120)
+        self.assertEqual(task["render_progress"]["total_frames"], 150)
+        self.assertGreater(task["render_progress"]["fps"], 0)
+        self.assertIsNotNone(task["render_progress"]["eta"])
+        self.assertEqual(task["progress"], 90)
+
+    def test_frames_in_workers(self):
+        # bakes run in spawned worker processes and count into the same render
+        config.app["render_workers"] = 2
+        params = VideoParams(video_subject="test", video_aspect="1:1")
+        jobs = [
+            (
+                SegmentItem(
+                    segment_id=f"seg-{i}",
+                    order=i,
+                    duration=1.0,
+                    material=os.path.join(resources_dir, f"{i}.png.mp4"),
+                    start=0.0,
+                    end=1.0,
+                ),
+                params,
+                os.path.join(self.temp_dir, f"seg-{i}.mp4"),
+            )
+            for i in (1, 2)
+        ]
+        with render_progress.tracking(self.task_id, 60):
+            self.assertTrue(all(vd._bake_segments(jobs)))
+
+        task = sm.state.get_task(self.task_id)
+        self.assertEqual(task["render_progress"]["frames"], 60)
+        self.assertEqual(task["render_progress"]["eta"], 0)
+        self.assertEqual(task["progress"], 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
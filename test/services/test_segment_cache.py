@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.config import config
+from app.models.schema import SegmentItem, VideoParams
+from app.services import segment_cache
+from app.utils import utils
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
+
+class TestSegmentCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = utils.storage_dir("temp/test_segment_cache", create=True)
+        self._saved = {k: config.app.get(k) for k in ("segment_cache_dir", "segment_cache_max_size_mb")}
+        config.app["segment_cache_dir"] = self.cache_dir
+        self.params = VideoParams(video_subject="test", video_aspect="9:16")
+        self.segment = SegmentItem(
+            segment_id="seg-1",
+            order=1,
+            duration=2.0,
+            material=os.path.join(resources_dir, "1.png.mp4"),
+            start=0.0,
+            end=2.0,
+        )
+
+    def tearDown(self):
+        for k, v in self._saved.items():
+            if v is None:
+                config.app.pop(k, None)
+            else:
+                config.app[k] = v
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_segment_key(self):
+        key = segment_cache.segment_key(self.segment, self.params)
+        # timeline position does not affect the baked clip
+        moved = self.segment.model_copy(update={"segment_id": "seg-9", "order": 9})
+        self.assertEqual(key, segment_cache.segment_key(moved, self.params))
+
+        faster = self.segment.model_copy(update={"speed": 1.2})
+        self.assertNotEqual(key, segment_cache.segment_key(faster, self.params))
+
+        landscape = self.params.model_copy(update={"video_aspect": "16:9"})
+        self.assertNotEqual(key, segment_cache.segment_key(self.segment, landscape))
+
+    def test_evict(self):
+        config.app["segment_cache_max_size_mb"] = 2 / 1024  # 2 KB
+        for i, key in enumerate(["a", "b", "c"]):
+            with open(segment_cache.path_for(key), "wb") as f:
+                f.write(b"0" * 1024)
+            os.utime(segment_cache.path_for(key), (1000 + i, 1000 + i))
+
+        segment_cache.evict(keep=["a"])
+        # "b" is the least recently used clip that is not in use
+        self.assertTrue(segment_cache.lookup("a"))
+        self.assertFalse(segment_cache.lookup("b"))
+        self.assertTrue(segment_cache.lookup("c"))
+
+    def test_pinned(self):
+        config.app["segment_cache_max_size_mb"] = 0.5 / 1024  # 512 bytes
+        for i, key in enumerate(["a", "b"]):
+            with open(segment_cache.path_for(key), "wb") as f:
+                f.write(b"0" * 1024)
+            os.utime(segment_cache.path_for(key), (1000 + i, 1000 + i))
+
+        # a clip pinned by another render survives eviction until it is unpinned
+        with segment_cache.pinned(["a"]):
+            segment_cache.evict()
+            self.assertTrue(segment_cache.lookup("a"))
+            self.assertFalse(segment_cache.lookup("b"))
+        segment_cache.evict()
+        self.assertFalse(segment_cache.lookup("a"))
+
+    def test_temp_path(self):
+        # concurrent bakes of the same key write separate files
+        self.assertNotEqual(segment_cache.temp_path("a"), segment_cache.temp_path("a"))
+        self.assertTrue(segment_cache.temp_path("a").endswith(".tmp.mp4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.services import subtitle_cache
+
+
+class TestSubtitleCache(unittest.TestCase):
+    def setUp(self):
+        self.key = subtitle_cache.sprite_key(text="test-subtitle-cache", font_size=60)
+        self.file_path = os.path.join(subtitle_cache.cache_dir(), f"{self.key}.png")
+        self.calls = 0
+
+    def tearDown(self):
+        subtitle_cache._memory.pop(self.key, None)
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def render(self):
+        self.calls += 1
+        sprite = np.zeros((20, 40, 4), dtype="uint8")
+        sprite[5:15, 10:30] = (255, 255, 255, 255)
+        return sprite
+
+    def test_sprite_key(self):
+        self.assertEqual(self.key, subtitle_cache.sprite_key(font_size=60, text="test-subtitle-cache"))
+        self.assertNotEqual(self.key, subtitle_cache.sprite_key(text="test-subtitle-cache", font_size=61))
+
+    def test_get_sprite(self):
+        sprite = subtitle_cache.get_sprite(self.key, self.render)
+        self.assertEqual(sprite.shape, (20, 40, 4))
+        self.assertTrue(os.path.exists(self.file_path))
+
+        # served from memory
+        subtitle_cache.get_sprite(self.key, self.render)
+        self.assertEqual(self.calls, 1)
+
+        # served from disk after the memory cache is dropped
+        subtitle_cache._memory.pop(self.key, None)
+        cached = subtitle_cache.get_sprite(self.key, self.render)
+        self.assertEqual(self.calls, 1)
+        np.testing.assert_array_equal(cached, sprite)
+
+    def test_get_sprite_concurrent(self):
+        # two renders rasterize the same line at once
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            sprites = list(pool.map(lambda _: subtitle_cache.get_sprite(self.key, self.render), range(2)))
+        subtitle_cache._memory.pop(self.key, None)
+        cached = subtitle_cache.get_sprite(self.key, self.render)
+        np.testing.assert_array_equal(cached, sprites[0])
+        self.assertFalse([f for f in os.listdir(subtitle_cache.cache_dir()) if f.startswith(self.key) and ".tmp" in f])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import os
+import shutil
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.models.schema import SegmentItem
+from app.services import thumbnails
+from app.utils import utils
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
+
+
+class TestThumbnailsService(unittest.TestCase):
+    def setUp(self):
+        self.task_id = "test-thumbnails"
+        video_file = os.path.join(resources_dir, "1.png.mp4")
+        image_file = os.path.join(resources_dir, "2.png")
+        self.segments = [
+            SegmentItem(segment_id="s1", order=1, duration=1.0, material=video_file, start=0.0, end=1.0),
+            SegmentItem(segment_id="s2", order=2, duration=1.0, material=image_file, start=0.0, end=1.0),
+            SegmentItem(segment_id="s3", order=3, duration=1.0, material=video_file, start=2.0, end=3.0),
+            SegmentItem(segment_id="s4", order=4, duration=1.0, material="/missing.mp4", start=0.0, end=1.0),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(utils.task_dir(self.task_id), ignore_errors=True)
+
+    def test_generate_thumbnails(self):
+        readers = []
+        reader_class = thumbnails.FFMPEG_VideoReader
+
+        def counting_reader(*args, **kwargs):
+            readers.append(args[0])
+            return reader_class(*args, **kwargs)
+
+        thumbnails.FFMPEG_VideoReader = counting_reader
+        try:
+            thumbs = thumbnails.generate_thumbnails(self.task_id, self.segments)
+        finally:
+            thumbnails.FFMPEG_VideoReader = reader_class
+
+        self.assertEqual(sorted(thumbs), ["s1", "s2", "s3", "s4"])
+        # both segments of the shared video are read by one reader
+        self.assertEqual(len(readers), 1)
+        with Image.open(thumbs["s4"]) as img:
+            self.assertEqual(img.size, (640, 360))
+
+    def test_build_sprite_sheet(self):
+        thumbs = thumbnails.generate_thumbnails(self.task_id, self.segments)
+        index = thumbnails.build_sprite_sheet(self.task_id, self.segments, thumbs)
+        self.assertEqual(index["columns"], 4)
+        self.assertEqual([s["segment_id"] for s in index["segments"]], ["s1", "s2", "s3", "s4"])
+        self.assertEqual(index["segments"][2]["start"], 2.0)
+        self.assertEqual(index["segments"][1]["x"], index["tile_width"])
+
+        sprite_file = os.path.join(thumbnails.thumbs_dir(self.task_id), index["sprite"])
+        with Image.open(sprite_file) as img:
+            self.assertEqual(img.size, (index["width"], index["height"]))
+
+        # unchanged segments reuse the sheet
+        mtime = os.stat(sprite_file).st_mtime_ns
+        self.assertEqual(thumbnails.build_sprite_sheet(self.task_id, self.segments, thumbs), index)
+        self.assertEqual(os.stat(sprite_file).st_mtime_ns, mtime)
+
+
+if __name__ == "__main__":
+    unittest.main()
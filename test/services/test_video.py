@@ -1,15 +1,20 @@
 
 import unittest
 import os
+import shutil
 import sys
 from pathlib import Path
+from loguru import logger
 from moviepy import (
     VideoFileClip,
 )
 # add project root to python path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from app.models.schema import MaterialInfo
+from app.config import config
+from app.models.schema import MaterialInfo, SegmentItem, VideoParams
+from app.services import subtitle_ass
 from app.services import video as vd
+from app.services.utils import ffmpeg_utils
 from app.utils import utils
 
 resources_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources")
@@ -81,5 +86,285 @@ class TestVideoService(unittest.TestCase):
         except Exception as e:
             self.fail(f"test wrap_text failed: {str(e)}")
 
+    def test_bake_segments_parallel(self):
+        saved = config.app.get("render_workers")
+        config.app["render_workers"] = 2
+        output_dir = utils.storage_dir("temp/test_bake_parallel", create=True)
+        params = VideoParams(video_subject="test", video_aspect="1:1")
+        materials = [f"{i}.png.mp4" for i in (1, 2, 3)] + ["missing.mp4"]
+        jobs = [
+            (
+                SegmentItem(
+                    segment_id=f"seg-{i}",
+                    order=i,
+                    duration=float(i),
+                    material=os.path.join(resources_dir, material),
+                    start=0.0,
+                    end=float(i),
+                    speed=0.9,
+                ),
+                params,
+                os.path.join(output_dir, f"seg-{i}.mp4"),
+            )
+            for i, material in enumerate(materials, start=1)
+        ]
+        errors = []
+        sink = logger.add(lambda message: errors.append(str(message)), level="ERROR")
+        try:
+            results = vd._bake_segments(jobs)
+            # in segment order whatever order the workers finished in
+            self.assertEqual(results[:3], [job[2] for job in jobs[:3]])
+            for result, job in zip(results[:3], jobs):
+                clip = VideoFileClip(result)
+                self.assertAlmostEqual(clip.duration, job[0].duration, delta=0.1)
+                vd.close_clip(clip)
+            # the failed segment keeps its place and is reported by id
+            self.assertEqual(results[3], "")
+            self.assertTrue(any("seg-4" in e for e in errors))
+        finally:
+            logger.remove(sink)
+            if saved is None:
+                config.app.pop("render_workers", None)
+            else:
+                config.app["render_workers"] = saved
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_concat_clip_files_reencode(self):
+        # a clip of another size, fps and with audio rules out stream copy
+        output_dir = utils.storage_dir("temp/test_concat_reencode", create=True)
+        other = os.path.join(output_dir, "other.mp4")
+        ffmpeg_utils.run_ffmpeg(
+            [
+                "-f", "lavfi", "-i", "testsrc=size=320x240:rate=25:duration=1",
+                "-f", "lavfi", "-i", "sine=frequency=440:duration=1",
+                "-c:v", "libx264", "-c:a", "aac", "-shortest", other,
+            ]
+        )
+        clip_path = os.path.join(resources_dir, "2.png.mp4")
+        output_file = os.path.join(output_dir, "concat.mp4")
+        try:
+            result = vd.concat_clip_files([clip_path, other], output_file)
+            self.assertEqual(result, output_file)
+
+            clip = VideoFileClip(output_file)
+            self.assertAlmostEqual(clip.duration, 4.0, delta=0.2)
+            # fitted to the first clip, rounded down to even for yuv420p
+            self.assertEqual(tuple(clip.size), (580, 750))
+            self.assertIsNotNone(clip.audio)
+            vd.close_clip(clip)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_concat_clip_files(self):
+        clip_path = os.path.join(resources_dir, "2.png.mp4")
+        output_file = os.path.join(utils.storage_dir("temp", create=True), "test-concat.mp4")
+        try:
+            result = vd.concat_clip_files([clip_path] * 3, output_file)
+            self.assertEqual(result, output_file)
+
+            clip = VideoFileClip(output_file)
+            source = VideoFileClip(clip_path)
+            self.assertAlmostEqual(clip.duration, source.duration * 3, delta=0.2)
+            self.assertEqual(tuple(clip.size), tuple(source.size))
+            vd.close_clip(clip)
+            vd.close_clip(source)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def test_combine_video_variants(self):
+        output_dir = utils.storage_dir("temp/test_combine_variants", create=True)
+        audio_file = os.path.join(output_dir, "audio.mp3")
+        ffmpeg_utils.run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono", "-t", "4", audio_file])
+        video_paths = [os.path.join(resources_dir, f"{i}.png.mp4") for i in (1, 2, 3)]
+        combined = [os.path.join(output_dir, f"combined-{i}.mp4") for i in (1, 2, 3)]
+        try:
+            result = vd.combine_video_variants(
+                combined, video_paths, audio_file, video_aspect="9:16", max_clip_duration=2
+            )
+            self.assertEqual(result, combined)
+            for file in combined:
+                clip = VideoFileClip(file)
+                self.assertGreaterEqual(clip.duration, 3.9)
+                self.assertEqual(tuple(clip.size), (1080, 1920))
+                vd.close_clip(clip)
+            # shared sub clips are removed once every variant is assembled
+            self.assertFalse([f for f in os.listdir(output_dir) if f.startswith("temp-clip-")])
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_resize_to_aspect(self):
+        # 580x751 source on a 1080x1920 canvas
+        clip = VideoFileClip(os.path.join(resources_dir, "2.png.mp4"))
+        try:
+            contain = vd._resize_to_aspect(clip, 1080, 1920, "contain")
+            frame = contain.get_frame(0)
+            self.assertEqual(frame.shape, (1920, 1080, 3))
+            # letterboxed top and bottom
+            self.assertEqual(frame[0].max(), 0)
+            self.assertEqual(frame[-1].max(), 0)
+
+            cover = vd._resize_to_aspect(clip, 1080, 1920, "cover")
+            frame = cover.get_frame(0)
+            self.assertEqual(frame.shape, (1920, 1080, 3))
+            # the white page fills the whole canvas
+            self.assertGreater(frame[0].min(), 200)
+
+            center = vd._resize_to_aspect(clip, 1080, 1920, "center")
+            self.assertEqual(center.get_frame(0).shape, (1920, 1080, 3))
+            self.assertEqual(vd._fit_geometry(580, 751, 1080, 1920, "center")[1], (580, 751))
+        finally:
+            vd.close_clip(clip)
+
+    def _write_srt(self, file_path, items):
+        with open(file_path, "w", encoding="utf-8") as f:
+            lines = [utils.text_to_srt(i + 1, text, t0, t1) for i, (t0, t1, text) in enumerate(items)]
+            f.write("\n".join(lines) + "\n")
+
+    def test_subtitle_events(self):
+        task_id = "test-subtitle-events"
+        task_dir = utils.task_dir(task_id)
+        try:
+            subtitle_path = os.path.join(task_dir, "subtitle.srt")
+            self._write_srt(subtitle_path, [(0.0, 1.0, "one"), (2.0, 3.0, "two"), (4.0, 5.0, "three")])
+            override_dir = os.path.join(task_dir, "sub_overrides", "seg-3")
+            os.makedirs(override_dir, exist_ok=True)
+            self._write_srt(os.path.join(override_dir, "applied.srt"), [(0.5, 1.5, "override")])
+
+            params = VideoParams(video_subject="test", subtitle_offset=0.0)
+            segments = [
+                SegmentItem(segment_id="seg-1", order=1, duration=2.0, material="", start=0.0, end=2.0, subtitle_offset=0.5, font_size=80),
+                SegmentItem(segment_id="seg-2", order=2, duration=2.0, material="", start=0.0, end=2.0, subtitle_enabled=False),
+                SegmentItem(segment_id="seg-3", order=3, duration=2.0, material="", start=0.0, end=2.0),
+            ]
+            events = vd.subtitle_events(subtitle_path, params, segments=segments, task_id=task_id, duration=6.0)
+            self.assertEqual([e[1] for e in events], ["one", "override"])
+            self.assertAlmostEqual(events[0][0][0], 0.5)
+            self.assertEqual(events[0][2]["font_size"], 80)
+            self.assertAlmostEqual(events[1][0][0], 4.5)
+        finally:
+            shutil.rmtree(task_dir, ignore_errors=True)
+
+    def test_ass_text(self):
+        # a backslash is drawn as it is and never starts an override or a line break
+        self.assertEqual(subtitle_ass._ass_text("C:\\dir {x}"), "C:\\\u2060dir \\{x\\}")
+        self.assertEqual(subtitle_ass._ass_text("a\\Nb\nc"), "a\\\u2060Nb\\Nc")
+
+    def test_write_subtitle_ass(self):
+        params = VideoParams(video_subject="test", video_aspect="9:16", subtitle_position="top")
+        events = [((0.0, 1.5), "hello {world}", None), ((1.5, 3.0), "bottom", {"subtitle_position": "bottom"})]
+        output_file = os.path.join(utils.storage_dir("temp", create=True), "test-subtitle.ass")
+        try:
+            self.assertEqual(vd.write_subtitle_ass(events, params, output_file), output_file)
+            with open(output_file, encoding="utf-8") as f:
+                content = f.read()
+            self.assertIn("PlayResX: 1080", content)
+            self.assertIn("PlayResY: 1920", content)
+            self.assertIn("Dialogue: 0,0:00:00.00,0:00:01.50,S0,,0,0,0,,hello \\{world\\}", content)
+            self.assertIn(",S1,", content)
+        finally:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def test_generate_video_chunked(self):
+        output_dir = utils.storage_dir("temp/test_chunked", create=True)
+        video_file = os.path.join(output_dir, "combined.mp4")
+        audio_file = os.path.join(output_dir, "audio.mp3")
+        ffmpeg_utils.run_ffmpeg(
+            ["-f", "lavfi", "-i", "testsrc2=s=1080x1920:r=30", "-t", "3", "-c:v", "libx264", "-preset", "ultrafast", video_file]
+        )
+        ffmpeg_utils.run_ffmpeg(["-f", "lavfi", "-i", "sine=f=440:r=44100", "-t", "3", audio_file])
+        params = VideoParams(video_subject="test", video_aspect="9:16", subtitle_enabled=False, bgm_type="")
+        output_file = os.path.join(output_dir, "final.mp4")
+        try:
+            vd._generate_video_chunked(video_file, audio_file, output_file, params, [], "", 3.0, 2)
+            clip = VideoFileClip(output_file)
+            self.assertEqual(clip.n_frames, 90)
+            self.assertAlmostEqual(clip.audio.duration, 3.0, delta=0.1)
+            vd.close_clip(clip)
+            # temporary chunks and the audio mix are removed
+            self.assertEqual(sorted(os.listdir(output_dir)), ["audio.mp3", "combined.mp4", "final.mp4"])
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        events = [((0.0, 1.0), "a", None), ((1.5, 2.5), "b", None), ((3.0, 4.0), "c", None)]
+        self.assertEqual(vd._chunk_events(events, 2.0, 4.0), [((0.0, 0.5), "b", None), ((1.0, 2.0), "c", None)])
+
+    def test_slice_windows(self):
+        self.assertEqual(vd._slice_windows(12.0, 5), [(0.0, 5.0), (5.0, 10.0), (10.0, 12.0)])
+        # ends snap back to keyframes within the tolerance, never past the nominal end
+        keyframes = [0.0, 2.0, 4.0, 6.0, 8.0, 10.0]
+        self.assertEqual(vd._slice_windows(12.0, 5, keyframes), [(0.0, 4.0), (4.0, 8.0), (8.0, 12.0)])
+        self.assertEqual(vd._slice_windows(12.0, 5, [0.0, 3.0, 9.0]), [(0.0, 5.0), (5.0, 9.0), (9.0, 12.0)])
+
+    def test_passthrough_cut(self):
+        output_dir = utils.storage_dir("temp/test_passthrough", create=True)
+        material = os.path.join(output_dir, "source.mp4")
+        # already 1080x1920 at 30fps, one keyframe per second
+        ffmpeg_utils.run_ffmpeg(
+            ["-f", "lavfi", "-i", "testsrc2=s=1080x1920:r=30", "-t", "4", "-g", "30", "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", material]
+        )
+        params = VideoParams(video_subject="test", video_aspect="9:16")
+        clip_file = os.path.join(output_dir, "clip.mp4")
+        try:
+            s = SegmentItem(segment_id="seg-1", order=1, duration=2.0, material=material, start=1.0, end=3.0)
+            self.assertEqual(vd._passthrough_cut(s, params, clip_file), clip_file)
+            clip = VideoFileClip(clip_file)
+            self.assertEqual(clip.n_frames, 60)
+            vd.close_clip(clip)
+
+            # off-keyframe cuts, speed changes and transitions are baked
+            s.start, s.end = 1.5, 3.5
+            self.assertEqual(vd._passthrough_cut(s, params, clip_file), "")
+            s.start, s.end, s.speed = 1.0, 3.0, 1.2
+            self.assertEqual(vd._passthrough_cut(s, params, clip_file), "")
+            s.speed, s.transition = 1.0, "FadeIn"
+            self.assertEqual(vd._passthrough_cut(s, params, clip_file), "")
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_render_from_segments_stages(self):
+        task_id = "test-render-stages"
+        task_dir = utils.task_dir(task_id)
+        audio_file = os.path.join(task_dir, "audio.mp3")
+        ffmpeg_utils.run_ffmpeg(["-f", "lavfi", "-i", "anullsrc=r=44100:cl=mono", "-t", "2", audio_file])
+        # own sources: test_preprocess_video removes test/resources/1.png.mp4
+        materials = [os.path.join(task_dir, f"source-{i}.mp4") for i in (1, 2)]
+        for i, material in enumerate(materials):
+            ffmpeg_utils.run_ffmpeg(
+                ["-f", "lavfi", "-i", f"testsrc=s=540x960:r=30:d=3,hue=h={i * 90}", "-c:v", "libx264", "-preset", "ultrafast", material]
+            )
+        segments = [
+            SegmentItem(segment_id=f"seg-{i}", order=i, duration=1.0, material=material, start=0.0, end=1.0)
+            for i, material in enumerate(materials, start=1)
+        ]
+        params = VideoParams(video_subject="test", video_aspect="9:16", subtitle_enabled=False, bgm_type="")
+        try:
+            combined, final = vd.render_from_segments(task_id, segments, params, audio_file)
+            # every segment was baked into the combined video
+            clip = VideoFileClip(combined)
+            self.assertAlmostEqual(clip.duration, 2.0, delta=0.1)
+            vd.close_clip(clip)
+            combined_mtime = os.stat(combined).st_mtime_ns
+            final_mtime = os.stat(final).st_mtime_ns
+
+            # unchanged inputs reuse both stages
+            vd.render_from_segments(task_id, segments, params, audio_file)
+            self.assertEqual(os.stat(final).st_mtime_ns, final_mtime)
+
+            # an audio-only change redoes the final mux on the same combined video
+            params.voice_volume = 0.5
+            vd.render_from_segments(task_id, segments, params, audio_file)
+            self.assertEqual(os.stat(combined).st_mtime_ns, combined_mtime)
+            self.assertNotEqual(os.stat(final).st_mtime_ns, final_mtime)
+
+            # a segment change rebuilds the combined video
+            segments[1].end = 1.5
+            vd.render_from_segments(task_id, segments, params, audio_file)
+            self.assertNotEqual(os.stat(combined).st_mtime_ns, combined_mtime)
+        finally:
+            shutil.rmtree(task_dir, ignore_errors=True)
+
+
 if __name__ == "__main__":
     unittest.main() 
\ No newline at end of file
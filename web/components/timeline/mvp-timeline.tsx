@@ -505,10 +505,22 @@ export default function MvpTimeline({ taskId, initialSegments, audioDuration = 0
     { label: '居中（center）', value: 'center' },
   ], [])
 
-  // prewarm: ensure thumbs are generated server-side, then images can load via static path
+  // prewarm: generate thumbs server-side and load the timeline sprite sheet (one image for all chips)
+  const [sprite, setSprite] = useState<SpriteIndex | null>(null)
+  const segmentIdsKey = useMemo(() => segments.map(s => s.segment_id).join(','), [segments])
   useEffect(() => {
-    fetch(`${API_BASE}/v1/tasks/${taskId}/segments/thumbs`).catch(() => {})
-  }, [taskId])
+    let cancelled = false
+    fetch(`${API_BASE}/v1/tasks/${taskId}/segments/sprite`)
+      .then(r => (r.ok ? r.json() : null))
+      .then(res => { if (!cancelled && res?.data?.url) setSprite(res.data as SpriteIndex) })
+      .catch(() => {})
+    return () => { cancelled = true }
+  }, [taskId, segmentIdsKey])
+  const spriteTiles = useMemo(() => {
+    const m = new Map<string, SpriteTile>()
+    sprite?.segments?.forEach(t => m.set(t.segment_id, t))
+    return m
+  }, [sprite])
 
   // load & persist timeline scale locally
   useEffect(() => {
@@ -770,6 +782,8 @@ export default function MvpTimeline({ taskId, initialSegments, audioDuration = 0
                       widthPx={widthPx}
                       thumbUrl={thumbUrl}
                       fallbackThumbUrl={fallbackThumbUrl}
+                      sprite={sprite}
+                      spriteTile={spriteTiles.get(s.segment_id)}
                       label={(s.order ?? 0) + '. ' + (s.scene_title || '未命名')}
                       selected={selectedSet.has(s.segment_id)}
                       disabled={renderMode !== null || disabledExternally}
@@ -1064,7 +1078,10 @@ export default function MvpTimeline({ taskId, initialSegments, audioDuration = 0
   )
 }
 
-function SortableChip({ id, label, segment, widthPx, thumbUrl, fallbackThumbUrl, selected, disabled, scale, onTrim, onClick }: { id: string, label: string, segment: SegmentItem, widthPx: number, thumbUrl: string, fallbackThumbUrl?: string, selected: boolean, disabled?: boolean, scale: number, onTrim?: (deltaSec: number, side: 'left'|'right', baseStart: number, baseEnd: number) => void, onClick?: (e: React.MouseEvent) => void }) {
+type SpriteTile = { segment_id: string, x: number, y: number, w: number, h: number, start: number, duration: number }
+type SpriteIndex = { key: string, url: string, width: number, height: number, tile_width: number, tile_height: number, segments: SpriteTile[] }
+
+function SortableChip({ id, label, segment, widthPx, thumbUrl, fallbackThumbUrl, sprite, spriteTile, selected, disabled, scale, onTrim, onClick }: { id: string, label: string, segment: SegmentItem, widthPx: number, thumbUrl: string, fallbackThumbUrl?: string, sprite?: SpriteIndex | null, spriteTile?: SpriteTile, selected: boolean, disabled?: boolean, scale: number, onTrim?: (deltaSec: number, side: 'left'|'right', baseStart: number, baseEnd: number) => void, onClick?: (e: React.MouseEvent) => void }) {
   const { setNodeRef, attributes, listeners, transform, transition, isDragging } = useSortable({ id, disabled })
   const style = {
     transform: CSS.Transform.toString(transform),
@@ -1130,6 +1147,18 @@ function SortableChip({ id, label, segment, widthPx, thumbUrl, fallbackThumbUrl,
       )}
       <div className="truncate font-medium">{label}</div>
       <div className="mt-1 h-[64px] w-full overflow-hidden rounded bg-muted">
+        {sprite && spriteTile ? (
+          // tile from the shared sprite sheet, scaled to the 64px chip height
+          <div
+            className="mx-auto h-[64px]"
+            style={{
+              width: Math.round(spriteTile.w * 64 / spriteTile.h),
+              backgroundImage: `url(${sprite.url}?v=${sprite.key})`,
+              backgroundSize: `${sprite.width * 64 / spriteTile.h}px ${sprite.height * 64 / spriteTile.h}px`,
+              backgroundPosition: `-${spriteTile.x * 64 / spriteTile.h}px -${spriteTile.y * 64 / spriteTile.h}px`,
+            }}
+          />
+        ) : (
         <img
           src={thumbUrl}
           alt="thumb"
@@ -1144,6 +1173,7 @@ function SortableChip({ id, label, segment, widthPx, thumbUrl, fallbackThumbUrl,
             }
           }}
         />
+        )}
         {/* fallback placeholder when image fails */}
         <div className="flex h-[64px] w-full items-center justify-center text-xs text-muted-foreground">
           缩略图
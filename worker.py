@@ -0,0 +1,16 @@
+from loguru import logger
+
+from app.config import config
+from app.controllers.manager.redis_manager import RedisWorker, redis_url
+
+if __name__ == "__main__":
+    # render node of a worker fleet: set enable_redis and redis_worker_fleet on every
+    # API and worker node, and share ./storage between them
+    if not config.app.get("enable_redis", False):
+        logger.error("worker nodes need enable_redis = true, task state must be shared with the API")
+        raise SystemExit(1)
+    RedisWorker(
+        redis_url=redis_url(),
+        concurrency=config.app.get("max_concurrent_tasks", 5),
+        executor=config.app.get("task_executor", "thread"),
+    ).run()